@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Authenticated user resolved from the JWT claims and the user cache"""
+
+    id: int
+    phone: str
+    is_active: bool
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_model(cls, user) -> "CurrentUser":
+        return cls(id=int(user.id), phone=user.phone, is_active=bool(user.is_active), created_at=user.created_at)
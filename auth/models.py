@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String
 
 from database.db_connection import Base
 
@@ -16,6 +16,8 @@ class Users(Base):
 
 class OTP(Base):
     __tablename__ = "otp"
+    # Latest-OTP lookups per phone read a single index entry
+    __table_args__ = (Index("ix_otp_phone_id", "phone", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     phone = Column(String, index=True)
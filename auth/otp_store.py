@@ -0,0 +1,155 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.models import OTP
+from database.cache import get_async_redis_client
+from database.db_connection import session_scope
+
+# OTP storage configuration: "redis" (default) or "sql"
+OTP_STORE = os.getenv("OTP_STORE", "redis")
+OTP_TTL = int(os.getenv("OTP_TTL", "300"))
+# SQL backend retention: expired rows older than this are purged in batches
+OTP_RETENTION = int(os.getenv("OTP_RETENTION", "86400"))
+OTP_PURGE_BATCH = int(os.getenv("OTP_PURGE_BATCH", "1000"))
+OTP_PURGE_INTERVAL = int(os.getenv("OTP_PURGE_INTERVAL", "3600"))
+
+# Consume the OTP only when it matches, so a wrong guess does not burn it
+_VERIFY_AND_CONSUME = """
+local stored = redis.call('GET', KEYS[1])
+if not stored then
+    return 0
+end
+if stored ~= ARGV[1] then
+    return -1
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+
+def get_cache_key_otp(phone: str) -> str:
+    """Generate key holding the current OTP for a phone number"""
+    return f"otp:{phone}"
+
+
+class RedisOTPStore:
+    """
+    One key per phone with native expiry; sending a new OTP replaces the old
+    one and verification consumes it atomically
+    """
+
+    def __init__(self):
+        self._script = None
+
+    async def save(self, db: AsyncSession, phone: str, otp: str):
+        await get_async_redis_client().set(get_cache_key_otp(phone), otp, ex=OTP_TTL)
+
+    async def verify(self, db: AsyncSession, phone: str, otp: str):
+        if self._script is None:
+            self._script = get_async_redis_client().register_script(_VERIFY_AND_CONSUME)
+        result = await self._script(keys=[get_cache_key_otp(phone)], args=[str(otp)])
+        if result == 0:
+            raise ValueError("No OTP found for this phone number")
+        if result == -1:
+            raise ValueError("Invalid OTP")
+
+
+class SQLOTPStore:
+    """
+    OTP rows in the ``otp`` table; only the latest row per phone is read
+    (through the (phone, id) index) and expired rows are purged by
+    ``purge_expired_otps``
+    """
+
+    async def save(self, db: AsyncSession, phone: str, otp: str):
+        created_at = datetime.now()
+        db.add(OTP(phone=phone, otp=otp, created_at=created_at, expired_at=created_at + timedelta(seconds=OTP_TTL)))
+        await db.commit()
+
+    async def verify(self, db: AsyncSession, phone: str, otp: str):
+        # Get the latest OTP for the phone number (descending order by id)
+        latest_otp = await db.scalar(select(OTP).where(OTP.phone == phone).order_by(OTP.id.desc()).limit(1))
+
+        if not latest_otp:
+            raise ValueError("No OTP found for this phone number")
+
+        # Check if OTP has expired
+        now = datetime.now()
+        if latest_otp.expired_at and now > latest_otp.expired_at:
+            raise ValueError("OTP has expired")
+
+        # Verify OTP
+        if str(latest_otp.otp) != str(otp):
+            raise ValueError("Invalid OTP")
+
+        # Invalidate OTP by moving expired_at into the past; the condition makes
+        # concurrent verifications of the same OTP succeed only once
+        result = await db.execute(
+            update(OTP)
+            .where(OTP.id == latest_otp.id, OTP.expired_at > now)
+            .values(expired_at=now - timedelta(minutes=5))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if not result.rowcount:
+            raise ValueError("OTP has expired")
+
+
+async def purge_expired_otps(batch_size: int = OTP_PURGE_BATCH, retention: int = OTP_RETENTION) -> int:
+    """
+    Delete OTP rows that expired more than ``retention`` seconds ago, in
+    batches of ``batch_size`` so no single transaction locks much of the table.
+    Returns the number of rows deleted.
+    """
+    cutoff = datetime.now() - timedelta(seconds=retention)
+    deleted = 0
+    while True:
+        async with session_scope() as db:
+            ids = list(await db.scalars(select(OTP.id).where(OTP.expired_at < cutoff).limit(batch_size)))
+            if not ids:
+                break
+            await db.execute(delete(OTP).where(OTP.id.in_(ids)).execution_options(synchronize_session=False))
+            await db.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+        # Let other work use the database between batches
+        await asyncio.sleep(0)
+    return deleted
+
+
+class OTPRetentionJob:
+    """Runs ``purge_expired_otps`` every OTP_PURGE_INTERVAL seconds"""
+
+    def __init__(self, interval: int = OTP_PURGE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            try:
+                deleted = await purge_expired_otps()
+                if deleted:
+                    print(f"Purged {deleted} expired OTP rows")
+            except Exception as e:
+                print(f"Warning: Failed to purge expired OTPs: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="otp-retention")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+otp_store = SQLOTPStore() if OTP_STORE == "sql" else RedisOTPStore()
+otp_retention_job = OTPRetentionJob()
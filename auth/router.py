@@ -1,21 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth import schemas, services
-from auth.models import Users
+from auth.identity import CurrentUser
 from database.db_connection import get_db
-from middleware.dependencies import get_current_user
+from middleware.dependencies import get_current_user, security
+from middleware.rate_limit import RATE_LIMIT_OTP, RateLimit
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
+otp_rate_limit = RateLimit("otp", per_caller=RATE_LIMIT_OTP)
+
 
 @router.post("/signup", response_model=schemas.Users)
-def signup(user: schemas.UsersCreate, db: Session = Depends(get_db)):
+async def signup(user: schemas.UsersCreate, db: AsyncSession = Depends(get_db)):
     """
     Register a new user with mobile number and optional information
     """
     try:
-        db_user = services.create_user(db=db, user=user)
+        db_user = await services.create_user(db=db, user=user)
         return db_user
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -23,13 +27,13 @@ def signup(user: schemas.UsersCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@router.post("/send-otp", response_model=schemas.OTPResponse)
-def send_otp(otp_request: schemas.OTPRequest, db: Session = Depends(get_db)):
+@router.post("/send-otp", response_model=schemas.OTPResponse, dependencies=[Depends(otp_rate_limit)])
+async def send_otp(otp_request: schemas.OTPRequest, db: AsyncSession = Depends(get_db)):
     """
     Send OTP to user's mobile number (mocked, returned in response)
     """
     try:
-        result = services.send_otp(db=db, phone=otp_request.phone)
+        result = await services.send_otp(db=db, phone=otp_request.phone)
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -37,13 +41,13 @@ def send_otp(otp_request: schemas.OTPRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@router.post("/forgot-password", response_model=schemas.OTPResponse)
-def forgot_password(forgot_request: schemas.ForgotPasswordRequest, db: Session = Depends(get_db)):
+@router.post("/forgot-password", response_model=schemas.OTPResponse, dependencies=[Depends(otp_rate_limit)])
+async def forgot_password(forgot_request: schemas.ForgotPasswordRequest, db: AsyncSession = Depends(get_db)):
     """
     Send OTP for password reset. First checks if user exists, then generates and stores OTP.
     """
     try:
-        result = services.send_otp(db=db, phone=forgot_request.phone)
+        result = await services.send_otp(db=db, phone=forgot_request.phone)
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -51,13 +55,13 @@ def forgot_password(forgot_request: schemas.ForgotPasswordRequest, db: Session =
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@router.post("/verify-otp", response_model=schemas.JWTTokenResponse)
-def verify_otp(otp_verify_request: schemas.OTPVerifyRequest, db: Session = Depends(get_db)):
+@router.post("/verify-otp", response_model=schemas.JWTTokenResponse, dependencies=[Depends(otp_rate_limit)])
+async def verify_otp(otp_verify_request: schemas.OTPVerifyRequest, db: AsyncSession = Depends(get_db)):
     """
     Verify OTP and return JWT token for session
     """
     try:
-        result = services.verify_otp(db=db, phone=otp_verify_request.phone, otp=otp_verify_request.otp)
+        result = await services.verify_otp(db=db, phone=otp_verify_request.phone, otp=otp_verify_request.otp)
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -66,15 +70,16 @@ def verify_otp(otp_verify_request: schemas.OTPVerifyRequest, db: Session = Depen
 
 
 @router.post("/change-password", response_model=schemas.ChangePasswordResponse)
-def change_password(
-    current_user: Users = Depends(get_current_user),
-    db: Session = Depends(get_db),
+async def change_password(
+    current_user: CurrentUser = Depends(get_current_user),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Change password by generating new access token for authenticated user
     """
     try:
-        result = services.change_password(db=db, user=current_user)
+        result = await services.change_password(db=db, user=current_user, token=credentials.credentials)
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -86,11 +91,8 @@ user_router = APIRouter()
 
 
 @user_router.get("/user/me", response_model=schemas.Users)
-def read_current_user(current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+async def read_current_user(current_user: CurrentUser = Depends(get_current_user)):
     """
     Get details about the currently authenticated user.
     """
-    user = db.query(Users).filter(Users.phone == current_user["phone"]).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return current_user
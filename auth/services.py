@@ -1,13 +1,19 @@
 import os
 import random
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 
 import jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from auth.models import OTP, Users
+from auth.identity import CurrentUser
+from auth.models import Users
+from auth.otp_store import otp_store
 from auth.schemas import UsersCreate
+from auth.token_cache import is_token_revoked, revoke_token, token_cache, token_digest
+from auth.user_cache import invalidate_user
 
 # JWT Configuration (in production, these should be in environment variables)
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -15,12 +21,12 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
 
 
-def create_user(db: Session, user: UsersCreate):
+async def create_user(db: AsyncSession, user: UsersCreate):
     """
     Create a new user with the provided information
     """
     # Check if user with this phone number already exists
-    existing_user = db.query(Users).filter(Users.phone == user.phone).first()
+    existing_user = await db.scalar(select(Users).where(Users.phone == user.phone).limit(1))
     if existing_user:
         raise ValueError("User with this phone number already exists")
 
@@ -28,62 +34,37 @@ def create_user(db: Session, user: UsersCreate):
     db_user = Users(phone=user.phone)
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
 
     return db_user
 
 
-def send_otp(db: Session, phone: str):
+async def send_otp(db: AsyncSession, phone: str):
     """
     Send OTP to user's mobile number
     """
     # Check if user exists with this phone number
-    existing_user = db.query(Users).filter(Users.phone == phone).first()
+    existing_user = await db.scalar(select(Users).where(Users.phone == phone).limit(1))
     if not existing_user:
         raise ValueError("User with this phone number does not exist")
 
-    # Generate 4-digit OTP
+    # Generate 4-digit OTP, valid for OTP_TTL seconds (5 minutes by default)
     otp_code = str(random.randint(1000, 9999))
-
-    # Set expiration time (5 minutes from now)
-    created_at = datetime.now()
-    expired_at = created_at + timedelta(minutes=5)
-
-    # Create OTP record
-    db_otp = OTP(phone=phone, otp=otp_code, created_at=created_at, expired_at=expired_at)
-
-    db.add(db_otp)
-    db.commit()
-    db.refresh(db_otp)
+    await otp_store.save(db, phone, otp_code)
 
     return {"otp": otp_code, "message": "OTP sent successfully"}
 
 
-def verify_otp(db: Session, phone: str, otp: str):
+async def verify_otp(db: AsyncSession, phone: str, otp: str):
     """
     Verify OTP and return JWT token if valid
     """
-    # Get the latest OTP for the phone number (descending order by id)
-    latest_otp = db.query(OTP).filter(OTP.phone == phone).order_by(OTP.id.desc()).first()
-
-    if not latest_otp:
-        raise ValueError("No OTP found for this phone number")
-
-        # Check if OTP has expired
-    if latest_otp.expired_at and datetime.now() > latest_otp.expired_at:
-        raise ValueError("OTP has expired")
-
-    # Verify OTP
-    if str(latest_otp.otp) != str(otp):
-        raise ValueError("Invalid OTP")
-
-    # Invalidate OTP by setting expired_at to 5 minutes before current time
-    latest_otp.expired_at = datetime.now() - timedelta(minutes=5)
-    db.commit()
+    # Checks the latest OTP for the phone number and consumes it on success
+    await otp_store.verify(db, phone, otp)
 
     # Get user details
-    user = db.query(Users).filter(Users.phone == phone).first()
+    user = await db.scalar(select(Users).where(Users.phone == phone).limit(1))
     if not user:
         raise ValueError("User not found")
 
@@ -105,27 +86,43 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
     print("expire", expire)
 
-    to_encode.update({"exp": expire})
+    # jti keeps tokens issued for the same user within one second distinct, so
+    # revoking the old token on change_password never hits the new one
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def verify_token(token: str):
+async def verify_token(token: str):
     """
-    Verify JWT token and return payload
+    Verify JWT token and return payload. Tokens verified recently are served
+    from the token cache without decoding them again.
     """
+    digest = token_digest(token)
+    if token_cache.is_revoked(digest):
+        raise ValueError("Token has been revoked")
+
+    payload = token_cache.get(digest)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise ValueError("Token has expired")
     except jwt.InvalidTokenError:
         raise ValueError("Invalid token")
 
+    if await is_token_revoked(digest):
+        raise ValueError("Token has been revoked")
 
-def change_password(db: Session, user: Users):
+    token_cache.put(digest, payload)
+    return payload
+
+
+async def change_password(db: AsyncSession, user: CurrentUser, token: Optional[str] = None):
     """
-    Change password by generating new access token for user
+    Change password by generating new access token for user and revoking the old one
     """
     # Check if user is active
     if user.is_active is False:
@@ -134,4 +131,23 @@ def change_password(db: Session, user: Users):
     # Generate new JWT token
     access_token = create_access_token(data={"sub": str(user.id), "phone": user.phone})
 
+    # The token used for this request must stop working immediately
+    if token:
+        await revoke_token(token, await verify_token(token))
+
     return {"access_token": access_token, "token_type": "bearer", "message": "Password changed successfully"}
+
+
+async def deactivate_user(db: AsyncSession, user_id: int):
+    """
+    Deactivate a user and drop them from the user cache
+    """
+    user = await db.get(Users, user_id)
+    if not user:
+        raise ValueError("User not found")
+
+    user.is_active = False
+    await db.commit()
+    await invalidate_user(user_id)
+
+    return user
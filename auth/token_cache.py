@@ -0,0 +1,101 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from database.cache import AsyncCacheService
+
+# Verified token cache configuration
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Upper bound on how long a verified token is trusted without re-checking
+# revocation in Redis; entries never outlive the token's own exp
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def get_cache_key_revoked_token(digest: str) -> str:
+    """Generate cache key for a revoked token"""
+    return f"revoked_token:{digest}"
+
+
+class TokenCache:
+    """
+    Bounded, thread-safe LRU of verified token digests mapped to their payloads,
+    plus a set of revoked digests kept until the tokens would have expired.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._revoked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, digest: str, payload: dict):
+        expires_at = time.time() + self.ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        with self._lock:
+            self._entries[digest] = (expires_at, payload)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def revoke(self, digest: str, expires_at: float):
+        now = time.time()
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._revoked[digest] = expires_at
+            # Revoked digests are only needed until the token expires on its own
+            for key in [key for key, exp in self._revoked.items() if exp <= now]:
+                del self._revoked[key]
+
+    def is_revoked(self, digest: str) -> bool:
+        with self._lock:
+            expires_at = self._revoked.get(digest)
+        return expires_at is not None and expires_at > time.time()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "revoked": len(self._revoked), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache()
+
+
+async def revoke_token(token: str, payload: dict):
+    """
+    Revoke a token in this process immediately and in Redis for other pods,
+    which stop accepting it within TOKEN_CACHE_TTL seconds
+    """
+    digest = token_digest(token)
+    expires_at = float(payload.get("exp", time.time() + TOKEN_CACHE_TTL))
+    token_cache.revoke(digest, expires_at)
+    remaining = int(expires_at - time.time()) + 1
+    if remaining > 0:
+        await AsyncCacheService.set(get_cache_key_revoked_token(digest), 1, expire=remaining)
+
+
+async def is_token_revoked(digest: str) -> bool:
+    if token_cache.is_revoked(digest):
+        return True
+    return await AsyncCacheService.get(get_cache_key_revoked_token(digest)) is not None
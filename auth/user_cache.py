@@ -0,0 +1,70 @@
+import os
+from datetime import datetime
+from typing import Optional
+
+from database.cache import AsyncCacheService, register_local_cache, start_invalidation_listener
+from database.local_cache import MISSING, LocalCache
+
+from .identity import CurrentUser
+
+# User cache configuration
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_LOCAL_TTL = float(os.getenv("USER_CACHE_LOCAL_TTL", "30"))
+USER_CACHE_LOCAL_SIZE = int(os.getenv("USER_CACHE_LOCAL_SIZE", "10000"))
+
+# Evicted on every pod through the cache invalidation channel when a user is invalidated
+_local = LocalCache(USER_CACHE_LOCAL_SIZE, USER_CACHE_LOCAL_TTL)
+register_local_cache(_local)
+
+
+def get_cache_key_user(user_id: int) -> str:
+    """Generate cache key for a user's identity"""
+    return f"user:{user_id}"
+
+
+async def get_cached_user(user_id: int) -> Optional[CurrentUser]:
+    """
+    Look a user up in the in-process cache, then in Redis
+    """
+    start_invalidation_listener()
+    user = _local.get(get_cache_key_user(user_id))
+    if user is not MISSING:
+        return user
+
+    cached = await AsyncCacheService.get(get_cache_key_user(user_id), local=False)
+    if not cached:
+        return None
+
+    user = CurrentUser(
+        id=cached["id"],
+        phone=cached["phone"],
+        is_active=cached["is_active"],
+        created_at=datetime.fromisoformat(cached["created_at"]) if cached["created_at"] else None,
+    )
+    _remember(user)
+    return user
+
+
+async def cache_user(user: CurrentUser):
+    """Store a user in both cache tiers"""
+    _remember(user)
+    await AsyncCacheService.set(
+        get_cache_key_user(user.id),
+        {
+            "id": user.id,
+            "phone": user.phone,
+            "is_active": user.is_active,
+            "created_at": user.created_at.isoformat() if user.created_at else None,
+        },
+        expire=USER_CACHE_TTL,
+    )
+
+
+async def invalidate_user(user_id: int):
+    """Drop a user from both cache tiers on every pod, e.g. after deactivation"""
+    await AsyncCacheService.delete(get_cache_key_user(user_id))
+
+
+def _remember(user: CurrentUser):
+    start_invalidation_listener()
+    _local.put(get_cache_key_user(user.id), user)
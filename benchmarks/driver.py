@@ -0,0 +1,229 @@
+import asyncio
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import aiohttp
+import orjson
+
+from .report import Recorder
+
+# Relative frequency of each operation in the traffic mix
+DEFAULT_MIX = {
+    "get_me": 10,
+    "list_chatrooms": 15,
+    "get_chatroom": 10,
+    "create_chatroom": 2,
+    "send_message": 15,
+    "list_messages": 15,
+    "stream_message": 3,
+    "login": 2,
+    "forgot_password": 1,
+    "change_password": 1,
+    "signup": 1,
+}
+
+
+@dataclass
+class BenchUser:
+    phone: str
+    token: str = ""
+    chatroom_ids: List[int] = field(default_factory=list)
+    message_ids: List[tuple] = field(default_factory=list)  # (chatroom_id, message_id)
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class LoadDriver:
+    """
+    Drives a weighted mix of requests against every auth and chatroom route,
+    and measures time from sending a message to its ``completed`` event on the
+    user's WebSocket (``message_e2e``)
+    """
+
+    def __init__(self, base_url: str, mix: Dict[str, int] = None, repeat_ratio: float = 0.2, seed: int = 0):
+        self.base_url = base_url
+        self.mix = mix or DEFAULT_MIX
+        self.repeat_ratio = repeat_ratio
+        self.random = random.Random(seed)
+        self.recorder = Recorder()
+        self.users: List[BenchUser] = []
+        self.sent_at: Dict[int, float] = {}
+        # Events that arrived before the send request returned its message id
+        self.finished_early: Dict[int, tuple] = {}
+        self.run_id = uuid.uuid4().hex[:8]
+        self._signups = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._sockets: List[asyncio.Task] = []
+
+    async def _request(self, operation: str, method: str, path: str, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        status = 0
+        body = None
+        try:
+            async with self._session.request(method, self.base_url + path, **kwargs) as response:
+                status = response.status
+                raw = await response.read()
+                if raw and response.content_type == "application/json":
+                    body = orjson.loads(raw)
+        except aiohttp.ClientError:
+            pass
+        self.recorder.record(operation, time.perf_counter() - started, status, status in expect)
+        return status, body
+
+    async def _login(self, user: BenchUser, record_as: str = "login"):
+        status, body = await self._request(
+            record_as + ":send_otp", "POST", "/auth/send-otp", json={"phone": user.phone}
+        )
+        if status != 200:
+            return False
+        status, body = await self._request(
+            record_as + ":verify_otp", "POST", "/auth/verify-otp", json={"phone": user.phone, "otp": body["otp"]}
+        )
+        if status != 200:
+            return False
+        user.token = body["access_token"]
+        return True
+
+    async def _signup(self, record_as: str = "signup") -> BenchUser:
+        self._signups += 1
+        user = BenchUser(phone=f"bench-{self.run_id}-{self._signups}")
+        await self._request(
+            record_as,
+            "POST",
+            "/auth/signup",
+            json={"phone": user.phone, "created_at": "2024-01-01T00:00:00", "is_active": True},
+        )
+        return user
+
+    async def setup(self, users: int, chatrooms_per_user: int = 2):
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        for _ in range(users):
+            user = await self._signup("setup:signup")
+            if not await self._login(user, "setup"):
+                raise RuntimeError(f"Could not log in benchmark user {user.phone}")
+            for _ in range(chatrooms_per_user):
+                status, body = await self._request("setup:create_chatroom", "POST", "/chatroom", headers=user.headers)
+                if status == 200:
+                    user.chatroom_ids.append(body["id"])
+            self.users.append(user)
+            self._sockets.append(asyncio.create_task(self._listen(user)))
+
+    async def _listen(self, user: BenchUser):
+        """Record end-to-end latency from the user's message events"""
+        while True:
+            # Built per connection: change_password replaces the token and revokes the old one
+            url = self.base_url.replace("http", "ws", 1) + f"/ws/messages?token={user.token}"
+            try:
+                async with self._session.ws_connect(url, heartbeat=None) as socket:
+                    async for frame in socket:
+                        event = orjson.loads(frame.data)
+                        if event.get("type") != "message":
+                            continue
+                        ok = event["status"] == "completed"
+                        started = self.sent_at.pop(event["message_id"], None)
+                        if started is None:
+                            self.finished_early[event["message_id"]] = (time.perf_counter(), ok)
+                        else:
+                            self._record_e2e(started, time.perf_counter(), ok)
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+
+    def _record_e2e(self, started: float, finished: float, ok: bool):
+        self.recorder.record("message_e2e", finished - started, 200 if ok else 500, ok)
+
+    def _content(self) -> str:
+        # Some prompts repeat so the prompt cache sees realistic hits
+        if self.random.random() < self.repeat_ratio:
+            return f"What is the capital of country number {self.random.randint(1, 20)}?"
+        return f"Tell me something about {uuid.uuid4().hex}"
+
+    async def run_operation(self, operation: str, user: BenchUser):
+        chatroom_id = self.random.choice(user.chatroom_ids) if user.chatroom_ids else None
+
+        if operation == "get_me":
+            await self._request(operation, "GET", "/user/me", headers=user.headers)
+        elif operation == "list_chatrooms":
+            await self._request(operation, "GET", "/chatroom", headers=user.headers)
+        elif operation == "get_chatroom" and chatroom_id:
+            await self._request(operation, "GET", f"/chatroom/{chatroom_id}", headers=user.headers)
+        elif operation == "create_chatroom":
+            status, body = await self._request(operation, "POST", "/chatroom", headers=user.headers)
+            if status == 200:
+                user.chatroom_ids.append(body["id"])
+        elif operation == "send_message" and chatroom_id:
+            started = time.perf_counter()
+            status, body = await self._request(
+                operation,
+                "POST",
+                f"/chatroom/{chatroom_id}/message",
+                headers=user.headers,
+                json={"content": self._content()},
+            )
+            if status == 200:
+                early = self.finished_early.pop(body["id"], None)
+                if early is not None:
+                    self._record_e2e(started, *early)
+                else:
+                    self.sent_at[body["id"]] = started
+                user.message_ids.append((chatroom_id, body["id"]))
+                del user.message_ids[:-20]
+        elif operation == "list_messages" and chatroom_id:
+            await self._request(
+                operation, "GET", f"/chatroom/{chatroom_id}/messages?limit=20&fields=id,status", headers=user.headers
+            )
+        elif operation == "stream_message" and user.message_ids:
+            chatroom_id, message_id = self.random.choice(user.message_ids)
+            await self._request(
+                operation,
+                "GET",
+                f"/chatroom/{chatroom_id}/message/{message_id}/stream",
+                headers=user.headers,
+                timeout=aiohttp.ClientTimeout(total=60),
+            )
+        elif operation == "login":
+            await self._login(user)
+        elif operation == "forgot_password":
+            await self._request(operation, "POST", "/auth/forgot-password", json={"phone": user.phone})
+        elif operation == "change_password":
+            status, body = await self._request(operation, "POST", "/auth/change-password", headers=user.headers)
+            if status == 200:
+                user.token = body["access_token"]
+        elif operation == "signup":
+            await self._signup()
+
+    async def _worker(self, deadline: float):
+        operations = list(self.mix)
+        weights = [self.mix[operation] for operation in operations]
+        while time.monotonic() < deadline:
+            user = self.random.choice(self.users)
+            operation = self.random.choices(operations, weights)[0]
+            await self.run_operation(operation, user)
+
+    async def run(self, duration: float, concurrency: int, drain: float = 30.0) -> float:
+        """Run the mix for ``duration`` seconds, then wait up to ``drain`` seconds for outstanding messages"""
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*(self._worker(deadline) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+        drain_deadline = time.monotonic() + drain
+        while self.sent_at and time.monotonic() < drain_deadline:
+            await asyncio.sleep(0.1)
+        return elapsed
+
+    @property
+    def unfinished_messages(self) -> int:
+        return len(self.sent_at)
+
+    async def close(self):
+        for task in self._sockets:
+            task.cancel()
+        await asyncio.gather(*self._sockets, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,107 @@
+"""
+Local stand-in for the Gemini API, used by the benchmarks.
+
+Run with ``python -m benchmarks.gemini_stub --port 8765 --latency 0.3``, then
+point the app at it with
+``GEMINI_API_URL=http://127.0.0.1:8765/v1beta/models/stub:generateContent``.
+"""
+
+import argparse
+import asyncio
+import random
+
+import orjson
+from aiohttp import web
+
+
+class GeminiStub:
+    """
+    Answers ``generateContent`` and ``streamGenerateContent?alt=sse`` after a
+    configurable delay, failing a configurable share of calls with 429/500
+    """
+
+    def __init__(
+        self, latency: float = 0.3, jitter: float = 0.1, error_rate: float = 0.0, chunks: int = 5, seed: int = 0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunks = chunks
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.random.gauss(self.latency, self.jitter))
+
+    def _error(self):
+        if self.random.random() >= self.error_rate:
+            return None
+        self.errors += 1
+        if self.random.random() < 0.5:
+            return web.Response(status=429, headers={"Retry-After": "0.2"}, text="rate limited")
+        return web.Response(status=500, text="internal error")
+
+    @staticmethod
+    def _answer(body: dict) -> str:
+        # Long enough to exercise streaming and storage, derived from the prompt
+        prompt = body["contents"][-1]["parts"][0]["text"]
+        return f"Stub answer to: {prompt[:200]} " + "lorem ipsum " * 40
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.calls += 1
+        body = await request.json(loads=orjson.loads)
+        error = self._error()
+        if error is not None:
+            await asyncio.sleep(self._delay() / 4)
+            return error
+
+        text = self._answer(body)
+        if not request.path.endswith(":streamGenerateContent"):
+            await asyncio.sleep(self._delay())
+            return web.Response(
+                body=orjson.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}),
+                content_type="application/json",
+            )
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        size = len(text) // self.chunks + 1
+        for start in range(0, len(text), size):
+            await asyncio.sleep(self._delay() / self.chunks)
+            chunk = {"candidates": [{"content": {"parts": [{"text": text[start : start + size]}]}}]}
+            await response.write(b"data: " + orjson.dumps(chunk) + b"\r\n\r\n")
+        await response.write_eof()
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/{path:.*}", self.handle)
+        return app
+
+    async def start(self, port: int) -> web.AppRunner:
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+
+def stub_url(port: int) -> str:
+    return f"http://127.0.0.1:{port}/v1beta/models/stub:generateContent"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Gemini API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="standard deviation of the response time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 429/500")
+    parser.add_argument("--chunks", type=int, default=5, help="chunks per streamed response")
+    args = parser.parse_args()
+
+    stub = GeminiStub(args.latency, args.jitter, args.error_rate, args.chunks)
+    web.run_app(stub.app(), host="127.0.0.1", port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
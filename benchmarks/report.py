@@ -0,0 +1,92 @@
+import math
+from collections import defaultdict
+from typing import Dict, List
+
+# Metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "rps": True, "error_rate": False}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of unsorted samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Recorder:
+    """Latency samples and error counts per operation"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, operation: str, seconds: float, status: int, ok: bool):
+        self.samples[operation].append(seconds)
+        self.statuses[operation][status] += 1
+        if not ok:
+            self.errors[operation] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(len(samples) for samples in self.samples.values())
+
+    def summary(self, duration: float) -> Dict[str, dict]:
+        results = {}
+        for operation, samples in sorted(self.samples.items()):
+            results[operation] = {
+                "count": len(samples),
+                "rps": round(len(samples) / duration, 2) if duration else 0.0,
+                "p50_ms": round(percentile(samples, 50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 99) * 1000, 2),
+                "max_ms": round(max(samples) * 1000, 2),
+                "error_rate": round(self.errors[operation] / len(samples), 4),
+                "statuses": {str(status): count for status, count in sorted(self.statuses[operation].items())},
+            }
+        return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    List regressions of ``results`` against ``baseline``: latency or error rate
+    more than ``tolerance`` (a fraction) worse, or throughput that much lower.
+    Operations missing from either side are skipped.
+    """
+    regressions = []
+    for operation, current in results["operations"].items():
+        previous = baseline.get("operations", {}).get(operation)
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            if metric == "error_rate":
+                # Absolute tolerance, since the baseline is often zero
+                worse = new - old > tolerance / 10
+            elif higher_is_better:
+                worse = new < old * (1 - tolerance)
+            else:
+                # Ignore sub-millisecond noise on very fast operations
+                worse = new > old * (1 + tolerance) and new - old > 1.0
+            if worse:
+                regressions.append(f"{operation} {metric}: {old} -> {new}")
+
+    old_queries = baseline.get("db_queries_per_request")
+    new_queries = results.get("db_queries_per_request")
+    if old_queries and new_queries and new_queries > old_queries * (1 + tolerance):
+        regressions.append(f"db_queries_per_request: {old_queries} -> {new_queries}")
+    return regressions
+
+
+def format_table(operations: Dict[str, dict]) -> str:
+    lines = [f"{'operation':<22}{'count':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"]
+    for operation, stats in operations.items():
+        lines.append(
+            f"{operation:<22}{stats['count']:>8}{stats['rps']:>9}{stats['p50_ms']:>10}"
+            f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['error_rate']:>9.2%}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,250 @@
+"""
+Load test the API end to end against a stub Gemini server.
+
+    python -m benchmarks.run --duration 30 --concurrency 20 --output results.json
+    python -m benchmarks.run --baseline results.json   # exits 1 on regressions
+
+The app runs in this process (uvicorn on a background thread) so database
+queries can be counted. It uses ``DATABASE_URL``/``REDIS_URL`` when set,
+otherwise a temporary SQLite file and, with ``--fake-redis``, an in-memory
+Redis (needs ``fakeredis[lua]``; local dispatch only).
+"""
+
+import argparse
+import asyncio
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import orjson
+
+from .gemini_stub import stub_url
+from .report import compare, format_table
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def _rss_mb() -> float:
+    """Current resident set size, falling back to the peak where /proc is unavailable"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _configure_environment(args, stub_port: int):
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-of-sufficient-length")
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+    os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:6379/0")
+    os.environ["GEMINI_API_KEY"] = "benchmark"
+    os.environ["GEMINI_API_URL"] = stub_url(stub_port)
+    os.environ["GEMINI_STREAMING"] = "true" if args.gemini_stream else "false"
+    if not args.rate_limit:
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+    if args.fake_redis:
+        os.environ["MESSAGE_DISPATCH"] = "local"
+
+
+def _install_fake_redis():
+    import fakeredis
+    from fakeredis import aioredis as fake_aioredis
+
+    from database import cache
+
+    server = fakeredis.FakeServer()
+    cache._clients["text"] = fakeredis.FakeRedis(server=server, decode_responses=True)
+    cache._clients["bytes"] = fakeredis.FakeRedis(server=server)
+    cache._clients["async"] = fake_aioredis.FakeRedis(server=server)
+
+
+class QueryCounter:
+    """Counts statements sent to the database through SQLAlchemy engine events"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def attach(self, *engines):
+        from sqlalchemy import event
+
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+async def _drive(args, base_url: str) -> dict:
+    from .driver import LoadDriver
+
+    driver = LoadDriver(base_url, repeat_ratio=args.repeat_ratio, seed=args.seed)
+    try:
+        await driver.setup(args.users)
+        elapsed = await driver.run(args.duration, args.concurrency, drain=args.drain)
+        return {
+            "duration_s": round(elapsed, 2),
+            "operations": driver.recorder.summary(elapsed),
+            "requests": driver.recorder.total,
+            "unfinished_messages": driver.unfinished_messages,
+        }
+    finally:
+        await driver.close()
+
+
+def run(args) -> dict:
+    stub_port = _free_port()
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.gemini_stub",
+            "--port",
+            str(stub_port),
+            "--latency",
+            str(args.gemini_latency),
+            "--error-rate",
+            str(args.gemini_error_rate),
+            "--chunks",
+            str(args.gemini_chunks),
+        ]
+    )
+    try:
+        _wait_for_port(stub_port)
+        _configure_environment(args, stub_port)
+
+        import uvicorn
+
+        import main as api
+        from database.db_connection import async_engine, create_table, engine
+
+        # Register every model before creating tables
+        import auth.models  # noqa: F401
+        import chatroom.models  # noqa: F401
+
+        create_table()
+        if args.fake_redis:
+            _install_fake_redis()
+        queries = QueryCounter()
+        # There is no async engine with DATABASE_MODE=sync
+        queries.attach(engine, *([async_engine.sync_engine] if async_engine is not None else []))
+
+        app_port = _free_port()
+        server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=app_port, log_level="warning"))
+        thread = threading.Thread(target=server.run, name="benchmark-app", daemon=True)
+        thread.start()
+        _wait_for_port(app_port)
+
+        rss_before = _rss_mb()
+        results = asyncio.run(_drive(args, f"http://127.0.0.1:{app_port}"))
+        results.update(
+            {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+                "redis": "fake" if args.fake_redis else "real",
+                "config": {
+                    "users": args.users,
+                    "concurrency": args.concurrency,
+                    "gemini_latency": args.gemini_latency,
+                    "gemini_error_rate": args.gemini_error_rate,
+                    "gemini_stream": args.gemini_stream,
+                    "gemini_chunks": args.gemini_chunks,
+                },
+                "db_queries": queries.count,
+                "db_queries_per_request": round(queries.count / max(1, results["requests"]), 3),
+                "rss_mb_before": rss_before,
+                "rss_mb_after": _rss_mb(),
+            }
+        )
+
+        server.should_exit = True
+        thread.join(timeout=30)
+        return results
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat API against a stub Gemini server")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load after setup")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent simulated clients")
+    parser.add_argument("--users", type=int, default=20, help="users created during setup")
+    parser.add_argument("--drain", type=float, default=30, help="seconds to wait for outstanding messages")
+    parser.add_argument("--repeat-ratio", type=float, default=0.2, help="share of messages with repeated prompts")
+    parser.add_argument("--gemini-latency", type=float, default=0.3, help="mean stub Gemini response time")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="share of stub calls that fail")
+    parser.add_argument(
+        "--gemini-stream",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="process messages with streamGenerateContent (GEMINI_STREAMING)",
+    )
+    parser.add_argument("--gemini-chunks", type=int, default=5, help="chunks per streamed stub response")
+    parser.add_argument("--fake-redis", action="store_true", help="use an in-memory Redis instead of REDIS_URL")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the API rate limits enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a saved results file; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    print(format_table(results["operations"]))
+    print(
+        f"\n{results['requests']} requests in {results['duration_s']}s, "
+        f"{results['db_queries_per_request']} DB queries per request, "
+        f"RSS {results['rss_mb_before']} -> {results['rss_mb_after']} MB, "
+        f"{results['unfinished_messages']} messages unfinished"
+    )
+
+    if args.output:
+        with open(args.output, "wb") as output:
+            output.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+
+    if args.baseline:
+        with open(args.baseline, "rb") as baseline_file:
+            baseline = orjson.loads(baseline_file.read())
+        regressions = compare(results, baseline, args.tolerance)
+        if results["unfinished_messages"] > baseline.get("unfinished_messages", 0):
+            regressions.append(
+                f"unfinished_messages: {baseline.get('unfinished_messages', 0)} -> " f"{results['unfinished_messages']}"
+            )
+        if regressions:
+            print("\nREGRESSIONS against " + args.baseline)
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
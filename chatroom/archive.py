@@ -0,0 +1,231 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Dict, List, Optional
+
+import orjson
+import zstandard
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.cache import CACHE_NODE_ID, AsyncCacheService
+from database.db_connection import session_scope
+
+from .models import Message, MessageArchiveBlock
+from .partitions import MESSAGE_PARTITIONING, drop_empty_partitions, ensure_partitions
+
+# Cold archival of old messages to compressed segment files
+MESSAGE_ARCHIVE_ENABLED = os.getenv("MESSAGE_ARCHIVE_ENABLED", "false").lower() == "true"
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "archive")
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", "90"))
+# Messages moved per segment file (and per transaction)
+MESSAGE_ARCHIVE_BATCH = int(os.getenv("MESSAGE_ARCHIVE_BATCH", "5000"))
+MESSAGE_ARCHIVE_INTERVAL = int(os.getenv("MESSAGE_ARCHIVE_INTERVAL", "3600"))
+MESSAGE_ARCHIVE_ZSTD_LEVEL = int(os.getenv("MESSAGE_ARCHIVE_ZSTD_LEVEL", "10"))
+
+ARCHIVED_FIELDS = (
+    "id",
+    "user_id",
+    "chatroom_id",
+    "content",
+    "response",
+    "status",
+    "use_cache",
+    "created_at",
+    "updated_at",
+)
+# Only messages that will never change again are archived
+ARCHIVED_STATUSES = ("completed", "failed")
+
+
+def get_cache_key_archive_lock() -> str:
+    """Generate cache key for the lock held by the pod running archival"""
+    return "message_archive:lock"
+
+
+def _decode(line: bytes) -> dict:
+    message = orjson.loads(line)
+    for field in ("created_at", "updated_at"):
+        if message.get(field):
+            message[field] = datetime.fromisoformat(message[field])
+    return message
+
+
+def write_segment(messages: List[dict]) -> Dict[str, object]:
+    """
+    Write messages, sorted by (chatroom_id, id), to a new segment file: one
+    independently compressed zstd frame of JSON lines per chatroom, so a
+    chatroom's block can be read without decompressing the rest. Concatenated
+    frames are a valid zstd stream, so ``zstd -dc`` reads a whole segment.
+    Returns the segment name and one index entry per chatroom.
+    """
+    os.makedirs(MESSAGE_ARCHIVE_DIR, exist_ok=True)
+    name = f"messages-{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.jsonl.zst"
+    path = os.path.join(MESSAGE_ARCHIVE_DIR, name)
+    compressor = zstandard.ZstdCompressor(level=MESSAGE_ARCHIVE_ZSTD_LEVEL)
+    blocks = []
+    offset = 0
+    with open(path + ".tmp", "wb") as segment:
+        for chatroom_id, group in groupby(messages, key=lambda message: message["chatroom_id"]):
+            group = list(group)
+            frame = compressor.compress(b"".join(orjson.dumps(message) + b"\n" for message in group))
+            segment.write(frame)
+            blocks.append(
+                {
+                    "chatroom_id": chatroom_id,
+                    "segment": name,
+                    "byte_offset": offset,
+                    "length": len(frame),
+                    "first_id": group[0]["id"],
+                    "last_id": group[-1]["id"],
+                    "message_count": len(group),
+                }
+            )
+            offset += len(frame)
+        segment.flush()
+        os.fsync(segment.fileno())
+    # Only complete segments get their final name
+    os.replace(path + ".tmp", path)
+    return {"segment": name, "blocks": blocks}
+
+
+def read_block(segment: str, byte_offset: int, length: int) -> List[dict]:
+    """Messages of one chatroom block, oldest first"""
+    with open(os.path.join(MESSAGE_ARCHIVE_DIR, segment), "rb") as file:
+        file.seek(byte_offset)
+        frame = file.read(length)
+    data = zstandard.ZstdDecompressor().decompress(frame)
+    return [_decode(line) for line in data.splitlines() if line]
+
+
+async def archive_messages(cutoff: datetime, batch_size: int = MESSAGE_ARCHIVE_BATCH) -> int:
+    """
+    Move finished messages created before ``cutoff`` from the messages table
+    to segment files, one segment per batch. Each batch's index rows are
+    inserted and its messages deleted in one transaction after the segment is
+    safely on disk, so a crash leaves at worst an unreferenced segment.
+    Returns the number of messages archived.
+    """
+    archived = 0
+    while True:
+        async with session_scope() as db:
+            # Walking the primary key finds the oldest rows first without an index on created_at
+            rows = (
+                await db.execute(
+                    select(*[getattr(Message, field) for field in ARCHIVED_FIELDS])
+                    .where(Message.created_at < cutoff, Message.status.in_(ARCHIVED_STATUSES))
+                    .order_by(Message.id)
+                    .limit(batch_size)
+                )
+            ).all()
+            if not rows:
+                break
+            messages = sorted(
+                (dict(zip(ARCHIVED_FIELDS, row)) for row in rows),
+                key=lambda message: (message["chatroom_id"], message["id"]),
+            )
+            segment = await asyncio.to_thread(write_segment, messages)
+
+            db.add_all(MessageArchiveBlock(**block) for block in segment["blocks"])
+            await db.execute(
+                delete(Message)
+                .where(Message.id.in_([message["id"] for message in messages]), Message.created_at < cutoff)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        archived += len(rows)
+        if len(rows) < batch_size:
+            break
+        await asyncio.sleep(0)
+    return archived
+
+
+async def get_archived_messages(
+    db: AsyncSession, chatroom_id: int, before: Optional[int] = None, limit: int = 50
+) -> List[dict]:
+    """Archived messages of a chatroom with id below ``before``, newest first, at most ``limit``"""
+    query = select(MessageArchiveBlock).where(MessageArchiveBlock.chatroom_id == chatroom_id)
+    if before is not None:
+        query = query.where(MessageArchiveBlock.first_id < before)
+    blocks = (await db.scalars(query.order_by(MessageArchiveBlock.last_id.desc()))).all()
+
+    messages = []
+    for block in blocks:
+        # Blocks come newest first; once a page is full, older blocks cannot change it. A message
+        # that finished late can sit in a later segment than newer ones, so blocks may overlap.
+        if len(messages) >= limit and block.last_id < messages[limit - 1]["id"]:
+            break
+        block_messages = await asyncio.to_thread(read_block, block.segment, block.byte_offset, block.length)
+        messages.extend(message for message in block_messages if before is None or message["id"] < before)
+        messages.sort(key=lambda message: message["id"], reverse=True)
+    return messages[:limit]
+
+
+async def get_archived_message(db: AsyncSession, chatroom_id: int, message_id: int) -> Optional[dict]:
+    """One archived message, if it is in the archive"""
+    blocks = await db.scalars(
+        select(MessageArchiveBlock).where(
+            MessageArchiveBlock.chatroom_id == chatroom_id,
+            MessageArchiveBlock.first_id <= message_id,
+            MessageArchiveBlock.last_id >= message_id,
+        )
+    )
+    for block in blocks.all():
+        for message in await asyncio.to_thread(read_block, block.segment, block.byte_offset, block.length):
+            if message["id"] == message_id:
+                return message
+    return None
+
+
+class MessageArchiveJob:
+    """
+    Every MESSAGE_ARCHIVE_INTERVAL seconds: create upcoming partitions (when
+    partitioned), archive messages older than MESSAGE_ARCHIVE_AFTER_DAYS and
+    drop partitions left empty. Only the pod holding a Redis lock does the
+    work in each round.
+    """
+
+    def __init__(self, interval: int = MESSAGE_ARCHIVE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self):
+        if MESSAGE_PARTITIONING:
+            async with session_scope() as db:
+                await ensure_partitions(db)
+        if not MESSAGE_ARCHIVE_ENABLED:
+            return
+        if not await AsyncCacheService.add_if_absent(get_cache_key_archive_lock(), CACHE_NODE_ID, expire=self.interval):
+            return
+        cutoff = datetime.now() - timedelta(days=MESSAGE_ARCHIVE_AFTER_DAYS)
+        archived = await archive_messages(cutoff)
+        if archived:
+            print(f"Archived {archived} messages created before {cutoff:%Y-%m-%d}")
+        if MESSAGE_PARTITIONING:
+            async with session_scope() as db:
+                dropped = await drop_empty_partitions(db, cutoff)
+            if dropped:
+                print(f"Dropped archived message partitions: {', '.join(dropped)}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Warning: Message archival failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="message-archive")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+message_archive_job = MessageArchiveJob()
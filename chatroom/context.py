@@ -0,0 +1,175 @@
+import os
+from typing import Awaitable, Callable, List, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from database.cache import AsyncCacheService, tag_chatroom
+from database.db_connection import session_scope
+
+from .models import ChatroomSummary, Message
+
+# Context window configuration
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "20"))
+CONTEXT_SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "10"))
+CONTEXT_SUMMARY_MAX_WORDS = int(os.getenv("CONTEXT_SUMMARY_MAX_WORDS", "300"))
+CONTEXT_SUMMARY_CACHE_TTL = int(os.getenv("CONTEXT_SUMMARY_CACHE_TTL", "3600"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def get_cache_key_chatroom_summary(chatroom_id: int) -> str:
+    """Generate cache key for a chatroom's rolling summary"""
+    return f"chatroom_summary:{chatroom_id}"
+
+
+async def load_summary(db, chatroom_id: int) -> Tuple[str, int]:
+    """Get a chatroom's rolling summary and the last message id it covers"""
+    cache_key = get_cache_key_chatroom_summary(chatroom_id)
+    cached = await AsyncCacheService.get(cache_key)
+    if cached:
+        return cached["summary"], cached["summarized_through_id"]
+
+    row = await db.get(ChatroomSummary, chatroom_id)
+    summary, through_id = (row.summary, row.summarized_through_id) if row else ("", 0)
+    await AsyncCacheService.set(
+        cache_key,
+        {"summary": summary, "summarized_through_id": through_id},
+        expire=CONTEXT_SUMMARY_CACHE_TTL,
+        tags=[tag_chatroom(chatroom_id)],
+    )
+    return summary, through_id
+
+
+def _turn(role: str, text: str) -> dict:
+    return {"role": role, "parts": [{"text": text}]}
+
+
+async def build_contents(chatroom_id: int, message_id: int, content: str) -> Tuple[List[dict], int]:
+    """
+    Assemble the Gemini ``contents`` for a message: the chatroom's rolling
+    summary, every turn after it, then the message.
+
+    The turns are the window (as many recent turns as fit the token budget,
+    at most CONTEXT_MAX_TURNS) preceded by older turns that slid out of it but
+    are not folded into the summary yet, so no turn is left out of the prompt
+    while a summary batch fills up. Returns the contents and the id of the
+    oldest turn in the window (older turns should be folded into the summary).
+    """
+    async with session_scope() as db:
+        summary, through_id = await load_summary(db, chatroom_id)
+        rows = (
+            await db.execute(
+                select(Message.id, Message.content, Message.response)
+                .where(
+                    Message.chatroom_id == chatroom_id,
+                    Message.id < message_id,
+                    Message.id > through_id,
+                    Message.status == "completed",
+                )
+                .order_by(Message.id.desc())
+                # The window plus a batch of turns still waiting to be folded
+                .limit(CONTEXT_MAX_TURNS + CONTEXT_SUMMARY_BATCH)
+            )
+        ).all()
+
+    budget = CONTEXT_TOKEN_BUDGET - estimate_tokens(content) - estimate_tokens(summary)
+    window_size = 0
+    for row in rows[:CONTEXT_MAX_TURNS]:
+        cost = estimate_tokens(row.content) + estimate_tokens(row.response or "")
+        if cost > budget:
+            break
+        budget -= cost
+        window_size += 1
+    turns = list(reversed(rows))
+
+    contents = []
+    if summary:
+        contents.append(_turn("user", f"Summary of our conversation so far:\n{summary}"))
+        contents.append(_turn("model", "Understood."))
+    for row in turns:
+        contents.append(_turn("user", row.content))
+        contents.append(_turn("model", row.response or ""))
+    contents.append(_turn("user", content))
+
+    window_start_id = rows[window_size - 1].id if window_size else message_id
+    return contents, window_start_id
+
+
+def _summary_prompt(summary: str, turns) -> str:
+    lines = [
+        f"Update the running summary of a conversation with the new turns below. "
+        f"Keep every fact the assistant may need later and stay under {CONTEXT_SUMMARY_MAX_WORDS} words. "
+        f"Reply with the summary only.",
+        "",
+        "Current summary:",
+        summary or "(empty)",
+        "",
+        "New turns:",
+    ]
+    for turn in turns:
+        lines.append(f"User: {turn.content}")
+        lines.append(f"Assistant: {turn.response or ''}")
+    return "\n".join(lines)
+
+
+async def fold_summary(chatroom_id: int, before_id: int, summarize: Callable[[str], Awaitable[str]]):
+    """
+    Fold CONTEXT_SUMMARY_BATCH turns older than ``before_id`` into the
+    chatroom's summary once that many have slid out of the window, so a long
+    conversation costs one summarisation call per batch rather than per
+    message. Each call only reads the current summary and the new turns, so
+    the summary is never recomputed from the full history.
+    """
+    async with session_scope() as db:
+        summary, through_id = await load_summary(db, chatroom_id)
+        turns = (
+            await db.execute(
+                select(Message.id, Message.content, Message.response)
+                .where(
+                    Message.chatroom_id == chatroom_id,
+                    Message.id > through_id,
+                    Message.id < before_id,
+                    Message.status == "completed",
+                )
+                .order_by(Message.id)
+                .limit(CONTEXT_SUMMARY_BATCH)
+            )
+        ).all()
+    if not turns or len(turns) < CONTEXT_SUMMARY_BATCH:
+        return
+
+    new_summary = await summarize(_summary_prompt(summary, turns))
+    new_through_id = turns[-1].id
+
+    async with session_scope() as db:
+        if through_id == 0 and await db.get(ChatroomSummary, chatroom_id) is None:
+            db.add(ChatroomSummary(chatroom_id=chatroom_id, summary=new_summary, summarized_through_id=new_through_id))
+            updated = True
+        else:
+            # Compare-and-set so concurrent folds of the same chatroom cannot lose turns
+            result = await db.execute(
+                update(ChatroomSummary)
+                .where(ChatroomSummary.chatroom_id == chatroom_id, ChatroomSummary.summarized_through_id == through_id)
+                .values(summary=new_summary, summarized_through_id=new_through_id)
+                .execution_options(synchronize_session=False)
+            )
+            updated = bool(result.rowcount)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Another fold created the row first
+            await db.rollback()
+            updated = False
+
+    if updated:
+        await AsyncCacheService.set(
+            get_cache_key_chatroom_summary(chatroom_id),
+            {"summary": new_summary, "summarized_through_id": new_through_id},
+            expire=CONTEXT_SUMMARY_CACHE_TTL,
+            tags=[tag_chatroom(chatroom_id)],
+        )
@@ -0,0 +1,268 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, List, Optional, Union
+
+import aiohttp
+import orjson
+
+from middleware.metrics import GEMINI_LATENCY_BUCKETS, TOKEN_BUCKETS, Counter, Gauge, Histogram
+
+# Gemini API configuration
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_URL = os.getenv(
+    "GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+)
+GEMINI_STREAM_URL = os.getenv(
+    "GEMINI_STREAM_URL", GEMINI_API_URL.replace(":generateContent", ":streamGenerateContent") + "?alt=sse"
+)
+
+# Connection pool configuration
+GEMINI_POOL_LIMIT = int(os.getenv("GEMINI_POOL_LIMIT", "100"))
+GEMINI_POOL_LIMIT_PER_HOST = int(os.getenv("GEMINI_POOL_LIMIT_PER_HOST", "50"))
+GEMINI_KEEPALIVE_TIMEOUT = float(os.getenv("GEMINI_KEEPALIVE_TIMEOUT", "60"))
+GEMINI_DNS_CACHE_TTL = int(os.getenv("GEMINI_DNS_CACHE_TTL", "300"))
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "60"))
+GEMINI_TOTAL_TIMEOUT = float(os.getenv("GEMINI_TOTAL_TIMEOUT", "120"))
+
+
+class GeminiAPIError(Exception):
+    """Raised when Gemini returns a non-200 response"""
+
+    def __init__(self, status: int, message: str = "", retry_after: Optional[float] = None):
+        self.status = status
+        self.retry_after = retry_after
+        super().__init__(message or f"Gemini API Error: {status}")
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Retry-After in seconds, if the server sent one"""
+    value = headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+gemini_request_seconds = Histogram(
+    "gemini_request_duration_seconds",
+    "Gemini call latency by operation and outcome",
+    ("operation", "outcome"),
+    GEMINI_LATENCY_BUCKETS,
+)
+gemini_tokens = Histogram("gemini_tokens", "Tokens per Gemini call", ("operation", "kind"), TOKEN_BUCKETS)
+gemini_errors = Counter("gemini_errors_total", "Failed Gemini calls by reason", ("operation", "reason"))
+
+
+def _outcome(error: Optional[BaseException]) -> str:
+    """Low-cardinality label for how a call ended"""
+    if error is None:
+        return "ok"
+    if isinstance(error, GeminiAPIError):
+        return str(error.status)
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    return "error"
+
+
+def _observe(operation: str, started: float, error: Optional[BaseException], usage: Optional[dict]):
+    outcome = _outcome(error)
+    gemini_request_seconds.observe(time.perf_counter() - started, operation, outcome)
+    if error is not None:
+        gemini_errors.inc(operation, outcome)
+    if usage:
+        gemini_tokens.observe(usage.get("promptTokenCount", 0), operation, "prompt")
+        gemini_tokens.observe(usage.get("candidatesTokenCount", 0), operation, "response")
+
+
+class GeminiClient:
+    """
+    Process-wide Gemini client sharing one pooled aiohttp session.
+
+    Create it once with ``start()`` on the event loop that will use it and
+    ``close()`` it on shutdown so keep-alive connections are reused across calls.
+    """
+
+    def __init__(
+        self,
+        api_url: str = GEMINI_API_URL,
+        api_key: Optional[str] = GEMINI_API_KEY,
+        stream_url: str = GEMINI_STREAM_URL,
+    ):
+        self.api_url = api_url
+        self.stream_url = stream_url
+        self.api_key = api_key
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Pool statistics, updated from aiohttp trace hooks
+        self.in_flight = 0
+        self.queued = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.requests = 0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_queued_start(session, ctx, params):
+            self.queued += 1
+
+        async def on_queued_end(session, ctx, params):
+            self.queued -= 1
+
+        async def on_create_end(session, ctx, params):
+            self.connections_created += 1
+
+        async def on_reuse(session, ctx, params):
+            self.connections_reused += 1
+
+        trace_config.on_connection_queued_start.append(on_queued_start)
+        trace_config.on_connection_queued_end.append(on_queued_end)
+        trace_config.on_connection_create_end.append(on_create_end)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        return trace_config
+
+    async def start(self):
+        """Open the pooled session on the running event loop"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=GEMINI_POOL_LIMIT,
+            limit_per_host=GEMINI_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=GEMINI_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=GEMINI_DNS_CACHE_TTL,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=GEMINI_TOTAL_TIMEOUT,
+            sock_connect=GEMINI_CONNECT_TIMEOUT,
+            sock_read=GEMINI_READ_TIMEOUT,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={"Content-Type": "application/json"},
+            json_serialize=lambda obj: orjson.dumps(obj).decode(),
+            trace_configs=[self._trace_config()],
+        )
+        self._loop = asyncio.get_running_loop()
+
+    async def close(self):
+        """Close the session and its pooled connections"""
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # A session is bound to the loop it was created on; start lazily for
+        # callers (scripts, workers) that never called start()
+        if self._session is not None and self._loop is not asyncio.get_running_loop():
+            # Cannot be closed from this loop; drop it and let its own loop clean up
+            self._session = None
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    @staticmethod
+    def build_payload(contents: Union[str, List[dict]]) -> bytes:
+        """Request body for a single prompt or a list of conversation turns"""
+        if isinstance(contents, str):
+            contents = [{"parts": [{"text": contents}]}]
+        return orjson.dumps({"contents": contents})
+
+    @staticmethod
+    def parse_response(result: dict) -> str:
+        return result["candidates"][0]["content"]["parts"][0]["text"]
+
+    @staticmethod
+    def parse_chunk(result: dict) -> str:
+        """Text of one streamed chunk; the final chunk may carry only metadata"""
+        candidates = result.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts)
+
+    async def generate(self, contents: Union[str, List[dict]]) -> str:
+        """
+        Generate a response for ``contents``. Raises GeminiAPIError on non-200 responses.
+        """
+        session = await self._get_session()
+        self.in_flight += 1
+        self.requests += 1
+        started = time.perf_counter()
+        error = usage = None
+        try:
+            async with session.post(
+                self.api_url, data=self.build_payload(contents), headers={"X-goog-api-key": self.api_key}
+            ) as response:
+                # Read raw bytes and let orjson decode them directly, skipping the str copy
+                body = await response.read()
+                if response.status != 200:
+                    raise GeminiAPIError(response.status, retry_after=parse_retry_after(response.headers))
+                result = orjson.loads(body)
+                usage = result.get("usageMetadata")
+                return self.parse_response(result)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.in_flight -= 1
+            _observe("generate", started, error, usage)
+
+    async def stream_generate(self, contents: Union[str, List[dict]]) -> AsyncIterator[str]:
+        """
+        Stream a response for ``contents`` chunk by chunk using streamGenerateContent
+        with server-sent events. Raises GeminiAPIError on non-200 responses.
+        """
+        session = await self._get_session()
+        self.in_flight += 1
+        self.requests += 1
+        started = time.perf_counter()
+        error = usage = None
+        try:
+            async with session.post(
+                self.stream_url, data=self.build_payload(contents), headers={"X-goog-api-key": self.api_key}
+            ) as response:
+                if response.status != 200:
+                    await response.read()
+                    raise GeminiAPIError(response.status, retry_after=parse_retry_after(response.headers))
+                async for line in response.content:
+                    if not line.startswith(b"data:"):
+                        continue
+                    result = orjson.loads(line[5:])
+                    # Usage is reported on the last chunks and covers the whole response
+                    usage = result.get("usageMetadata") or usage
+                    chunk = self.parse_chunk(result)
+                    if chunk:
+                        yield chunk
+        except GeneratorExit:
+            # Consumer stopped early (e.g. client disconnected); not a Gemini failure
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.in_flight -= 1
+            _observe("stream", started, error, usage)
+
+    def stats(self) -> dict:
+        """Connection pool statistics"""
+        connector = self._session.connector if self._session is not None else None
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "limit": connector.limit if connector else GEMINI_POOL_LIMIT,
+            "limit_per_host": connector.limit_per_host if connector else GEMINI_POOL_LIMIT_PER_HOST,
+        }
+
+
+gemini_client = GeminiClient()
+
+Gauge("gemini_in_flight", "Gemini calls in progress", lambda: gemini_client.in_flight)
+Gauge("gemini_pool_queued", "Gemini calls waiting for a pooled connection", lambda: gemini_client.queued)
@@ -0,0 +1,75 @@
+import os
+import time
+from typing import List
+
+import redis
+
+from database.cache import get_async_redis_client, get_redis_client
+
+from .scheduler import QueueUnavailableError
+
+# Redis Streams configuration for the out-of-process worker fleet
+MESSAGE_STREAM_KEY = os.getenv("MESSAGE_STREAM_KEY", "chatroom:messages")
+MESSAGE_STREAM_GROUP = os.getenv("MESSAGE_STREAM_GROUP", "gemini-workers")
+MESSAGE_STREAM_MAXLEN = int(os.getenv("MESSAGE_STREAM_MAXLEN", "100000"))
+# How often an API pod re-reads the stream backlog for load shedding
+MESSAGE_BACKLOG_SAMPLE_INTERVAL = float(os.getenv("MESSAGE_BACKLOG_SAMPLE_INTERVAL", "1"))
+
+_backlog_sample = {"value": 0, "at": 0.0}
+
+
+def enqueue_message(user_id: int, message_id: int) -> str:
+    """
+    Append a message to the durable processing stream and return the entry id
+    """
+    try:
+        return get_redis_client().xadd(
+            MESSAGE_STREAM_KEY,
+            {"message_id": message_id, "user_id": user_id},
+            maxlen=MESSAGE_STREAM_MAXLEN,
+            approximate=True,
+        )
+    except (redis.RedisError, ValueError) as e:
+        raise QueueUnavailableError(f"Message stream unavailable: {e}")
+
+
+def enqueue_messages(user_id: int, message_ids: List[int]) -> List[str]:
+    """
+    Append several messages to the processing stream in one round trip and
+    return their entry ids
+    """
+    try:
+        pipeline = get_redis_client().pipeline(transaction=False)
+        for message_id in message_ids:
+            pipeline.xadd(
+                MESSAGE_STREAM_KEY,
+                {"message_id": message_id, "user_id": user_id},
+                maxlen=MESSAGE_STREAM_MAXLEN,
+                approximate=True,
+            )
+        return pipeline.execute()
+    except (redis.RedisError, ValueError) as e:
+        raise QueueUnavailableError(f"Message stream unavailable: {e}")
+
+
+async def stream_backlog() -> int:
+    """
+    Messages in the stream not yet acknowledged by the worker group (undelivered
+    plus pending), sampled at most every MESSAGE_BACKLOG_SAMPLE_INTERVAL seconds
+    """
+    now = time.monotonic()
+    if now - _backlog_sample["at"] < MESSAGE_BACKLOG_SAMPLE_INTERVAL:
+        return _backlog_sample["value"]
+    _backlog_sample["at"] = now
+
+    try:
+        groups = await get_async_redis_client().xinfo_groups(MESSAGE_STREAM_KEY)
+    except (redis.RedisError, ValueError):
+        # Unknown backlog (Redis down, or REDIS_URL missing or invalid); keep
+        # the last sample rather than shedding blindly
+        return _backlog_sample["value"]
+    for group in groups:
+        name = group["name"].decode() if isinstance(group["name"], bytes) else group["name"]
+        if name == MESSAGE_STREAM_GROUP:
+            _backlog_sample["value"] = (group.get("lag") or 0) + group["pending"]
+    return _backlog_sample["value"]
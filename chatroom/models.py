@@ -1,10 +1,12 @@
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, ForeignKey, Index, Integer, String, Text, text, true
 
 from auth.models import Users
 from database.db_connection import Base
 
+from .partitions import MESSAGE_PARTITIONING
+
 
 class Chatroom(Base):
     __tablename__ = "chatroom"
@@ -12,16 +14,59 @@ class Chatroom(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey(Users.id), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")  # maintained on insert
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Backs keyset pagination of a chatroom's history
+        Index("ix_messages_chatroom_id_id", "chatroom_id", "id"),
+        # Only unfinished messages, so counting and reclaiming them stays cheap as history grows
+        Index(
+            "ix_messages_unfinished",
+            "status",
+            postgresql_where=text("status IN ('pending', 'processing')"),
+            sqlite_where=text("status IN ('pending', 'processing')"),
+        ),
+        # Monthly partitions on PostgreSQL; the partition key has to be part of the primary key
+        {"postgresql_partition_by": "RANGE (created_at)"} if MESSAGE_PARTITIONING else {},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey(Users.id), nullable=False)
     chatroom_id = Column(Integer, ForeignKey(Chatroom.id), nullable=False)
     content = Column(Text, nullable=False)
     response = Column(Text, nullable=True)  # Gemini API response
     status = Column(String(20), default="pending")  # pending, processing, completed, failed
-    created_at = Column(DateTime, default=datetime.now)
+    use_cache = Column(Boolean, nullable=False, default=True, server_default=true())  # prompt cache opt-out
+    created_at = Column(DateTime, default=datetime.now, primary_key=MESSAGE_PARTITIONING)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # Messages are still identified by id alone when created_at is part of the table's key
+    __mapper_args__ = {"primary_key": [id]}
+
+
+class ChatroomSummary(Base):
+    __tablename__ = "chatroom_summaries"
+
+    chatroom_id = Column(Integer, ForeignKey(Chatroom.id), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    summarized_through_id = Column(Integer, nullable=False, default=0)  # last message folded into the summary
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class MessageArchiveBlock(Base):
+    """Where one chatroom's archived messages sit inside an archive segment file"""
+
+    __tablename__ = "message_archive_blocks"
+    __table_args__ = (Index("ix_message_archive_blocks_chatroom_id_last_id", "chatroom_id", "last_id"),)
+
+    id = Column(Integer, primary_key=True)
+    chatroom_id = Column(Integer, ForeignKey(Chatroom.id), nullable=False)
+    segment = Column(String(255), nullable=False)  # file name inside MESSAGE_ARCHIVE_DIR
+    byte_offset = Column(BigInteger, nullable=False)
+    length = Column(Integer, nullable=False)  # compressed size
+    first_id = Column(Integer, nullable=False)
+    last_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
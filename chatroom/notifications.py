@@ -0,0 +1,186 @@
+import asyncio
+import os
+from typing import Dict, Optional, Set
+
+import orjson
+from fastapi import WebSocket, status
+from starlette.websockets import WebSocketDisconnect
+
+from database.cache import get_async_redis_client
+from middleware.metrics import Gauge
+
+# Push notification configuration
+MESSAGE_EVENTS_CHANNEL = os.getenv("MESSAGE_EVENTS_CHANNEL", "chatroom:message_events")
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))
+# Events buffered per socket; a client that falls this far behind is disconnected
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+
+
+class SlowConsumerError(Exception):
+    """Raised when a socket's send queue overflows"""
+
+
+class Connection:
+    """One connected socket and the events waiting to be sent to it"""
+
+    def __init__(self, websocket: WebSocket, user_id: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event: bytes):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Never block the fan-out on one slow client
+            self.overflowed = True
+
+    async def send_loop(self):
+        """Send queued events, with a ping whenever the socket has been idle for WS_HEARTBEAT_INTERVAL"""
+        while True:
+            if self.overflowed:
+                raise SlowConsumerError(f"Send queue overflowed for user {self.user_id}")
+            try:
+                event = await asyncio.wait_for(self.queue.get(), timeout=WS_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                event = b'{"type":"ping"}'
+            await self.websocket.send_text(event.decode())
+
+
+class NotificationHub:
+    """
+    Fans message events out to this pod's WebSocket connections. One shared
+    Redis subscription per pod receives events published by any API pod or
+    worker, so the number of Redis connections does not grow with sockets.
+    """
+
+    def __init__(self):
+        self._connections: Dict[int, Set[Connection]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.disconnected_slow = 0
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self._connections.values())
+
+    def register(self, connection: Connection):
+        self._connections.setdefault(connection.user_id, set()).add(connection)
+
+    def unregister(self, connection: Connection):
+        connections = self._connections.get(connection.user_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self._connections[connection.user_id]
+
+    def deliver(self, user_id: int, event: bytes):
+        """Queue an event for every socket of a user connected to this pod"""
+        for connection in self._connections.get(user_id, ()):
+            connection.offer(event)
+            self.delivered += 1
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            try:
+                pubsub = get_async_redis_client().pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(MESSAGE_EVENTS_CHANNEL)
+                delay = 1.0
+                try:
+                    while True:
+                        message = await pubsub.get_message(timeout=1.0)
+                        if message is not None:
+                            event = message["data"]
+                            self.deliver(orjson.loads(event)["user_id"], event)
+                finally:
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: Message event subscription failed: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="notification-hub")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connection_count,
+            "delivered": self.delivered,
+            "disconnected_slow": self.disconnected_slow,
+        }
+
+
+notification_hub = NotificationHub()
+
+Gauge(
+    "websocket_connections",
+    "Message event sockets connected to this process",
+    lambda: notification_hub.connection_count,
+)
+
+
+async def publish_message_event(
+    user_id: int, chatroom_id: int, message_id: int, status: str, response: Optional[str] = None
+):
+    """
+    Announce that a message finished. Falls back to this pod's own sockets
+    when Redis is unreachable.
+    """
+    event = orjson.dumps(
+        {
+            "type": "message",
+            "user_id": user_id,
+            "chatroom_id": chatroom_id,
+            "message_id": message_id,
+            "status": status,
+            "response": response,
+        }
+    )
+    try:
+        await get_async_redis_client().publish(MESSAGE_EVENTS_CHANNEL, event)
+    except Exception as e:
+        print(f"Warning: Failed to publish event for message {message_id}: {e}")
+        notification_hub.deliver(user_id, event)
+
+
+async def serve_connection(websocket: WebSocket, user_id: int):
+    """
+    Push a user's message events to an accepted socket until either side
+    disconnects or the client stops keeping up
+    """
+    connection = Connection(websocket, user_id)
+    notification_hub.register(connection)
+
+    async def receive_loop():
+        # Client frames are ignored; reading them is how a disconnect is noticed
+        while True:
+            await websocket.receive_text()
+
+    sender = asyncio.create_task(connection.send_loop())
+    receiver = asyncio.create_task(receive_loop())
+    try:
+        done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        if sender in done and isinstance(sender.exception(), SlowConsumerError):
+            notification_hub.disconnected_slow += 1
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        notification_hub.unregister(connection)
+        for task in (sender, receiver):
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Retrieve the disconnect so it is not reported as unhandled
+                task.exception()
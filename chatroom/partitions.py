@@ -0,0 +1,71 @@
+import os
+from datetime import date, datetime
+from typing import List
+
+from sqlalchemy import text
+
+# PostgreSQL only: keep messages in one partition per month of created_at.
+# Must match how the table was created (see documentation.md for migrating an existing table).
+MESSAGE_PARTITIONING = os.getenv("MESSAGE_PARTITIONING", "false").lower() == "true"
+# Monthly partitions created ahead of time, so inserts never fall through to the default partition
+MESSAGE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", "3"))
+
+PARTITION_PREFIX = "messages_p"
+
+
+def _month_start(day: date, months: int = 0) -> date:
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+async def ensure_partitions(db, now: datetime = None, ahead: int = MESSAGE_PARTITIONS_AHEAD) -> List[str]:
+    """Create the default partition and monthly partitions from this month to ``ahead`` months out"""
+    month = _month_start(now or datetime.now())
+    await db.execute(text("CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT"))
+    created = []
+    for months in range(ahead + 1):
+        start, end = _month_start(month, months), _month_start(month, months + 1)
+        name = partition_name(start)
+        await db.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        )
+        created.append(name)
+    await db.commit()
+    return created
+
+
+async def drop_empty_partitions(db, cutoff: datetime) -> List[str]:
+    """
+    Drop monthly partitions that end before ``cutoff`` and hold no rows,
+    i.e. whose messages have all been archived. Dropping a partition is
+    instant and leaves no dead tuples behind, unlike deleting its rows.
+    """
+    names = await db.scalars(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = 'messages'"
+        )
+    )
+    dropped = []
+    for name in sorted(names):
+        suffix = name[len(PARTITION_PREFIX) :]
+        if not name.startswith(PARTITION_PREFIX) or not suffix.isdigit():
+            continue
+        end = _month_start(date(int(suffix[:4]), int(suffix[4:]), 1), 1)
+        if datetime.combine(end, datetime.min.time()) > cutoff:
+            continue
+        if await db.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name})")):
+            continue
+        await db.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    await db.commit()
+    return dropped
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Union
+
+import orjson
+
+from database.cache import AsyncCacheService
+from middleware.metrics import CallbackCounter
+
+from .gemini import GEMINI_API_URL
+
+# Prompt-response cache configuration
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "50000"))
+# How long another process may hold the single-flight lease for a prompt
+PROMPT_CACHE_LEASE_TTL = int(os.getenv("PROMPT_CACHE_LEASE_TTL", "60"))
+PROMPT_CACHE_POLL_INTERVAL = float(os.getenv("PROMPT_CACHE_POLL_INTERVAL", "0.1"))
+
+PROMPT_CACHE_INDEX_KEY = "prompt_cache:lru"
+
+_whitespace = re.compile(r"\s+")
+
+
+def _normalize(contents: Union[str, List[dict]]) -> list:
+    if isinstance(contents, str):
+        contents = [{"parts": [{"text": contents}]}]
+    return [
+        {
+            "role": turn.get("role", "user"),
+            "text": " ".join(_whitespace.sub(" ", part.get("text", "")).strip() for part in turn.get("parts", [])),
+        }
+        for turn in contents
+    ]
+
+
+def prompt_hash(contents: Union[str, List[dict]], model: str = GEMINI_API_URL) -> str:
+    """Stable hash of a prompt (whitespace-normalized) and the model it is sent to"""
+    body = orjson.dumps({"model": model, "contents": _normalize(contents)}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(body).hexdigest()
+
+
+def get_cache_key_prompt(digest: str) -> str:
+    """Generate cache key for a cached Gemini response"""
+    return f"prompt_cache:{digest}"
+
+
+class PromptCache:
+    """
+    Redis-backed cache of Gemini responses keyed by prompt hash, with
+    single-flight coalescing: concurrent identical prompts in this process
+    share one in-flight call, and across processes a short Redis lease makes
+    the others wait for the first caller's result.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def _wait_for_remote(self, key: str):
+        """Poll for the result of a call another process holds the lease for"""
+        deadline = time.monotonic() + PROMPT_CACHE_LEASE_TTL
+        while time.monotonic() < deadline:
+            cached = await AsyncCacheService.get(key)
+            if cached is not None:
+                return cached
+            # Lease released (or Redis unreachable) without a result
+            if await AsyncCacheService.get(key + ":lease", local=False) is None:
+                return None
+            await asyncio.sleep(PROMPT_CACHE_POLL_INTERVAL)
+        return None
+
+    async def get_or_generate(self, contents: Union[str, List[dict]], generate: Callable[[], Awaitable[str]]) -> str:
+        digest = prompt_hash(contents)
+        key = get_cache_key_prompt(digest)
+
+        cached = await AsyncCacheService.get(key)
+        if cached is not None:
+            self.hits += 1
+            await AsyncCacheService.track_lru(PROMPT_CACHE_INDEX_KEY, key, PROMPT_CACHE_MAX_ENTRIES)
+            return cached
+
+        # Identical prompt already in flight in this process
+        pending = self._in_flight.get(digest)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[digest] = future
+        try:
+            if not await AsyncCacheService.add_if_absent(key + ":lease", 1, expire=PROMPT_CACHE_LEASE_TTL):
+                result = await self._wait_for_remote(key)
+                if result is not None:
+                    self.coalesced += 1
+                    future.set_result(result)
+                    return result
+
+            self.misses += 1
+            try:
+                result = await generate()
+            finally:
+                await AsyncCacheService.delete(key + ":lease")
+            await AsyncCacheService.set(key, result, expire=PROMPT_CACHE_TTL)
+            await AsyncCacheService.track_lru(PROMPT_CACHE_INDEX_KEY, key, PROMPT_CACHE_MAX_ENTRIES)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            if not future.done():
+                error = e if isinstance(e, Exception) else RuntimeError("Coalesced Gemini call was cancelled")
+                future.set_exception(error)
+                # Mark the exception retrieved in case nobody was waiting on it
+                future.exception()
+            raise
+        finally:
+            self._in_flight.pop(digest, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "saved_calls": self.hits + self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+prompt_cache = PromptCache()
+
+CallbackCounter(
+    "prompt_cache_lookups_total",
+    "Prompt cache lookups by result",
+    lambda: {("hit",): prompt_cache.hits, ("miss",): prompt_cache.misses, ("coalesced",): prompt_cache.coalesced},
+    ("result",),
+)
@@ -0,0 +1,251 @@
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+
+from .gemini import GeminiAPIError
+
+# Adaptive concurrency (AIMD) configuration
+GEMINI_CONCURRENCY_INITIAL = float(os.getenv("GEMINI_CONCURRENCY_INITIAL", "10"))
+GEMINI_CONCURRENCY_MIN = float(os.getenv("GEMINI_CONCURRENCY_MIN", "1"))
+GEMINI_CONCURRENCY_MAX = float(os.getenv("GEMINI_CONCURRENCY_MAX", "100"))
+GEMINI_CONCURRENCY_BACKOFF = float(os.getenv("GEMINI_CONCURRENCY_BACKOFF", "0.7"))
+GEMINI_LATENCY_TARGET = float(os.getenv("GEMINI_LATENCY_TARGET", "20"))
+
+# Retry configuration
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "30"))
+
+# Hedged requests are disabled unless a delay is configured
+GEMINI_HEDGE_DELAY = float(os.getenv("GEMINI_HEDGE_DELAY", "0"))
+
+# Circuit breaker configuration
+GEMINI_BREAKER_FAILURE_THRESHOLD = int(os.getenv("GEMINI_BREAKER_FAILURE_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+# Defer messages while the breaker is open instead of failing them
+GEMINI_BREAKER_DEFER = os.getenv("GEMINI_BREAKER_DEFER", "true").lower() == "true"
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when Gemini calls are short-circuited because the breaker is open"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Gemini circuit open, retry in {retry_after:.1f}s")
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, GeminiAPIError):
+        return error.status in RETRYABLE_STATUSES
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def is_overload(error: Exception) -> bool:
+    """Whether an error signals that Gemini wants less traffic"""
+    if isinstance(error, GeminiAPIError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, asyncio.TimeoutError)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit: grows by roughly one slot per limit's worth of
+    successful calls and shrinks multiplicatively on overload signals
+    (429/5xx, timeouts or latency above the target).
+    """
+
+    def __init__(
+        self,
+        initial: float = GEMINI_CONCURRENCY_INITIAL,
+        minimum: float = GEMINI_CONCURRENCY_MIN,
+        maximum: float = GEMINI_CONCURRENCY_MAX,
+        backoff: float = GEMINI_CONCURRENCY_BACKOFF,
+        latency_target: float = GEMINI_LATENCY_TARGET,
+    ):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, overloaded: bool):
+        if overloaded or latency > self.latency_target:
+            # Decrease at most once per round trip so a burst of errors from the
+            # same window does not collapse the limit to the minimum
+            now = time.monotonic()
+            if now - self._last_decrease > latency:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and fast-fails calls
+    for ``cooldown`` seconds, then lets a single probe through (half-open).
+    """
+
+    def __init__(
+        self, failure_threshold: int = GEMINI_BREAKER_FAILURE_THRESHOLD, cooldown: float = GEMINI_BREAKER_COOLDOWN
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError if the call should not go out; returns whether the call is the probe"""
+        if self.state == "closed":
+            return False
+        remaining = self.opened_at + self.cooldown - time.monotonic()
+        if remaining > 0:
+            raise CircuitOpenError(remaining)
+        if self._probe_in_flight:
+            raise CircuitOpenError(self.cooldown)
+        self.state = "half_open"
+        self._probe_in_flight = True
+        return True
+
+    def release_probe(self):
+        """Let the next call probe again after a probe ended without a verdict (e.g. it was cancelled)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+    delay = random.uniform(0, min(GEMINI_RETRY_MAX_DELAY, GEMINI_RETRY_BASE_DELAY * 2**attempt))
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after:
+        delay = max(delay, min(retry_after, GEMINI_RETRY_MAX_DELAY))
+    return delay
+
+
+class ResilientCaller:
+    """
+    Wraps an async call with the circuit breaker, the adaptive limiter,
+    retries and (optionally) hedging.
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[AdaptiveLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_retries: int = GEMINI_MAX_RETRIES,
+        hedge_delay: float = GEMINI_HEDGE_DELAY,
+    ):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.hedge_delay = hedge_delay
+
+    async def _attempt(self, call: Callable[[], Awaitable[str]]) -> str:
+        probe = self.breaker.before_call()
+        try:
+            await self.limiter.acquire()
+            started = time.monotonic()
+            overloaded = False
+            try:
+                result = await call()
+                self.breaker.record_success()
+                return result
+            except Exception as e:
+                overloaded = is_overload(e)
+                if is_retryable(e):
+                    self.breaker.record_failure()
+                elif isinstance(e, GeminiAPIError):
+                    # Gemini answered; the request was at fault, not the service
+                    self.breaker.record_success()
+                raise
+            finally:
+                await self.limiter.release(time.monotonic() - started, overloaded)
+        finally:
+            # Covers cancellation and any other exit that recorded nothing
+            if probe:
+                self.breaker.release_probe()
+
+    async def _hedged(self, call: Callable[[], Awaitable[str]]) -> str:
+        """Send a second copy of a slow request and keep whichever finishes first"""
+        primary = asyncio.ensure_future(self._attempt(call))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(self._attempt(call))
+        tasks = {primary, hedge}
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # Both failed, surface the primary's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, call: Callable[[], Awaitable[str]], hedge: bool = True) -> str:
+        attempt = 0
+        while True:
+            try:
+                if hedge and self.hedge_delay > 0:
+                    return await self._hedged(call)
+                return await self._attempt(call)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, e))
+                attempt += 1
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": self.limiter.limit,
+            "in_flight": self.limiter.in_flight,
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+        }
+
+
+gemini_caller = ResilientCaller()
@@ -1,74 +1,211 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from typing import Optional
 
-from auth.models import Users
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.identity import CurrentUser
+from auth.services import verify_token
 from database.db_connection import get_db
-from middleware.dependencies import get_current_user
+from middleware.dependencies import get_current_user, get_read_db
+from middleware.rate_limit import RATE_LIMIT_MESSAGE, RATE_LIMIT_MESSAGE_ROUTE, RateLimit
 
 from . import schemas, services
 from .models import Message
-from .schemas import MessageCreate, MessageResponse
+from .notifications import serve_connection
+from .scheduler import QueueUnavailableError
+from .streaming import FINAL_STATUSES, follow_response
+from .schemas import MessageCreate, MessageListResponse, MessageResponse
 
 router = APIRouter()
 
+message_rate_limit = RateLimit(
+    "message", per_caller=RATE_LIMIT_MESSAGE, per_route=RATE_LIMIT_MESSAGE_ROUTE, backlog=services.message_backlog
+)
+
 
 @router.post("/chatroom", response_model=schemas.ChatroomResponse)
-def create_chatroom(current_user=Depends(get_current_user), db: Session = Depends(get_db)):
-    phone = current_user["phone"]
-    print("phone", phone)
-    user = db.query(Users).filter(Users.phone == phone).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    chatroom = services.create_chatroom(db, user_id=int(user.id))
+async def create_chatroom(current_user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    chatroom = await services.create_chatroom(db, user_id=current_user.id)
     return chatroom
 
 
+@router.post("/chatroom/batch", response_model=schemas.ChatroomBatchResponse)
+async def create_chatrooms(
+    batch: schemas.ChatroomBatchCreate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Create several chatrooms in one request"""
+    if batch.count > services.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {services.BATCH_MAX_ITEMS} chatrooms per batch")
+
+    chatrooms = await services.create_chatrooms(db, user_id=current_user.id, count=batch.count)
+    return schemas.ChatroomBatchResponse(chatrooms=chatrooms)
+
+
 @router.get("/chatroom", response_model=schemas.ChatroomListResponse)
-def get_chatrooms(current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_chatrooms(current_user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
     """Get all chatrooms for the authenticated user with caching"""
-    phone = current_user["phone"]
-    user = db.query(Users).filter(Users.phone == phone).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
-    chatrooms = services.get_user_chatrooms(db, user_id=int(user.id))
+    # The body is already rendered JSON; skip response_model validation and serialization
+    body = await services.get_user_chatrooms_json(db, user_id=current_user.id)
 
-    return schemas.ChatroomListResponse(chatrooms=chatrooms, total_count=len(chatrooms))
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/chatroom/{chatroom_id}", response_model=schemas.ChatroomResponse)
-def get_chatroom(chatroom_id: int, current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_chatroom(
+    chatroom_id: int, current_user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)
+):
     """Get detailed information about a specific chatroom"""
-    phone = current_user["phone"]
-    user = db.query(Users).filter(Users.phone == phone).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
     try:
-        chatroom = services.get_chatroom_by_id(db, chatroom_id=chatroom_id, user_id=int(user.id))
+        chatroom = await services.get_chatroom_by_id(db, chatroom_id=chatroom_id, user_id=current_user.id)
         return chatroom
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chatroom not found or access denied")
 
 
-@router.post("/chatroom/{chatroom_id}/message", response_model=MessageResponse)
-def send_message(
-    chatroom_id: int, message: MessageCreate, current_user=Depends(get_current_user), db: Session = Depends(get_db)
+@router.post(
+    "/chatroom/{chatroom_id}/message", response_model=MessageResponse, dependencies=[Depends(message_rate_limit)]
+)
+async def send_message(
+    chatroom_id: int,
+    message: MessageCreate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Send a message to a chatroom and process it asynchronously with Gemini API.
     """
-    phone = current_user["phone"]
-    user = db.query(Users).filter(Users.phone == phone).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
     # Check chatroom ownership
-    chatroom = db.query(services.Chatroom).filter_by(id=chatroom_id, user_id=user.id).first()
+    chatroom = await db.scalar(
+        select(services.Chatroom).where(
+            services.Chatroom.id == chatroom_id, services.Chatroom.user_id == current_user.id
+        )
+    )
     if not chatroom:
         raise HTTPException(status_code=404, detail="Chatroom not found or access denied")
 
     # Save message and start async processing
-    db_message = services.save_message_and_process_async(db, int(user.id), chatroom_id, message.content)
+    try:
+        db_message = await services.save_message_and_process_async(
+            db, current_user.id, chatroom_id, message.content, use_cache=message.use_cache
+        )
+    except QueueUnavailableError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Message queue is unavailable, please retry later",
+            headers={"Retry-After": "5"},
+        )
 
     return db_message
+
+
+@router.post("/chatroom/message/batch", response_model=schemas.MessageBatchResponse)
+async def send_messages(
+    batch: schemas.MessageBatchCreate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Send several messages, to one or more of the user's chatrooms, in one
+    request. Each message is reported separately; one failing does not fail
+    the others.
+    """
+    if len(batch.messages) > services.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {services.BATCH_MAX_ITEMS} messages per batch")
+    # Counts against the message rate limit like the same number of single sends
+    await message_rate_limit.check(f"user:{current_user.id}", cost=len(batch.messages))
+
+    results = await services.save_messages_and_process_async(
+        db, current_user.id, [item.model_dump() for item in batch.messages]
+    )
+
+    accepted = sum(1 for _, error in results if error is None)
+    return schemas.MessageBatchResponse(
+        results=[schemas.MessageBatchResult(message=message, error=error) for message, error in results],
+        accepted=accepted,
+        failed=len(results) - accepted,
+    )
+
+
+@router.get("/chatroom/{chatroom_id}/messages", response_model=MessageListResponse, response_model_exclude_unset=True)
+async def get_messages(
+    chatroom_id: int,
+    before: Optional[int] = Query(None, description="Cursor from the previous page's next_cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    fields: Optional[str] = Query(None, description="Comma-separated message fields to return"),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Get a chatroom's messages newest first, paginated by cursor"""
+    try:
+        chatroom = await services.get_chatroom_by_id(db, chatroom_id=chatroom_id, user_id=current_user.id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chatroom not found or access denied")
+
+    field_list = None
+    if fields:
+        field_list = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(field_list) - set(services.MESSAGE_LIST_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    messages, next_cursor = await services.get_chatroom_messages(
+        db, chatroom, before=before, limit=limit, fields=field_list
+    )
+
+    return MessageListResponse(messages=messages, total_count=int(chatroom.message_count or 0), next_cursor=next_cursor)
+
+
+@router.get("/chatroom/{chatroom_id}/message/{message_id}/stream")
+async def stream_message(
+    chatroom_id: int,
+    message_id: int,
+    offset: int = Query(0, ge=0),
+    last_event_id: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Stream a message's Gemini response as server-sent events. Reconnecting
+    clients resume from ``offset`` or the ``Last-Event-ID`` header.
+    """
+    try:
+        message = await services.get_message_for_user(
+            db, chatroom_id=chatroom_id, message_id=message_id, user_id=current_user.id
+        )
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found or access denied")
+
+    if last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+
+    finished = (message.response or "", message.status) if message.status in FINAL_STATUSES else None
+    return StreamingResponse(
+        follow_response(message_id, offset, finished),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws/messages")
+async def message_events(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """
+    Push ``completed``/``failed`` events for the user's messages in any
+    chatroom. Authenticate with ``?token=`` or an ``Authorization: Bearer`` header.
+    """
+    if token is None:
+        authorization = websocket.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[len("bearer ") :]
+
+    try:
+        user_id = int((await verify_token(token or ""))["sub"])
+    except (ValueError, KeyError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await serve_connection(websocket, user_id)
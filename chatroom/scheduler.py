@@ -0,0 +1,166 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+# Scheduler configuration
+MESSAGE_WORKER_CONCURRENCY = int(os.getenv("MESSAGE_WORKER_CONCURRENCY", "8"))
+MESSAGE_QUEUE_MAX_DEPTH = int(os.getenv("MESSAGE_QUEUE_MAX_DEPTH", "1000"))
+MESSAGE_SHUTDOWN_TIMEOUT = float(os.getenv("MESSAGE_SHUTDOWN_TIMEOUT", "30"))
+
+
+class QueueUnavailableError(Exception):
+    """Raised when a message cannot be handed off for processing"""
+
+
+class SchedulerFullError(QueueUnavailableError):
+    """Raised when the scheduler queue is at its depth limit"""
+
+
+class SchedulerNotRunningError(QueueUnavailableError):
+    """Raised when work is submitted to a scheduler that is not running"""
+
+
+class DeferMessage(Exception):
+    """Raised by a handler to have its message retried after ``delay`` seconds"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        super().__init__(f"Message deferred for {delay:.1f}s")
+
+
+class MessageScheduler:
+    """
+    Bounded pool of async workers fed from per-user queues.
+
+    Work is scheduled round-robin across users so one user with a large backlog
+    cannot starve everybody else. ``submit`` is thread-safe so it can be called
+    from FastAPI's threadpool handlers as well as from the event loop itself.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[int], Awaitable[None]],
+        concurrency: int = MESSAGE_WORKER_CONCURRENCY,
+        max_queue_depth: int = MESSAGE_QUEUE_MAX_DEPTH,
+    ):
+        self._handler = handler
+        self.concurrency = concurrency
+        self.max_queue_depth = max_queue_depth
+
+        self._lock = threading.Lock()
+        self._depth = 0  # queued + in-flight items
+        self._in_flight = 0
+        self._accepting = False
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready: Optional[asyncio.Queue] = None  # user ids with queued work
+        self._pending: Dict[int, Deque[int]] = {}
+        self._workers: List[asyncio.Task] = []
+        self._idle: Optional[asyncio.Event] = None
+
+    @property
+    def depth(self) -> int:
+        """Number of messages queued or being processed"""
+        return self._depth
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    async def start(self):
+        """Start the worker pool on the running event loop"""
+        if self._workers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"message-worker-{i}") for i in range(self.concurrency)
+        ]
+        self._accepting = True
+
+    def submit(self, user_id: int, message_id: int):
+        """
+        Queue a message for processing. Raises SchedulerFullError when the queue
+        is at its depth limit.
+        """
+        with self._lock:
+            if not self._accepting or self._loop is None:
+                raise SchedulerNotRunningError("Message scheduler is not running")
+            if self._depth >= self.max_queue_depth:
+                raise SchedulerFullError("Message queue is full")
+            self._depth += 1
+        self._loop.call_soon_threadsafe(self._enqueue, user_id, message_id)
+
+    def _enqueue(self, user_id: int, message_id: int):
+        self._idle.clear()
+        queue = self._pending.get(user_id)
+        if queue is None:
+            queue = self._pending[user_id] = deque()
+            self._ready.put_nowait(user_id)
+        queue.append(message_id)
+
+    def _next(self, user_id: int) -> int:
+        """Pop the next message for a user and rotate the user to the back of the line"""
+        queue = self._pending[user_id]
+        message_id = queue.popleft()
+        if queue:
+            self._ready.put_nowait(user_id)
+        else:
+            del self._pending[user_id]
+        return message_id
+
+    async def _worker(self):
+        while True:
+            user_id = await self._ready.get()
+            message_id = self._next(user_id)
+            self._in_flight += 1
+            deferred = False
+            try:
+                await self._handler(message_id)
+            except DeferMessage as e:
+                # Still counted in the depth until it runs again
+                deferred = True
+                self._loop.call_later(e.delay, self._enqueue, user_id, message_id)
+            except Exception as e:
+                print(f"Error processing message {message_id}: {e}")
+            finally:
+                self._in_flight -= 1
+                if not deferred:
+                    self._done()
+
+    def _done(self):
+        """Account for a message that finished (or was abandoned) and will not run again"""
+        with self._lock:
+            self._depth -= 1
+            drained = self._depth == 0
+        if drained:
+            self._idle.set()
+
+    async def stop(self, timeout: float = MESSAGE_SHUTDOWN_TIMEOUT):
+        """Stop accepting work, drain what is queued and shut the workers down"""
+        with self._lock:
+            self._accepting = False
+        if not self._workers:
+            return
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"Message scheduler shutdown timed out with {self._depth} messages outstanding")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._pending.clear()
+        with self._lock:
+            self._depth = 0
+        self._in_flight = 0
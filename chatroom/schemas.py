@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class ChatroomCreate(BaseModel):
@@ -25,8 +25,25 @@ class ChatroomListResponse(BaseModel):
         from_attributes = True
 
 
+class ChatroomBatchCreate(BaseModel):
+    count: int = Field(ge=1)
+
+
+class ChatroomBatchResponse(BaseModel):
+    chatrooms: List[ChatroomResponse]
+
+
 class MessageCreate(BaseModel):
     content: str
+    use_cache: bool = True  # allow answering from the prompt-response cache
+
+
+class MessageBatchItem(MessageCreate):
+    chatroom_id: int
+
+
+class MessageBatchCreate(BaseModel):
+    messages: List[MessageBatchItem] = Field(min_length=1)
 
 
 class MessageResponse(BaseModel):
@@ -43,9 +60,39 @@ class MessageResponse(BaseModel):
         from_attributes = True
 
 
+class MessageBatchResult(BaseModel):
+    """Outcome of one item of a batch send; ``message`` is set once the message was saved"""
+
+    message: Optional[MessageResponse] = None
+    error: Optional[str] = None
+
+
+class MessageBatchResponse(BaseModel):
+    results: List[MessageBatchResult]
+    accepted: int
+    failed: int
+
+
+class MessageListItem(BaseModel):
+    """Message in a history page; fields left out of the projection are omitted"""
+
+    id: int
+    user_id: Optional[int] = None
+    chatroom_id: Optional[int] = None
+    content: Optional[str] = None
+    response: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class MessageListResponse(BaseModel):
-    messages: List[MessageResponse]
+    messages: List[MessageListItem]
     total_count: int
+    next_cursor: Optional[int] = None
 
     class Config:
         from_attributes = True
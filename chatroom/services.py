@@ -1,160 +1,425 @@
 import asyncio
 import os
-import threading
-from datetime import datetime
-from typing import List
-
-import aiohttp
-from sqlalchemy.orm import Session
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Dict, List, Optional, Tuple, Union
+
+import orjson
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.cache import AsyncCacheService, get_cache_key_user_chatrooms, tag_user
+from database.db_connection import session_scope
+from database.replicas import replica_router
+from middleware.metrics import Gauge
+
+from .archive import MESSAGE_ARCHIVE_ENABLED, get_archived_message, get_archived_messages
+from .context import build_contents, fold_summary
+from .gemini import GEMINI_API_KEY, gemini_client
+from .message_queue import enqueue_message, enqueue_messages, stream_backlog
+from .models import Chatroom, Message
+from .notifications import publish_message_event
+from .prompt_cache import PROMPT_CACHE_ENABLED, prompt_cache
+from .resilience import GEMINI_BREAKER_DEFER, CircuitOpenError, gemini_caller
+from .scheduler import DeferMessage, MessageScheduler, QueueUnavailableError
+from .streaming import GEMINI_STREAMING, ResponseStream, live_streams
+from .write_behind import (
+    MESSAGE_INSERT_BATCHING,
+    WRITE_BEHIND_ENABLED,
+    message_insert_batcher,
+    message_write_behind,
+)
+
+# "local" processes messages on the in-process scheduler, "stream" hands them to the worker fleet
+MESSAGE_DISPATCH = os.getenv("MESSAGE_DISPATCH", "local")
+# Send chatroom history (recent turns plus a rolling summary) with each message
+CONTEXT_ENABLED = os.getenv("CONTEXT_ENABLED", "true").lower() == "true"
+# Messages stuck in processing for longer than this are considered abandoned
+MESSAGE_PROCESSING_TIMEOUT = int(os.getenv("MESSAGE_PROCESSING_TIMEOUT", "300"))
+# Most chatrooms or messages accepted by one batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "25"))
+
+
+async def call_gemini_api_async(text: Union[str, List[dict]]) -> str:
+    """
+    Call Gemini API asynchronously through the shared client, with retries,
+    adaptive concurrency and the circuit breaker applied
+    """
+    if not GEMINI_API_KEY:
+        raise ValueError("API key not configured. Please set GEMINI_API_KEY environment variable")
 
-from database.cache import CacheService, get_cache_key_user_chatrooms
-from database.db_connection import SessionLocal
+    return await gemini_caller.call(lambda: gemini_client.generate(text))
 
-from .models import Chatroom, Message
 
-# Gemini API configuration
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+class StreamInterruptedError(Exception):
+    """Raised when a streamed generation fails after chunks were already delivered"""
 
 
-async def call_gemini_api_async(text: str) -> str:
+async def stream_gemini_api_async(message_id: int, text: Union[str, List[dict]], stream: ResponseStream) -> str:
     """
-    Call Gemini API asynchronously
+    Call Gemini's streaming API, feeding chunks into ``stream`` as they arrive and
+    flushing the partial response to the database in periodic batches
     """
     if not GEMINI_API_KEY:
-        return "[Gemini API Error: API key not configured. Please set GEMINI_API_KEY environment variable]"
+        raise ValueError("API key not configured. Please set GEMINI_API_KEY environment variable")
 
-    headers = {
-        "Content-Type": "application/json",
-        "X-goog-api-key": GEMINI_API_KEY,
-    }
-    data = {"contents": [{"parts": [{"text": text}]}]}
+    async def generate() -> str:
+        stream.reset()
+        try:
+            async for chunk in gemini_client.stream_generate(text):
+                stream.append(chunk)
+                if stream.flush_due():
+                    stream.mark_flushed()
+                    await _save_partial_response(message_id, stream.text)
+        except Exception as e:
+            # Chunks already reached clients, so the call cannot be transparently retried
+            if stream.length:
+                raise StreamInterruptedError(str(e)) from e
+            raise
+        return stream.text
+
+    # Hedging would run two generations into the same stream
+    return await gemini_caller.call(generate, hedge=False)
+
+
+def _claimable():
+    """Filter for messages nobody is currently working on"""
+    stale_before = datetime.now() - timedelta(seconds=MESSAGE_PROCESSING_TIMEOUT)
+    return or_(
+        Message.status == "pending",
+        and_(Message.status == "processing", Message.updated_at < stale_before),
+    )
+
+
+async def _start_processing(message_id: int) -> Optional[Tuple[str, int, bool, int]]:
+    """
+    Claim a message for processing and return its content, chatroom id,
+    whether it may be answered from the prompt cache, and its user id.
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(GEMINI_API_URL, headers=headers, json=data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result["candidates"][0]["content"]["parts"][0]["text"]
-                else:
-                    return f"[Gemini API Error: {response.status}]"
-    except Exception as e:
-        return f"[Gemini API Error: {str(e)}]"
+    The claim is a conditional update so a message delivered twice (stream
+    redelivery, startup recovery) is only processed once.
+    """
+    async with session_scope() as db:
+        # Claim and read back the columns in a single round trip
+        row = (
+            await db.execute(
+                update(Message)
+                .where(Message.id == message_id, _claimable())
+                .values(status="processing", updated_at=datetime.now())
+                .returning(Message.content, Message.chatroom_id, Message.use_cache, Message.user_id)
+                .execution_options(synchronize_session=False)
+            )
+        ).first()
+        await db.commit()
+        return (row.content, row.chatroom_id, row.use_cache, row.user_id) if row else None
+
+
+async def _save_partial_response(message_id: int, response: str):
+    """
+    Store the response generated so far for a message that is still processing
+    """
+    if WRITE_BEHIND_ENABLED:
+        message_write_behind.update(message_id, response=response)
+        return
+
+    async with session_scope() as db:
+        await db.execute(
+            update(Message)
+            .where(Message.id == message_id, Message.status == "processing")
+            .values(response=response, updated_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def _finish_processing(message_id: int, status: str, response: Optional[str] = None, wait: bool = False):
+    """
+    Store the outcome of processing a message. Unless ``wait`` is set, the
+    update goes through the write-behind buffer and is flushed in a batch.
+    Either way it is committed when this returns, so clients told about the
+    outcome afterwards read it from the database too.
+    """
+    values = {"status": status, "updated_at": datetime.now()}
+    if response is not None:
+        values["response"] = response
+
+    if WRITE_BEHIND_ENABLED:
+        if wait:
+            await message_write_behind.write_now(message_id, **values)
+        else:
+            await message_write_behind.write(message_id, **values)
+        return
+
+    async with session_scope() as db:
+        await db.execute(
+            update(Message)
+            .where(Message.id == message_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
 
 
 async def process_message_async(message_id: int):
     """
     Process a message asynchronously by calling Gemini API and updating the database
     """
-    db = SessionLocal()
+    claimed = await _start_processing(message_id)
+    if claimed is None:
+        return
+    message_content, chatroom_id, use_cache, user_id = claimed
+
+    # Register the response so SSE clients in this process can follow it live
+    stream = live_streams[message_id] = ResponseStream() if GEMINI_STREAMING else None
+    status = None
+    gemini_response = None
+    window_start_id = None
     try:
-        # Get the message
-        message = db.query(Message).filter(Message.id == message_id).first()
-        if not message:
-            return
-
-        # Update status to processing
-        message.status = "processing"
-        db.commit()
-        db.refresh(message)
-
-        # Call Gemini API with the message content
-        message_content = str(message.content)
-        gemini_response = await call_gemini_api_async(message_content)
+        # Call Gemini API with the message and as much chatroom history as fits the budget
+        if CONTEXT_ENABLED:
+            prompt, window_start_id = await build_contents(chatroom_id, message_id, message_content)
+        else:
+            prompt, window_start_id = message_content, None
+        if stream is not None:
+            generate = partial(stream_gemini_api_async, message_id, prompt, stream)
+        else:
+            generate = partial(call_gemini_api_async, prompt)
+
+        if PROMPT_CACHE_ENABLED and use_cache:
+            gemini_response = await prompt_cache.get_or_generate(prompt, generate)
+            # Cached and coalesced answers reach SSE followers in one chunk
+            if stream is not None and not stream.length:
+                stream.append(gemini_response)
+        else:
+            gemini_response = await generate()
 
         # Update message with response
-        message.response = gemini_response
-        message.status = "completed"
-        db.commit()
-
+        await _finish_processing(message_id, "completed", gemini_response)
+        status = "completed"
+    except CircuitOpenError as e:
+        if not GEMINI_BREAKER_DEFER:
+            await _finish_processing(message_id, "failed")
+            status = "failed"
+            print(f"Error processing message {message_id}: {e}")
+            return
+        # Gemini is unhealthy; put the message back and retry once the breaker may have closed.
+        # Written through so the row is claimable again before the retry fires
+        await _finish_processing(message_id, "pending", wait=True)
+        raise DeferMessage(e.retry_after)
     except Exception as e:
         # Update status to failed if there's an error
-        if "message" in locals() and message:
-            message.status = "failed"
-            db.commit()
+        await _finish_processing(message_id, "failed")
+        status = "failed"
         print(f"Error processing message {message_id}: {e}")
     finally:
-        db.close()
+        if stream is not None:
+            live_streams.pop(message_id, None)
+            if status is not None:
+                stream.finish(status)
+            else:
+                # Followers fall back to the database until the message runs again
+                stream.reset()
+        # Push the outcome to the user's WebSocket connections on every pod
+        if status is not None:
+            # Replicas may not have the outcome yet; the user's next reads go to the primary
+            if replica_router.enabled:
+                replica_router.mark_write(user_id)
+            await publish_message_event(
+                user_id, chatroom_id, message_id, status, gemini_response if status == "completed" else None
+            )
+
+    # Fold turns that slid out of the window into the summary for the next prompt
+    if status == "completed" and window_start_id is not None:
+        try:
+            await fold_summary(chatroom_id, window_start_id, call_gemini_api_async)
+        except Exception as e:
+            print(f"Warning: Failed to update summary for chatroom {chatroom_id}: {e}")
+
+
+# Long-lived worker pool, started and drained with the application lifespan
+message_scheduler = MessageScheduler(process_message_async)
+
+
+async def dispatch_message(user_id: int, message_id: int):
+    """
+    Hand a saved message off for processing
+    """
+    if MESSAGE_DISPATCH == "stream":
+        await asyncio.to_thread(enqueue_message, user_id, message_id)
+    else:
+        message_scheduler.submit(user_id, message_id)
 
 
-def run_async_in_thread(message_id: int):
+async def dispatch_messages(user_id: int, message_ids: List[int]) -> int:
     """
-    Run the async function in a separate thread with its own event loop
+    Hand several saved messages off for processing at once. Returns how many
+    were accepted; the rest were refused by a full or unavailable queue.
     """
+    if MESSAGE_DISPATCH == "stream":
+        try:
+            await asyncio.to_thread(enqueue_messages, user_id, message_ids)
+        except QueueUnavailableError:
+            return 0
+        return len(message_ids)
 
-    def run_async():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    for dispatched, message_id in enumerate(message_ids):
         try:
-            loop.run_until_complete(process_message_async(message_id))
-        finally:
-            loop.close()
+            message_scheduler.submit(user_id, message_id)
+        except QueueUnavailableError:
+            return dispatched
+    return len(message_ids)
+
+
+async def recover_unfinished_messages() -> int:
+    """
+    Re-submit messages left pending or stuck processing to the local scheduler,
+    e.g. after a restart lost its in-process queue. Messages still queued on
+    another pod may be submitted twice; processing claims rows, so only one
+    copy runs. Returns the number of messages submitted.
+    """
+    async with session_scope() as db:
+        unfinished = await get_unfinished_messages(db, limit=message_scheduler.max_queue_depth)
+
+    submitted = 0
+    for user_id, message_id in unfinished:
+        try:
+            message_scheduler.submit(user_id, message_id)
+        except QueueUnavailableError:
+            break
+        submitted += 1
+    if submitted:
+        print(f"Re-submitted {submitted} unfinished messages")
+    return submitted
+
+
+async def message_backlog() -> int:
+    """
+    Number of messages waiting to be processed, used for load shedding
+    """
+    if MESSAGE_DISPATCH == "stream":
+        return await stream_backlog()
+    return message_scheduler.depth
+
+
+async def _unfinished_messages() -> dict:
+    async with session_scope() as db:
+        counts = await count_unfinished_messages(db)
+    return {(status,): count for status, count in counts.items()}
+
+
+Gauge("messages_unfinished", "Messages by unfinished status, across all processes", _unfinished_messages, ("status",))
+Gauge("message_backlog", "Messages waiting to be processed (scheduler depth or stream lag)", message_backlog)
+
 
-    thread = threading.Thread(target=run_async)
-    thread.daemon = True
-    thread.start()
+async def mark_message_failed(message_id: int):
+    """
+    Give up on a message that cannot be processed
+    """
+    await _finish_processing(message_id, "failed", wait=True)
+
+
+async def get_unfinished_messages(db: AsyncSession, limit: int = 1000) -> List[Tuple[int, int]]:
+    """
+    Get (user_id, message_id) pairs for messages that still need processing
+    """
+    result = await db.execute(select(Message.user_id, Message.id).where(_claimable()).order_by(Message.id).limit(limit))
+    return [(int(user_id), int(message_id)) for user_id, message_id in result.all()]
 
 
-def create_chatroom(db: Session, user_id: int) -> Chatroom:
+async def count_unfinished_messages(db: AsyncSession) -> Dict[str, int]:
+    """
+    Number of pending and processing messages, served by the partial ix_messages_unfinished index
+    """
+    result = await db.execute(
+        select(Message.status, func.count())
+        .where(Message.status.in_(("pending", "processing")))
+        .group_by(Message.status)
+    )
+    counts = {"pending": 0, "processing": 0}
+    counts.update({status: count for status, count in result.all()})
+    return counts
+
+
+async def create_chatroom(db: AsyncSession, user_id: int) -> Chatroom:
     chatroom = Chatroom(user_id=user_id)
     db.add(chatroom)
-    db.commit()
-    db.refresh(chatroom)
+    await db.commit()
+    await db.refresh(chatroom)
 
-    # Invalidate cache for this user's chatrooms
-    cache_key = get_cache_key_user_chatrooms(user_id)
-    CacheService.delete(cache_key)
+    # Invalidate cached views of this user's chatrooms
+    await AsyncCacheService.invalidate_tags(tag_user(user_id))
 
     return chatroom
 
 
-def get_user_chatrooms(db: Session, user_id: int) -> List[Chatroom]:
-    """Get all chatrooms for a user with caching"""
+async def create_chatrooms(db: AsyncSession, user_id: int, count: int) -> List[Chatroom]:
+    """Create ``count`` chatrooms with one multi-row INSERT"""
+    result = await db.execute(
+        insert(Chatroom).returning(Chatroom, sort_by_parameter_order=True), [{"user_id": user_id}] * count
+    )
+    chatrooms = result.scalars().all()
+    await db.commit()
+
+    await AsyncCacheService.invalidate_tags(tag_user(user_id))
+
+    return chatrooms
+
+
+async def get_user_chatrooms_json(db: AsyncSession, user_id: int) -> bytes:
+    """
+    Get the rendered ``{"chatrooms": [...], "total_count": n}`` body for a
+    user's chatrooms. The body is cached as bytes, so a cache hit is returned
+    as-is without touching the ORM or pydantic.
+    """
     # Try to get from cache first
     cache_key = get_cache_key_user_chatrooms(user_id)
-    cached_data = CacheService.get(cache_key)
+    cached_body = await AsyncCacheService.get_bytes(cache_key)
+    if cached_body:
+        return cached_body
 
-    if cached_data:
-        # Convert cached data back to Chatroom objects
-        chatrooms = []
-        for chatroom_data in cached_data:
-            created_at = None
-            if chatroom_data["created_at"] is not None:
-                created_at = datetime.fromisoformat(chatroom_data["created_at"])
+    # If not in cache, get from database
+    rows = (
+        await db.execute(
+            select(Chatroom.id, Chatroom.user_id, Chatroom.created_at)
+            .where(Chatroom.user_id == user_id)
+            .order_by(Chatroom.id)
+        )
+    ).all()
+    body = orjson.dumps(
+        {
+            "chatrooms": [{"id": row.id, "user_id": row.user_id, "created_at": row.created_at} for row in rows],
+            "total_count": len(rows),
+        }
+    )
 
-            chatroom = Chatroom(id=chatroom_data["id"], user_id=chatroom_data["user_id"], created_at=created_at)
-            chatrooms.append(chatroom)
-        return chatrooms
+    # Cache the body for 5 minutes (Redis being unavailable is not a critical failure)
+    await AsyncCacheService.set_bytes(cache_key, body, expire=300, tags=[tag_user(user_id)])
 
-    # If not in cache, get from database
-    chatrooms = db.query(Chatroom).filter(Chatroom.user_id == user_id).all()
+    return body
 
-    # Try to cache the results for 5 minutes (but don't fail if Redis is unavailable)
-    try:
-        cache_data = []
-        for chatroom in chatrooms:
-            created_at_str = None
-            if chatroom.created_at is not None:
-                created_at_str = chatroom.created_at.isoformat()
-
-            cache_data.append(
-                {
-                    "id": chatroom.id,
-                    "user_id": chatroom.user_id,
-                    "created_at": created_at_str,
-                }
-            )
-        CacheService.set(cache_key, cache_data, expire=300)
-    except Exception as e:
-        print(f"Warning: Failed to cache chatrooms for user {user_id}: {e}")
-        # Continue without caching - this is not a critical failure
 
-    return chatrooms
+async def get_message_for_user(db: AsyncSession, chatroom_id: int, message_id: int, user_id: int) -> Message:
+    """Get a message in one of the user's chatrooms"""
+    message = await db.scalar(
+        select(Message).where(Message.id == message_id, Message.chatroom_id == chatroom_id, Message.user_id == user_id)
+    )
+
+    if not message and MESSAGE_ARCHIVE_ENABLED:
+        record = await get_archived_message(db, chatroom_id, message_id)
+        if record is not None and record["user_id"] == user_id:
+            # Transient instance; archived messages are read-only
+            message = Message(**record)
+
+    if not message:
+        raise ValueError("Message not found or access denied")
 
+    return message
 
-def get_chatroom_by_id(db: Session, chatroom_id: int, user_id: int) -> Chatroom:
+
+async def get_chatroom_by_id(db: AsyncSession, chatroom_id: int, user_id: int) -> Chatroom:
     """Get a specific chatroom by ID, ensuring the user has access to it"""
-    chatroom = db.query(Chatroom).filter(Chatroom.id == chatroom_id, Chatroom.user_id == user_id).first()
+    chatroom = await db.scalar(select(Chatroom).where(Chatroom.id == chatroom_id, Chatroom.user_id == user_id))
 
     if not chatroom:
         raise ValueError("Chatroom not found or access denied")
@@ -162,18 +427,153 @@ def get_chatroom_by_id(db: Session, chatroom_id: int, user_id: int) -> Chatroom:
     return chatroom
 
 
-def save_message_and_process_async(db: Session, user_id: int, chatroom_id: int, content: str) -> Message:
+MESSAGE_LIST_FIELDS = ("id", "user_id", "chatroom_id", "content", "response", "status", "created_at", "updated_at")
+
+
+async def get_chatroom_messages(
+    db: AsyncSession,
+    chatroom: Chatroom,
+    before: Optional[int] = None,
+    limit: int = 50,
+    fields: Optional[List[str]] = None,
+) -> Tuple[List[dict], Optional[int]]:
     """
-    Save a message to the database and start async processing in a background thread
+    Get a page of a chatroom's messages, newest first, using keyset pagination
+    on (chatroom_id, id). Returns the page and the cursor for the next one.
+    Pages running past the messages table continue into the archive.
     """
-    # Create message with pending status
-    db_message = Message(user_id=user_id, chatroom_id=chatroom_id, content=content, status="pending")
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    fields = ["id"] + [field for field in (fields or MESSAGE_LIST_FIELDS) if field != "id"]
+    columns = [getattr(Message, field) for field in fields]
+
+    query = select(*columns).where(Message.chatroom_id == chatroom.id)
+    if before is not None:
+        query = query.where(Message.id < before)
+    rows = (await db.execute(query.order_by(Message.id.desc()).limit(limit + 1))).all()
+    messages = [dict(zip(fields, row)) for row in rows]
+
+    if MESSAGE_ARCHIVE_ENABLED and len(messages) <= limit:
+        # The table ran out before the page did. Merge rather than append: a message left
+        # unfinished past the archive cutoff stays in the table while newer ones are archived.
+        archived = await get_archived_messages(db, chatroom.id, before, limit + 1)
+        seen = {message["id"] for message in messages}
+        messages.extend(
+            {field: record.get(field) for field in fields} for record in archived if record["id"] not in seen
+        )
+        messages.sort(key=lambda message: message["id"], reverse=True)
+
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = messages[-1]["id"]
+
+    return messages, next_cursor
+
+
+async def _dispatch_orphaned(message: Message):
+    """Dispatch a message saved after the request sending it was cancelled"""
+    try:
+        await dispatch_message(int(message.user_id), int(message.id))
+    except QueueUnavailableError:
+        await _finish_processing(int(message.id), "failed", wait=True)
+
 
-    # Start async processing in a background thread
+async def save_message_and_process_async(
+    db: AsyncSession, user_id: int, chatroom_id: int, content: str, use_cache: bool = True
+) -> Message:
+    """
+    Save a message to the database and queue it for processing
+    """
+    if MESSAGE_INSERT_BATCHING:
+        # Coalesced with concurrent sends into one multi-row INSERT
+        db_message = await message_insert_batcher.insert(
+            orphaned=_dispatch_orphaned,
+            user_id=user_id,
+            chatroom_id=chatroom_id,
+            content=content,
+            status="pending",
+            use_cache=use_cache,
+        )
+    else:
+        # Create message with pending status
+        db_message = Message(
+            user_id=user_id, chatroom_id=chatroom_id, content=content, status="pending", use_cache=use_cache
+        )
+        db.add(db_message)
+        await db.execute(
+            update(Chatroom)
+            .where(Chatroom.id == chatroom_id)
+            .values(message_count=Chatroom.message_count + 1)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        await db.refresh(db_message)
+
+    # Queue for processing; if the queue is unavailable the message can never run
     message_id = int(db_message.id)
-    run_async_in_thread(message_id)
+    try:
+        await dispatch_message(user_id, message_id)
+    except QueueUnavailableError:
+        await _finish_processing(message_id, "failed", wait=True)
+        db_message.status = "failed"
+        raise
 
     return db_message
+
+
+async def save_messages_and_process_async(
+    db: AsyncSession, user_id: int, items: List[dict]
+) -> List[Tuple[Optional[Message], Optional[str]]]:
+    """
+    Save a batch of messages (dicts of chatroom_id, content and use_cache) and
+    queue them for processing. Ownership of every chatroom is checked with one
+    query, the messages are inserted with one multi-row INSERT and handed off
+    in one enqueue. Returns (message, None) or (None, error) per item.
+    """
+    chatroom_ids = {item["chatroom_id"] for item in items}
+    owned = set(await db.scalars(select(Chatroom.id).where(Chatroom.id.in_(chatroom_ids), Chatroom.user_id == user_id)))
+
+    rows = [
+        {
+            "user_id": user_id,
+            "chatroom_id": item["chatroom_id"],
+            "content": item["content"],
+            "status": "pending",
+            "use_cache": item.get("use_cache", True),
+        }
+        for item in items
+        if item["chatroom_id"] in owned
+    ]
+    messages = []
+    if rows:
+        result = await db.execute(insert(Message).returning(Message, sort_by_parameter_order=True), rows)
+        messages = result.scalars().all()
+        counts = defaultdict(int)
+        for row in rows:
+            counts[row["chatroom_id"]] += 1
+        for chatroom_id, count in counts.items():
+            await db.execute(
+                update(Chatroom)
+                .where(Chatroom.id == chatroom_id)
+                .values(message_count=Chatroom.message_count + count)
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+
+    # Messages the queue refused can never run
+    dispatched = await dispatch_messages(user_id, [int(message.id) for message in messages]) if messages else 0
+    for message in messages[dispatched:]:
+        await _finish_processing(int(message.id), "failed", wait=True)
+        message.status = "failed"
+
+    results = []
+    saved = iter(enumerate(messages))
+    for item in items:
+        if item["chatroom_id"] not in owned:
+            results.append((None, "Chatroom not found or access denied"))
+            continue
+        position, message = next(saved)
+        if position < dispatched:
+            results.append((message, None))
+        else:
+            results.append((message, "Message queue is unavailable, please retry later"))
+    return results
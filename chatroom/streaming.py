@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import select
+
+from database.db_connection import session_scope
+
+from .models import Message
+
+# Streaming configuration
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "true").lower() == "true"
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "1.0"))
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "2000"))
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.5"))
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
+
+FINAL_STATUSES = ("completed", "failed")
+
+
+class ResponseStream:
+    """
+    In-memory buffer for a response that is being generated in this process.
+    Any number of SSE followers can read it from an arbitrary offset.
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self.length = 0
+        self.status: Optional[str] = None
+        self._changed = asyncio.Event()
+
+        # Partial flush bookkeeping
+        self.flushed_length = 0
+        self.flushed_at = time.monotonic()
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def append(self, chunk: str):
+        self._parts.append(chunk)
+        self.length += len(chunk)
+        self._notify()
+
+    def reset(self):
+        """Drop buffered text, e.g. before a retried generation"""
+        self._parts = []
+        self.length = 0
+        self.flushed_length = 0
+        self._notify()
+
+    def finish(self, status: str):
+        self.status = status
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def flush_due(self) -> bool:
+        """Whether enough new text or time accumulated to write it to the database"""
+        if self.length == self.flushed_length:
+            return False
+        return (
+            self.length - self.flushed_length >= STREAM_FLUSH_CHARS
+            or time.monotonic() - self.flushed_at >= STREAM_FLUSH_INTERVAL
+        )
+
+    def mark_flushed(self):
+        self.flushed_length = self.length
+        self.flushed_at = time.monotonic()
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+# Responses currently being generated in this process, keyed by message id
+live_streams: Dict[int, ResponseStream] = {}
+
+
+async def _load_progress(message_id: int) -> Tuple[str, Optional[str]]:
+    async with session_scope() as db:
+        row = (await db.execute(select(Message.response, Message.status).where(Message.id == message_id))).first()
+        if not row:
+            return "", "failed"
+        return row.response or "", row.status
+
+
+def format_event(data: dict, event: Optional[str] = None, event_id: Optional[int] = None) -> bytes:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append("data: " + orjson.dumps(data).decode())
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+async def follow_response(
+    message_id: int, offset: int = 0, finished: Optional[Tuple[str, str]] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yield SSE events for a message's response starting at ``offset``.
+
+    Responses generated in this process are followed from memory as chunks
+    arrive; responses generated elsewhere (another pod or a worker) are
+    followed through the partial flushes in the messages table. ``finished``
+    is the (response, status) of a message already known to be final, which
+    is replayed as is (archived messages are no longer in the table).
+    """
+    last_sent = time.monotonic()
+    while True:
+        stream = live_streams.get(message_id)
+        if finished is not None:
+            text, status = finished
+        elif stream is not None:
+            text, status = stream.text, stream.status
+        else:
+            text, status = await _load_progress(message_id)
+            status = status if status in FINAL_STATUSES else None
+
+        if len(text) > offset:
+            yield format_event({"text": text[offset:], "offset": offset}, event_id=len(text))
+            offset = len(text)
+            last_sent = time.monotonic()
+
+        if status is not None:
+            yield format_event({"status": status, "offset": offset}, event="done", event_id=offset)
+            return
+
+        if time.monotonic() - last_sent >= STREAM_HEARTBEAT_INTERVAL:
+            yield b": keep-alive\n\n"
+            last_sent = time.monotonic()
+
+        if stream is not None:
+            await stream.wait(STREAM_HEARTBEAT_INTERVAL)
+        else:
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
@@ -0,0 +1,226 @@
+"""
+Gemini worker process consuming the durable message stream.
+
+Run with ``python -m chatroom.worker``. Any number of workers can share the
+consumer group; API pods enqueue with ``MESSAGE_DISPATCH=stream``.
+"""
+
+import asyncio
+import os
+import signal
+import socket
+from typing import Set
+
+import redis
+import redis.asyncio as aioredis
+
+from database.db_connection import session_scope
+
+from .gemini import gemini_client
+from .message_queue import MESSAGE_STREAM_GROUP, MESSAGE_STREAM_KEY, MESSAGE_STREAM_MAXLEN
+from .scheduler import MESSAGE_SHUTDOWN_TIMEOUT, MESSAGE_WORKER_CONCURRENCY, DeferMessage
+from .services import (
+    MESSAGE_PROCESSING_TIMEOUT,
+    get_unfinished_messages,
+    mark_message_failed,
+    process_message_async,
+)
+from .write_behind import message_write_behind
+
+# Worker configuration
+WORKER_CONSUMER_NAME = os.getenv("WORKER_CONSUMER_NAME") or f"{socket.gethostname()}-{os.getpid()}"
+WORKER_BLOCK_MS = int(os.getenv("WORKER_BLOCK_MS", "5000"))
+WORKER_RECLAIM_INTERVAL = float(os.getenv("WORKER_RECLAIM_INTERVAL", "30"))
+WORKER_MAX_DELIVERIES = int(os.getenv("WORKER_MAX_DELIVERIES", "5"))
+WORKER_RECOVERY_LOCK_KEY = f"{MESSAGE_STREAM_KEY}:recovery"
+
+
+class MessageWorker:
+    """
+    Reads message ids from the stream through a consumer group and processes
+    them with bounded concurrency. Entries are acked once processing finished;
+    entries left unacked by a dead consumer are reclaimed after they have been
+    idle for ``MESSAGE_PROCESSING_TIMEOUT`` seconds.
+    """
+
+    def __init__(
+        self,
+        client: aioredis.Redis,
+        consumer: str = WORKER_CONSUMER_NAME,
+        concurrency: int = MESSAGE_WORKER_CONCURRENCY,
+    ):
+        self.client = client
+        self.consumer = consumer
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    async def ensure_group(self):
+        """Create the consumer group (and the stream) if they do not exist yet"""
+        try:
+            await self.client.xgroup_create(MESSAGE_STREAM_KEY, MESSAGE_STREAM_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _recreate_group(self):
+        try:
+            await self.ensure_group()
+        except redis.RedisError as e:
+            print(f"Failed to recreate consumer group: {e}")
+
+    async def recover_unfinished(self):
+        """
+        Re-enqueue messages left pending or stuck processing in the database,
+        e.g. after an API pod lost its in-process queue. Runs once at startup:
+        pending rows are usually still waiting in the stream, so sweeping them
+        periodically would only multiply entries. Entries orphaned inside the
+        stream are reclaimed by ``reclaim``. Only one worker does this at a
+        time; duplicates are harmless because processing claims rows.
+        """
+        lock = await self.client.set(WORKER_RECOVERY_LOCK_KEY, self.consumer, nx=True, ex=60)
+        if not lock:
+            return
+
+        async with session_scope() as db:
+            unfinished = await get_unfinished_messages(db)
+
+        if unfinished:
+            pipe = self.client.pipeline(transaction=False)
+            for user_id, message_id in unfinished:
+                pipe.xadd(
+                    MESSAGE_STREAM_KEY,
+                    {"message_id": message_id, "user_id": user_id},
+                    maxlen=MESSAGE_STREAM_MAXLEN,
+                    approximate=True,
+                )
+            await pipe.execute()
+            print(f"Re-enqueued {len(unfinished)} unfinished messages")
+
+    async def _process(self, entry_id: str, fields: dict):
+        try:
+            await process_message_async(int(fields["message_id"]))
+        except DeferMessage as e:
+            # Hold the slot while Gemini is unhealthy, then put the entry back on the stream
+            await asyncio.sleep(e.delay)
+            await self.client.xadd(MESSAGE_STREAM_KEY, fields, maxlen=MESSAGE_STREAM_MAXLEN, approximate=True)
+        except Exception as e:
+            print(f"Error processing stream entry {entry_id}: {e}")
+        finally:
+            self._slots.release()
+            try:
+                await self.client.xack(MESSAGE_STREAM_KEY, MESSAGE_STREAM_GROUP, entry_id)
+            except redis.RedisError as e:
+                # Left pending; reclaim redelivers it and the claim skips finished messages
+                print(f"Failed to ack stream entry {entry_id}: {e}")
+
+    async def _dispatch(self, entries):
+        for entry_id, fields in entries:
+            await self._slots.acquire()
+            task = asyncio.create_task(self._process(entry_id, fields))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def reclaim(self):
+        """
+        Take over entries another consumer read but never acked. Entries that
+        keep failing are dropped so they cannot wedge the group.
+        """
+        start = "0-0"
+        min_idle_ms = MESSAGE_PROCESSING_TIMEOUT * 1000
+        while True:
+            result = await self.client.xautoclaim(
+                MESSAGE_STREAM_KEY, MESSAGE_STREAM_GROUP, self.consumer, min_idle_ms, start, count=100
+            )
+            start, entries = result[0], result[1]
+
+            claimed = []
+            for entry_id, fields in entries:
+                pending = await self.client.xpending_range(
+                    MESSAGE_STREAM_KEY, MESSAGE_STREAM_GROUP, entry_id, entry_id, 1
+                )
+                if pending and pending[0]["times_delivered"] > WORKER_MAX_DELIVERIES:
+                    print(f"Dropping stream entry {entry_id} after {WORKER_MAX_DELIVERIES} deliveries")
+                    await mark_message_failed(int(fields["message_id"]))
+                    await self.client.xack(MESSAGE_STREAM_KEY, MESSAGE_STREAM_GROUP, entry_id)
+                    continue
+                claimed.append((entry_id, fields))
+
+            await self._dispatch(claimed)
+            if start in ("0-0", b"0-0"):
+                return
+
+    async def _reclaim_loop(self):
+        while not self._stopping.is_set():
+            try:
+                await self.reclaim()
+            except redis.RedisError as e:
+                print(f"Stream reclaim failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=WORKER_RECLAIM_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        await self.ensure_group()
+        await self.recover_unfinished()
+        reclaimer = asyncio.create_task(self._reclaim_loop())
+
+        delay = 1.0
+        try:
+            while not self._stopping.is_set():
+                # Only read as many entries as there are free worker slots
+                if len(self._tasks) >= self.concurrency:
+                    await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                free = max(1, self.concurrency - len(self._tasks))
+                try:
+                    response = await self.client.xreadgroup(
+                        MESSAGE_STREAM_GROUP,
+                        self.consumer,
+                        {MESSAGE_STREAM_KEY: ">"},
+                        count=free,
+                        block=WORKER_BLOCK_MS,
+                    )
+                except redis.RedisError as e:
+                    print(f"Stream read failed: {e}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+                    if isinstance(e, redis.ResponseError) and "NOGROUP" in str(e):
+                        # The stream was deleted or recreated without the group
+                        await self._recreate_group()
+                    continue
+                delay = 1.0
+
+                for _stream, entries in response or []:
+                    await self._dispatch(entries)
+        finally:
+            self._stopping.set()
+            await reclaimer
+            if self._tasks:
+                await asyncio.wait(self._tasks, timeout=MESSAGE_SHUTDOWN_TIMEOUT)
+
+    def stop(self):
+        self._stopping.set()
+
+
+async def main():
+    client = aioredis.from_url(os.getenv("REDIS_URL") or "", decode_responses=True)
+    worker = MessageWorker(client)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    print(f"Worker {worker.consumer} consuming {MESSAGE_STREAM_KEY} ({worker.concurrency} slots)")
+    await gemini_client.start()
+    try:
+        await worker.run()
+    finally:
+        await message_write_behind.stop()
+        await gemini_client.close()
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
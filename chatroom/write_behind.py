@@ -0,0 +1,293 @@
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import insert, update
+
+from database.db_connection import session_scope
+from middleware.metrics import Gauge
+
+from .models import Chatroom, Message
+
+# Write-behind configuration
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_INTERVAL_MS = int(os.getenv("WRITE_BEHIND_INTERVAL_MS", "50"))
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "500"))
+# Flushes a message's values may fail before they are dropped and its waiters get the error
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "5"))
+
+# Batched message inserts for send_message
+MESSAGE_INSERT_BATCHING = os.getenv("MESSAGE_INSERT_BATCHING", "false").lower() == "true"
+MESSAGE_INSERT_BATCH_MS = int(os.getenv("MESSAGE_INSERT_BATCH_MS", "5"))
+MESSAGE_INSERT_BATCH_ROWS = int(os.getenv("MESSAGE_INSERT_BATCH_ROWS", "100"))
+
+
+class MessageWriteBehind:
+    """
+    Buffers status/response updates for messages and writes them as batched
+    UPDATEs (bulk update by primary key, i.e. executemany) every
+    WRITE_BEHIND_INTERVAL_MS or once WRITE_BEHIND_MAX_ROWS messages are dirty.
+
+    Updates for the same message are merged in arrival order, so the latest
+    value always wins, and a single flusher writes batches one at a time.
+    ``write`` joins the next batch and returns once it is committed; ``update``
+    does not wait.
+
+    A batch that fails is retried one message at a time, so a bad row (e.g.
+    a deleted message) only holds back itself; a message whose values fail
+    WRITE_BEHIND_MAX_ATTEMPTS flushes is dropped and its waiters get the error.
+    """
+
+    def __init__(
+        self,
+        interval_ms: int = WRITE_BEHIND_INTERVAL_MS,
+        max_rows: int = WRITE_BEHIND_MAX_ROWS,
+        max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS,
+    ):
+        self.interval = interval_ms / 1000
+        self.max_rows = max_rows
+        self.max_attempts = max_attempts
+        self._pending: Dict[int, dict] = {}
+        # Callers of ``write`` waiting for the batch holding their message to commit
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        # Failed flushes per message since its values were last written
+        self._attempts: Dict[int, int] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushes = 0
+        self.rows_written = 0
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="message-write-behind")
+
+    def update(self, message_id: int, **values):
+        """Queue new values for a message"""
+        self._ensure_started()
+        values.setdefault("updated_at", datetime.now())
+        self._pending.setdefault(message_id, {}).update(values)
+        if len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+
+    async def write(self, message_id: int, **values):
+        """
+        Queue new values for a message and wait until the batch carrying them
+        is committed, e.g. before telling clients a message is finished
+        """
+        self.update(message_id, **values)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(message_id, []).append(future)
+        await future
+
+    async def write_now(self, message_id: int, **values):
+        """
+        Write a message's values immediately, together with anything still
+        buffered for it. Used when the next step depends on the row (e.g.
+        resetting a deferred message to pending before it is claimed again).
+        """
+        self._ensure_started()
+        values.setdefault("updated_at", datetime.now())
+        async with self._lock:
+            merged = self._pending.pop(message_id, {})
+            merged.update(values)
+            try:
+                await self._write([{"id": message_id, **merged}])
+            except Exception:
+                # Keep the values for the next flush, underneath anything that arrived meanwhile
+                self._pending[message_id] = {**merged, **self._pending.get(message_id, {})}
+                raise
+            self._attempts.pop(message_id, None)
+            self._resolve(self._waiters.pop(message_id, []))
+
+    @staticmethod
+    def _resolve(waiters: List[asyncio.Future], error: Optional[BaseException] = None):
+        for future in waiters:
+            if not future.done():
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def _write(self, rows: List[dict]):
+        # Bulk UPDATE by primary key needs the same columns in every row
+        groups = defaultdict(list)
+        for row in rows:
+            groups[tuple(sorted(row))].append(row)
+
+        async with session_scope() as db:
+            for group in groups.values():
+                await db.execute(update(Message), group)
+            await db.commit()
+        self.flushes += 1
+        self.rows_written += len(rows)
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        if self._lock is None:
+            return
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            waiters, self._waiters = self._waiters, {}
+            try:
+                await self._write([{"id": message_id, **values} for message_id, values in batch.items()])
+            except Exception as e:
+                print(f"Warning: Failed to flush {len(batch)} message updates, retrying one by one: {e}")
+                await self._flush_each(batch, waiters)
+                return
+            except asyncio.CancelledError:
+                self._requeue(batch, waiters)
+                raise
+            for message_id, futures in waiters.items():
+                self._attempts.pop(message_id, None)
+                self._resolve(futures)
+
+    async def _flush_each(self, batch: Dict[int, dict], waiters: Dict[int, List[asyncio.Future]]):
+        for position, (message_id, values) in enumerate(batch.items()):
+            try:
+                await self._write([{"id": message_id, **values}])
+            except Exception as e:
+                attempts = self._attempts.get(message_id, 0) + 1
+                if attempts < self.max_attempts:
+                    self._attempts[message_id] = attempts
+                    self._requeue({message_id: values}, {message_id: waiters.pop(message_id, [])})
+                    continue
+                self._attempts.pop(message_id, None)
+                print(f"Warning: Dropping updates for message {message_id} after {attempts} failed flushes: {e}")
+                self._resolve(waiters.pop(message_id, []), e)
+                continue
+            except asyncio.CancelledError:
+                remaining = dict(list(batch.items())[position:])
+                self._requeue(remaining, {message_id: waiters.pop(message_id, []) for message_id in remaining})
+                raise
+            self._attempts.pop(message_id, None)
+            self._resolve(waiters.pop(message_id, []))
+        # Waiters whose values were already written by ``write_now``
+        for futures in waiters.values():
+            self._resolve(futures)
+
+    def _requeue(self, batch: Dict[int, dict], waiters: Dict[int, List[asyncio.Future]]):
+        # Put values back underneath anything that arrived meanwhile
+        for message_id, values in batch.items():
+            self._pending[message_id] = {**values, **self._pending.get(message_id, {})}
+        for message_id, futures in waiters.items():
+            if futures:
+                self._waiters[message_id] = futures + self._waiters.get(message_id, [])
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def stop(self):
+        """Stop the flusher, letting a flush in progress finish, and write whatever is still buffered"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+class MessageInsertBatcher:
+    """
+    Coalesces message inserts from concurrent requests into one multi-row
+    INSERT ... RETURNING, plus one message_count update per chatroom.
+    """
+
+    def __init__(self, window_ms: int = MESSAGE_INSERT_BATCH_MS, max_rows: int = MESSAGE_INSERT_BATCH_ROWS):
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._handoffs: Set[asyncio.Task] = set()
+
+    async def insert(self, orphaned: Optional[Callable[[Message], Awaitable[None]]] = None, **values) -> Message:
+        """
+        Insert a row with the next batch and return it. If the caller is
+        cancelled, a row not sent yet is dropped, and a row already being
+        inserted is passed to ``orphaned`` once saved, so it is not left behind.
+        """
+        entry = (values, asyncio.get_running_loop().create_future())
+        self._pending.append(entry)
+        if len(self._pending) >= self.max_rows:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(self.window)
+        try:
+            return await asyncio.shield(entry[1])
+        except asyncio.CancelledError:
+            if any(pending is entry for pending in self._pending):
+                self._pending = [pending for pending in self._pending if pending is not entry]
+            elif orphaned is not None:
+                entry[1].add_done_callback(lambda future: self._hand_off(future, orphaned))
+            raise
+
+    def _hand_off(self, future: asyncio.Future, orphaned: Callable[[Message], Awaitable[None]]):
+        if future.cancelled() or future.exception() is not None:
+            return
+        task = asyncio.ensure_future(orphaned(future.result()))
+        self._handoffs.add(task)
+        task.add_done_callback(self._handoffs.discard)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.create_task(self._flush(batch))
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        try:
+            rows = [values for values, _ in batch]
+            counts = defaultdict(int)
+            for row in rows:
+                counts[row["chatroom_id"]] += 1
+
+            async with session_scope() as db:
+                result = await db.execute(insert(Message).returning(Message, sort_by_parameter_order=True), rows)
+                messages = result.scalars().all()
+                for chatroom_id, count in counts.items():
+                    await db.execute(
+                        update(Chatroom)
+                        .where(Chatroom.id == chatroom_id)
+                        .values(message_count=Chatroom.message_count + count)
+                        .execution_options(synchronize_session=False)
+                    )
+                await db.commit()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), message in zip(batch, messages):
+            if not future.done():
+                future.set_result(message)
+
+
+message_write_behind = MessageWriteBehind()
+message_insert_batcher = MessageInsertBatcher()
+
+Gauge(
+    "write_behind_buffered_rows",
+    "Message writes buffered in this process and not yet in the database",
+    lambda: {("update",): len(message_write_behind._pending), ("insert",): len(message_insert_batcher._pending)},
+    ("kind",),
+)
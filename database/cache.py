@@ -1,56 +1,684 @@
 import json
 import os
-from typing import Any, Optional
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Union
 
+import msgpack
 import redis
+import redis.asyncio as aioredis
 
-# Redis connection
-redis_client = redis.Redis.from_url(
-    os.getenv("REDIS_URL") or "",
-    decode_responses=True,
-)
+from middleware.metrics import CallbackCounter
+
+from .local_cache import MISSING, LocalCache
+
+# Value encoding for new writes: "msgpack" (compact binary) or "json" (readable by older releases).
+# Reads accept both, so existing JSON entries keep working after a switch.
+CACHE_SERIALIZER = os.getenv("CACHE_SERIALIZER", "msgpack")
+# Prefix marking msgpack values; 0xc1 is never produced by msgpack and never starts JSON text
+_MSGPACK_MARKER = b"\xc1"
+
+# Tag sets outlive the entries registered in them; stale members are harmless
+CACHE_TAG_TTL = int(os.getenv("CACHE_TAG_TTL", "86400"))
+# Keys deleted per DEL when invalidating by pattern
+CACHE_SCAN_BATCH = int(os.getenv("CACHE_SCAN_BATCH", "500"))
+
+# Seconds before a Redis command or connection attempt gives up, so a slow or
+# hung Redis fails requests quickly instead of stalling them
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Connections checked out of the shared pools: one per command or pipeline, i.e. per round trip
+_redis_stats = {"round_trips": 0}
+
+
+def _count_round_trips(pool):
+    get_connection = pool.get_connection
+
+    def counted_get_connection(*args, **kwargs):
+        _redis_stats["round_trips"] += 1
+        return get_connection(*args, **kwargs)
+
+    pool.get_connection = counted_get_connection
+
+
+def _client(name: str, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory(os.getenv("REDIS_URL") or "")
+                _count_round_trips(client.connection_pool)
+                _clients[name] = client
+    return client
+
+
+def _timeouts() -> dict:
+    return {"socket_timeout": REDIS_SOCKET_TIMEOUT, "socket_connect_timeout": REDIS_CONNECT_TIMEOUT}
+
+
+def get_redis_client() -> redis.Redis:
+    """Shared Redis client returning str, for streams, sorted sets and pub/sub; created on first use"""
+    return _client("text", lambda url: redis.Redis.from_url(url, decode_responses=True, **_timeouts()))
+
+
+def get_redis_bytes_client() -> redis.Redis:
+    """Shared Redis client returning raw bytes, used for cached values"""
+    return _client("bytes", lambda url: redis.Redis.from_url(url, decode_responses=False, **_timeouts()))
+
+
+def get_async_redis_client() -> aioredis.Redis:
+    """Shared redis.asyncio client returning raw bytes, backed by one connection pool"""
+    return _client(
+        "async", lambda url: aioredis.Redis(connection_pool=aioredis.ConnectionPool.from_url(url, **_timeouts()))
+    )
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a value for the cache"""
+    if CACHE_SERIALIZER == "json":
+        return json.dumps(value).encode()
+    return _MSGPACK_MARKER + msgpack.packb(value, use_bin_type=True)
+
+
+def loads(raw: Union[bytes, str]) -> Any:
+    """Decode a cached value written by ``dumps`` in either format"""
+    if isinstance(raw, bytes) and raw[:1] == _MSGPACK_MARKER:
+        return msgpack.unpackb(raw[1:], raw=False)
+    return json.loads(raw)
+
+
+# Optional in-process (L1) tier in front of Redis (L2)
+CACHE_L1_ENABLED = os.getenv("CACHE_L1_ENABLED", "false").lower() == "true"
+CACHE_L1_SIZE = int(os.getenv("CACHE_L1_SIZE", "10000"))
+CACHE_L1_TTL = float(os.getenv("CACHE_L1_TTL", "30"))
+# Pub/sub channel carrying keys to evict from every pod's L1
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+# Identifies this process's own invalidation messages, which it has already applied
+CACHE_NODE_ID = uuid.uuid4().hex
+
+local_cache = LocalCache(CACHE_L1_SIZE, CACHE_L1_TTL) if CACHE_L1_ENABLED else None
+
+_l2_stats = {"hits": 0, "misses": 0, "errors": 0}
+
+
+class InvalidationListener:
+    """
+    Background thread subscribed to CACHE_INVALIDATION_CHANNEL that evicts
+    published keys from this pod's in-process caches (L1 and any registered
+    with ``register_local_cache``). While the subscription is down entries can
+    go stale for at most their local TTL, and the caches are cleared on
+    reconnect because invalidations may have been missed.
+    """
+
+    def __init__(self):
+        self.caches: List[LocalCache] = []
+        self.connected = False
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+                self._thread.start()
+
+    def invalidate(self, keys: List[str]):
+        for cache in self.caches:
+            cache.invalidate(keys)
+
+    def _run(self):
+        delay = 1.0
+        while True:
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                for cache in self.caches:
+                    cache.clear()
+                self.connected = True
+                delay = 1.0
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        event = json.loads(message["data"])
+                        if event["origin"] != CACHE_NODE_ID:
+                            self.invalidate(event["keys"])
+            except Exception as e:
+                if self.connected:
+                    print(f"Warning: Cache invalidation subscription lost: {e}")
+                self.connected = False
+                time.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+
+_listener = InvalidationListener()
+if local_cache is not None:
+    _listener.caches.append(local_cache)
+
+
+def register_local_cache(cache: LocalCache):
+    """
+    Keep another in-process cache coherent across pods: keys deleted or
+    overwritten through CacheService/AsyncCacheService are evicted from it on
+    every pod. Its entries must be stored under the same keys as in Redis.
+    """
+    _listener.caches.append(cache)
+
+
+def start_invalidation_listener():
+    """Subscribe to invalidations, once; call when a registered cache is first used"""
+    _listener.ensure_started()
+
+
+def _l1_get(key: str, kind: str = "json") -> Any:
+    if local_cache is None:
+        return MISSING
+    _listener.ensure_started()
+    return local_cache.get(key, kind)
+
+
+def _l1_put(key: str, value: Any, kind: str = "json", ttl: float = None):
+    if local_cache is not None:
+        _listener.ensure_started()
+        local_cache.put(key, value, kind, ttl)
+
+
+def _invalidation_message(keys: Iterable[str], local: bool = True) -> Optional[str]:
+    """
+    Evict keys from this pod's in-process caches (unless ``local`` is False)
+    and build the message telling other pods to do the same, or None when
+    there are no in-process caches
+    """
+    if not _listener.caches:
+        return None
+    keys = list(keys)
+    if local:
+        _listener.invalidate(keys)
+    return json.dumps({"origin": CACHE_NODE_ID, "keys": keys})
+
+
+def _invalidate(keys: Iterable[str], local: bool = True):
+    """
+    Evict keys from L1 on every pod. Call after the Redis write so the other
+    pods reload the new value.
+    """
+    message = _invalidation_message(keys, local)
+    if message is None:
+        return
+    try:
+        get_redis_client().publish(CACHE_INVALIDATION_CHANNEL, message)
+    except Exception:
+        pass
+
+
+def get_cache_key_tag(tag: str) -> str:
+    """Generate key of the set holding the cache keys registered under a tag"""
+    return f"cache_tag:{tag}"
+
+
+def tag_user(user_id: int) -> str:
+    """Tag for cached views of a user's data"""
+    return f"user:{user_id}"
+
+
+def tag_chatroom(chatroom_id: int) -> str:
+    """Tag for cached views of a chatroom's data"""
+    return f"chatroom:{chatroom_id}"
+
+
+def _register_tags(pipe, keys: Iterable[str], tags: Optional[Iterable[str]]):
+    """Queue adding ``keys`` to each tag's set on a pipeline"""
+    keys = list(keys)
+    for tag in tags or ():
+        pipe.sadd(get_cache_key_tag(tag), *keys)
+        pipe.expire(get_cache_key_tag(tag), CACHE_TAG_TTL)
+
+
+def _expire_for(key: str, expire: Union[int, Dict[str, int]]) -> int:
+    return expire.get(key, 300) if isinstance(expire, dict) else expire
+
+
+def _tag_invalidation_failed(tags: Iterable[str], keys: Optional[set], error: Exception):
+    """
+    Keep this pod's L1 from serving what a failed tag invalidation should have
+    dropped: evict the tagged keys if they were read, otherwise clear L1.
+    Other pods' L1 entries expire within CACHE_L1_TTL.
+    """
+    _l2_stats["errors"] += 1
+    print(f"Warning: Failed to invalidate cache tags {', '.join(tags)}: {error}")
+    if local_cache is None:
+        return
+    if keys is None:
+        local_cache.clear()
+    else:
+        local_cache.invalidate(keys)
 
 
 class CacheService:
     @staticmethod
-    def get(key: str) -> Optional[Any]:
-        """Get value from cache"""
+    def get(key: str, local: bool = True) -> Optional[Any]:
+        """Get value from cache; ``local=False`` skips the in-process tier"""
+        if local:
+            value = _l1_get(key)
+            if value is not MISSING:
+                return value
         try:
-            value = redis_client.get(key)
-            return json.loads(value) if value else None
+            value = get_redis_bytes_client().get(key)
         except Exception:
+            _l2_stats["errors"] += 1
+            return None
+        if not value:
+            _l2_stats["misses"] += 1
             return None
+        _l2_stats["hits"] += 1
+        value = loads(value)
+        if local:
+            _l1_put(key, value)
+        return value
+
+    @staticmethod
+    def set(key: str, value: Any, expire: int = 300, tags: Optional[List[str]] = None) -> bool:
+        """
+        Set value in cache with expiration (default 5 minutes), registered
+        under ``tags`` for ``invalidate_tags``
+        """
+        _l1_put(key, value, ttl=expire)
+        try:
+            pipe = get_redis_bytes_client().pipeline(transaction=False)
+            pipe.setex(key, expire, dumps(value))
+            _register_tags(pipe, [key], tags)
+            pipe.execute()
+        except Exception:
+            _l2_stats["errors"] += 1
+            return False
+        _invalidate([key], local=False)
+        return True
 
     @staticmethod
-    def set(key: str, value: Any, expire: int = 300) -> bool:
-        """Set value in cache with expiration (default 5 minutes)"""
+    def get_many(keys: List[str]) -> Dict[str, Any]:
+        """Get several values with one MGET; missing keys are left out of the result"""
+        found = {}
+        remaining = []
+        for key in keys:
+            value = _l1_get(key)
+            if value is MISSING:
+                remaining.append(key)
+            else:
+                found[key] = value
+        if not remaining:
+            return found
+
         try:
-            redis_client.setex(key, expire, json.dumps(value))
+            values = get_redis_bytes_client().mget(remaining)
+        except Exception:
+            _l2_stats["errors"] += 1
+            return found
+        for key, value in zip(remaining, values):
+            if not value:
+                _l2_stats["misses"] += 1
+                continue
+            _l2_stats["hits"] += 1
+            found[key] = loads(value)
+            _l1_put(key, found[key])
+        return found
+
+    @staticmethod
+    def set_many(
+        values: Dict[str, Any], expire: Union[int, Dict[str, int]] = 300, tags: Optional[List[str]] = None
+    ) -> bool:
+        """
+        Set several values in one pipeline. ``expire`` is either one TTL for all
+        keys or a per-key mapping (keys not in it get 5 minutes); every key is
+        registered under ``tags``.
+        """
+        if not values:
             return True
+        for key, value in values.items():
+            _l1_put(key, value, ttl=_expire_for(key, expire))
+        try:
+            pipe = get_redis_bytes_client().pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.setex(key, _expire_for(key, expire), dumps(value))
+            _register_tags(pipe, values, tags)
+            pipe.execute()
         except Exception:
+            _l2_stats["errors"] += 1
             return False
+        _invalidate(values, local=False)
+        return True
+
+    @staticmethod
+    def delete_many(keys: List[str]) -> bool:
+        """Delete several values with one DEL"""
+        if not keys:
+            return True
+        try:
+            get_redis_client().delete(*keys)
+            return True
+        except Exception:
+            return False
+        finally:
+            _invalidate(keys)
+
+    @staticmethod
+    def get_bytes(key: str) -> Optional[bytes]:
+        """Get a raw bytes value from cache, without deserializing it"""
+        value = _l1_get(key, "bytes")
+        if value is not MISSING:
+            return value
+        try:
+            value = get_redis_bytes_client().get(key)
+        except Exception:
+            _l2_stats["errors"] += 1
+            return None
+        if not value:
+            _l2_stats["misses"] += 1
+            return None
+        _l2_stats["hits"] += 1
+        _l1_put(key, value, "bytes")
+        return value
+
+    @staticmethod
+    def set_bytes(key: str, value: bytes, expire: int = 300, tags: Optional[List[str]] = None) -> bool:
+        """Set a raw bytes value in cache with expiration (default 5 minutes), registered under ``tags``"""
+        _l1_put(key, value, "bytes", ttl=expire)
+        try:
+            pipe = get_redis_bytes_client().pipeline(transaction=False)
+            pipe.setex(key, expire, value)
+            _register_tags(pipe, [key], tags)
+            pipe.execute()
+        except Exception:
+            _l2_stats["errors"] += 1
+            return False
+        _invalidate([key], local=False)
+        return True
 
     @staticmethod
     def delete(key: str) -> bool:
         """Delete value from cache"""
         try:
-            redis_client.delete(key)
+            get_redis_client().delete(key)
             return True
         except Exception:
             return False
+        finally:
+            _invalidate([key])
+
+    @staticmethod
+    def add_if_absent(key: str, value: Any, expire: int = 300) -> bool:
+        """Set value only if the key does not exist yet (SET NX); usable as a short lock"""
+        try:
+            return bool(get_redis_bytes_client().set(key, dumps(value), ex=expire, nx=True))
+        except Exception:
+            return False
+
+    @staticmethod
+    def track_lru(index_key: str, key: str, max_size: int) -> bool:
+        """
+        Record an access to ``key`` in a sorted-set LRU index and evict the
+        least recently used keys once the index holds more than ``max_size``
+        """
+        try:
+            client = get_redis_client()
+            pipe = client.pipeline(transaction=False)
+            pipe.zadd(index_key, {key: time.time()})
+            pipe.zcard(index_key)
+            _, size = pipe.execute()
+            if size > max_size:
+                evicted = [member for member, _ in client.zpopmin(index_key, size - max_size)]
+                if evicted:
+                    client.delete(*evicted)
+                    _invalidate(evicted)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def invalidate_tags(*tags: str) -> bool:
+        """Delete every key registered under any of ``tags``; costs O(registered keys)"""
+        keys = None
+        try:
+            client = get_redis_client()
+            pipe = client.pipeline(transaction=False)
+            for tag in tags:
+                pipe.smembers(get_cache_key_tag(tag))
+            keys = set().union(*pipe.execute())
+            client.delete(*keys, *[get_cache_key_tag(tag) for tag in tags])
+        except Exception as e:
+            _tag_invalidation_failed(tags, keys, e)
+            return False
+        if keys:
+            _invalidate(keys)
+        return True
 
     @staticmethod
     def invalidate_pattern(pattern: str) -> bool:
-        """Invalidate all keys matching a pattern"""
+        """
+        Invalidate all keys matching a pattern. Walks the keyspace with SCAN,
+        so it does not block Redis, but it is still O(keyspace): meant for bulk
+        maintenance, not request paths (use tags there).
+        """
         try:
-            keys = redis_client.keys(pattern)
-            if keys:
-                redis_client.delete(*keys)
+            client = get_redis_client()
+            batch = []
+            for key in client.scan_iter(match=pattern, count=CACHE_SCAN_BATCH):
+                batch.append(key)
+                if len(batch) >= CACHE_SCAN_BATCH:
+                    client.delete(*batch)
+                    _invalidate(batch)
+                    batch = []
+            if batch:
+                client.delete(*batch)
+                _invalidate(batch)
             return True
         except Exception:
             return False
 
+    @staticmethod
+    def stats() -> dict:
+        """Hit/miss counters per tier"""
+        return {
+            "l1": local_cache.stats() if local_cache is not None else None,
+            "l1_subscribed": _listener.connected,
+            "l2": dict(_l2_stats),
+            "redis_round_trips": _redis_stats["round_trips"],
+        }
+
+
+class AsyncCacheService:
+    """
+    ``CacheService`` for async code: same keys, encoding and in-process tier,
+    over the shared ``redis.asyncio`` connection pool so the event loop never
+    blocks on Redis
+    """
+
+    @staticmethod
+    async def _publish(message: Optional[str]):
+        if message is None:
+            return
+        try:
+            await get_async_redis_client().publish(CACHE_INVALIDATION_CHANNEL, message)
+        except Exception:
+            pass
+
+    @staticmethod
+    async def get(key: str, local: bool = True) -> Optional[Any]:
+        """Get value from cache; ``local=False`` skips the in-process tier"""
+        found = await AsyncCacheService.get_many([key], local=local)
+        return found.get(key)
+
+    @staticmethod
+    async def set(key: str, value: Any, expire: int = 300, tags: Optional[List[str]] = None) -> bool:
+        """Set value in cache with expiration (default 5 minutes), registered under ``tags``"""
+        return await AsyncCacheService.set_many({key: value}, expire, tags)
+
+    @staticmethod
+    async def delete(key: str) -> bool:
+        """Delete value from cache"""
+        return await AsyncCacheService.delete_many([key])
+
+    @staticmethod
+    async def get_many(keys: List[str], local: bool = True) -> Dict[str, Any]:
+        """Get several values with one MGET; missing keys are left out of the result"""
+        found = {}
+        remaining = []
+        for key in keys:
+            value = _l1_get(key) if local else MISSING
+            if value is MISSING:
+                remaining.append(key)
+            else:
+                found[key] = value
+        if not remaining:
+            return found
+
+        try:
+            values = await get_async_redis_client().mget(remaining)
+        except Exception:
+            _l2_stats["errors"] += 1
+            return found
+        for key, value in zip(remaining, values):
+            if not value:
+                _l2_stats["misses"] += 1
+                continue
+            _l2_stats["hits"] += 1
+            found[key] = loads(value)
+            if local:
+                _l1_put(key, found[key])
+        return found
+
+    @staticmethod
+    async def set_many(
+        values: Dict[str, Any], expire: Union[int, Dict[str, int]] = 300, tags: Optional[List[str]] = None
+    ) -> bool:
+        """Set several values in one pipeline, with one TTL or a per-key mapping, registered under ``tags``"""
+        if not values:
+            return True
+        for key, value in values.items():
+            _l1_put(key, value, ttl=_expire_for(key, expire))
+        try:
+            pipe = get_async_redis_client().pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.setex(key, _expire_for(key, expire), dumps(value))
+            _register_tags(pipe, values, tags)
+            await pipe.execute()
+        except Exception:
+            _l2_stats["errors"] += 1
+            return False
+        await AsyncCacheService._publish(_invalidation_message(values, local=False))
+        return True
+
+    @staticmethod
+    async def delete_many(keys: List[str]) -> bool:
+        """Delete several values with one DEL"""
+        if not keys:
+            return True
+        try:
+            await get_async_redis_client().delete(*keys)
+            return True
+        except Exception:
+            return False
+        finally:
+            await AsyncCacheService._publish(_invalidation_message(keys))
+
+    @staticmethod
+    async def get_bytes(key: str) -> Optional[bytes]:
+        """Get a raw bytes value from cache, without deserializing it"""
+        value = _l1_get(key, "bytes")
+        if value is not MISSING:
+            return value
+        try:
+            value = await get_async_redis_client().get(key)
+        except Exception:
+            _l2_stats["errors"] += 1
+            return None
+        if not value:
+            _l2_stats["misses"] += 1
+            return None
+        _l2_stats["hits"] += 1
+        _l1_put(key, value, "bytes")
+        return value
+
+    @staticmethod
+    async def set_bytes(key: str, value: bytes, expire: int = 300, tags: Optional[List[str]] = None) -> bool:
+        """Set a raw bytes value in cache with expiration (default 5 minutes), registered under ``tags``"""
+        _l1_put(key, value, "bytes", ttl=expire)
+        try:
+            pipe = get_async_redis_client().pipeline(transaction=False)
+            pipe.setex(key, expire, value)
+            _register_tags(pipe, [key], tags)
+            await pipe.execute()
+        except Exception:
+            _l2_stats["errors"] += 1
+            return False
+        await AsyncCacheService._publish(_invalidation_message([key], local=False))
+        return True
+
+    @staticmethod
+    async def add_if_absent(key: str, value: Any, expire: int = 300) -> bool:
+        """Set value only if the key does not exist yet (SET NX); usable as a short lock"""
+        try:
+            return bool(await get_async_redis_client().set(key, dumps(value), ex=expire, nx=True))
+        except Exception:
+            return False
+
+    @staticmethod
+    async def track_lru(index_key: str, key: str, max_size: int) -> bool:
+        """Record an access to ``key`` in a sorted-set LRU index and evict beyond ``max_size``"""
+        try:
+            client = get_async_redis_client()
+            pipe = client.pipeline(transaction=False)
+            pipe.zadd(index_key, {key: time.time()})
+            pipe.zcard(index_key)
+            _, size = await pipe.execute()
+            if size > max_size:
+                evicted = [member.decode() for member, _ in await client.zpopmin(index_key, size - max_size)]
+                if evicted:
+                    await client.delete(*evicted)
+                    await AsyncCacheService._publish(_invalidation_message(evicted))
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    async def invalidate_tags(*tags: str) -> bool:
+        """Delete every key registered under any of ``tags``"""
+        keys = None
+        try:
+            client = get_async_redis_client()
+            pipe = client.pipeline(transaction=False)
+            for tag in tags:
+                pipe.smembers(get_cache_key_tag(tag))
+            keys = {key.decode() for key in set().union(*await pipe.execute())}
+            await client.delete(*keys, *[get_cache_key_tag(tag) for tag in tags])
+        except Exception as e:
+            _tag_invalidation_failed(tags, keys, e)
+            return False
+        if keys:
+            await AsyncCacheService._publish(_invalidation_message(keys))
+        return True
+
+
+def _cache_lookups() -> dict:
+    lookups = {
+        ("l2", result): _l2_stats[key] for key, result in (("hits", "hit"), ("misses", "miss"), ("errors", "error"))
+    }
+    if local_cache is not None:
+        lookups[("l1", "hit")] = local_cache.hits
+        lookups[("l1", "miss")] = local_cache.misses
+    return lookups
+
+
+CallbackCounter("cache_lookups_total", "Cache lookups by tier and result", _cache_lookups, ("tier", "result"))
+CallbackCounter("redis_round_trips_total", "Commands and pipelines sent to Redis", lambda: _redis_stats["round_trips"])
+
 
 def get_cache_key_user_chatrooms(user_id: int) -> str:
-    """Generate cache key for user chatrooms"""
-    return f"user_chatrooms:{user_id}"
+    """Generate cache key for a user's rendered chatroom list"""
+    return f"user_chatrooms_json:{user_id}"
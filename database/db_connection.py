@@ -1,8 +1,14 @@
+import asyncio
 import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import NullPool
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,19 +18,151 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 if not SQLALCHEMY_DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# "async" uses an async driver (asyncpg / aiosqlite), "sync" runs the sync engine on worker threads
+DATABASE_MODE = os.getenv("DATABASE_MODE", "async")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Connection pool configuration, per engine (not used for SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds before a pooled connection is replaced, -1 never
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# PostgreSQL statement_timeout in milliseconds, 0 disables
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Connect through PgBouncer in transaction pooling mode: PgBouncer does the pooling,
+# and prepared statement caches and startup parameters are turned off
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+
+def get_async_database_url(url: str) -> str:
+    """Map a sync database URL onto its async driver"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix) :]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://") :]
+    return url
+
+
+def engine_options(url: str) -> dict:
+    """Keyword arguments for create_engine / create_async_engine for ``url``"""
+    if url.startswith("sqlite"):
+        return {}
+    is_asyncpg = url.startswith("postgresql+asyncpg")
+    if DB_PGBOUNCER:
+        # statement_timeout should be set on the database role, since PgBouncer rejects startup parameters
+        options = {"poolclass": NullPool}
+        if is_asyncpg:
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                # Server connections are shared, so prepared statement names must be unique
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        return options
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS and url.startswith("postgres"):
+        if is_asyncpg:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or get_async_database_url(SQLALCHEMY_DATABASE_URL)
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+async_engine = (
+    create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL)) if DATABASE_MODE == "async" else None
+)
+
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if async_engine is not None else None
+)
 
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
+class SyncSessionAdapter:
+    """
+    Exposes the subset of the AsyncSession API the services use on top of a
+    sync Session, running each database call on a worker thread. Used when
+    DATABASE_MODE=sync so the same async services work with either engine.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    async def execute(self, statement, params=None, **kwargs) -> Any:
+        return await asyncio.to_thread(self.sync_session.execute, statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs) -> Any:
+        return await asyncio.to_thread(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs) -> Any:
+        return await asyncio.to_thread(self.sync_session.scalars, statement, params, **kwargs)
+
+    async def get(self, entity, ident, **kwargs) -> Any:
+        return await asyncio.to_thread(self.sync_session.get, entity, ident, **kwargs)
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def flush(self):
+        await asyncio.to_thread(self.sync_session.flush)
+
+    async def commit(self):
+        await asyncio.to_thread(self.sync_session.commit)
+
+    async def rollback(self):
+        await asyncio.to_thread(self.sync_session.rollback)
+
+    async def refresh(self, instance, attribute_names=None):
+        await asyncio.to_thread(self.sync_session.refresh, instance, attribute_names)
+
+    async def delete(self, instance):
+        await asyncio.to_thread(self.sync_session.delete, instance)
+
+    async def close(self):
+        await asyncio.to_thread(self.sync_session.close)
+
+
+def new_session():
+    if AsyncSessionLocal is not None:
+        return AsyncSessionLocal()
+    return SyncSessionAdapter(SessionLocal())
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[Any]:
+    """Session for background work outside a request"""
+    db = new_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def get_db():
+    db = new_session()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
 
 
 def create_table():
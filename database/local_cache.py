@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Tuple
+
+# Returned by LocalCache.get on a miss, since None can be a cached value
+MISSING = object()
+
+
+class LocalCache:
+    """
+    Bounded, thread-safe in-process LRU with a per-entry TTL, used as the L1
+    tier in front of Redis.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str, kind: str = "json") -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((key, kind))
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[(key, kind)]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end((key, kind))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: Any, kind: str = "json", ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._entries[(key, kind)] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end((key, kind))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                for kind in ("json", "bytes"):
+                    if self._entries.pop((key, kind), None) is not None:
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
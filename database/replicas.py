@@ -0,0 +1,158 @@
+import asyncio
+import itertools
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from middleware.metrics import CallbackCounter
+
+from .cache import get_async_redis_client, get_redis_client
+from .db_connection import (
+    DATABASE_MODE,
+    SyncSessionAdapter,
+    async_engine,
+    engine,
+    engine_options,
+    get_async_database_url,
+    new_session,
+)
+from .local_cache import MISSING, LocalCache
+
+# Comma-separated read replica URLs (same form as DATABASE_URL); empty sends every read to the primary
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# After a user writes, their reads go to the primary for this long; keep it above the replication lag
+DB_REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+# Recent writers remembered in-process, in front of the shared Redis marker
+DB_REPLICA_STICKY_LOCAL_SIZE = int(os.getenv("DB_REPLICA_STICKY_LOCAL_SIZE", "10000"))
+
+# User whose request is running, so writes on the primary can be attributed to them
+current_writer: ContextVar[Optional[int]] = ContextVar("current_writer", default=None)
+
+
+def get_cache_key_recent_write(user_id: int) -> str:
+    """Generate cache key marking a user's recent write"""
+    return f"recent_write:{user_id}"
+
+
+def _replica(url: str) -> Tuple[Any, Callable[[], Any]]:
+    """Engine and session factory for one replica, matching DATABASE_MODE"""
+    if DATABASE_MODE == "async":
+        async_url = get_async_database_url(url)
+        replica_engine = create_async_engine(async_url, **engine_options(async_url))
+        return replica_engine, async_sessionmaker(replica_engine, autoflush=False, expire_on_commit=False)
+    replica_engine = create_engine(url, **engine_options(url))
+    factory = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=replica_engine)
+    return replica_engine, lambda: SyncSessionAdapter(factory())
+
+
+class ReplicaRouter:
+    """
+    Hands out sessions for read-only work: replicas in round robin, except for
+    users who wrote within DB_REPLICA_STICKY_SECONDS, who read from the
+    primary so they always see their own writes. Recent writers are marked in
+    Redis so the stickiness holds across pods.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [_replica(url) for url in urls]
+        self._next = itertools.count()
+        # user id -> when the Redis marker was last refreshed
+        self._recent_writers = LocalCache(DB_REPLICA_STICKY_LOCAL_SIZE, DB_REPLICA_STICKY_SECONDS)
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._marking: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def mark_write(self, user_id: int):
+        """
+        Route the user's reads to the primary for the next DB_REPLICA_STICKY_SECONDS.
+        Also called from engine hooks, so it never waits on Redis from the event
+        loop: the shared marker is set by a background task there.
+        """
+        now = time.monotonic()
+        refreshed_at = self._recent_writers.get(str(user_id))
+        # Refresh the shared marker at most every half window; the local entry always moves forward
+        if refreshed_at is MISSING or now - refreshed_at > DB_REPLICA_STICKY_SECONDS / 2:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is None:
+                # Threadpool worker (sync database mode); blocking here does not stall the loop
+                self._set_marker(user_id)
+            else:
+                task = loop.create_task(self._set_marker_async(user_id))
+                self._marking.add(task)
+                task.add_done_callback(self._marking.discard)
+            refreshed_at = now
+        self._recent_writers.put(str(user_id), refreshed_at)
+
+    def _set_marker(self, user_id: int):
+        try:
+            get_redis_client().set(get_cache_key_recent_write(user_id), 1, px=int(DB_REPLICA_STICKY_SECONDS * 1000))
+        except Exception as e:
+            print(f"Warning: Failed to mark recent write for user {user_id}: {e}")
+
+    async def _set_marker_async(self, user_id: int):
+        try:
+            await get_async_redis_client().set(
+                get_cache_key_recent_write(user_id), 1, px=int(DB_REPLICA_STICKY_SECONDS * 1000)
+            )
+        except Exception as e:
+            print(f"Warning: Failed to mark recent write for user {user_id}: {e}")
+
+    async def is_sticky(self, user_id: int) -> bool:
+        if self._recent_writers.get(str(user_id)) is not MISSING:
+            return True
+        try:
+            return bool(await get_async_redis_client().exists(get_cache_key_recent_write(user_id)))
+        except Exception:
+            # Unknown; the primary is always correct
+            return True
+
+    async def new_session(self, user_id: Optional[int] = None):
+        """Session for read-only work on behalf of ``user_id``"""
+        if not self.replicas or (user_id is not None and await self.is_sticky(user_id)):
+            self.primary_reads += 1
+            return new_session()
+        self.replica_reads += 1
+        _, factory = self.replicas[next(self._next) % len(self.replicas)]
+        return factory()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+        }
+
+
+replica_router = ReplicaRouter(DATABASE_REPLICA_URLS)
+
+CallbackCounter(
+    "db_read_sessions_total",
+    "Read-only sessions by target database",
+    lambda: {("replica",): replica_router.replica_reads, ("primary",): replica_router.primary_reads},
+    ("target",),
+)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        user_id = current_writer.get()
+        if user_id is not None:
+            replica_router.mark_write(user_id)
+
+
+if replica_router.enabled:
+    for primary in (engine, async_engine.sync_engine if async_engine is not None else None):
+        if primary is not None:
+            event.listen(primary, "after_cursor_execute", _after_cursor_execute)
@@ -1,16 +1,68 @@
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
+from auth.otp_store import OTP_STORE, otp_retention_job
 from auth.router import router, user_router
 from chatroom.router import router as chatroom_router
+from chatroom.archive import MESSAGE_ARCHIVE_ENABLED, message_archive_job
+from chatroom.gemini import gemini_client
+from chatroom.notifications import notification_hub
+from chatroom.partitions import MESSAGE_PARTITIONING
+from chatroom.services import MESSAGE_DISPATCH, message_scheduler, recover_unfinished_messages
+from chatroom.write_behind import message_write_behind
+from database.db_connection import async_engine, engine
+from middleware import profiler
+from middleware.metrics import METRICS_ENABLED, METRICS_PATH, MetricsMiddleware, instrument_engine, metrics_endpoint
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await gemini_client.start()
+    await notification_hub.start()
+    if MESSAGE_DISPATCH == "local":
+        await message_scheduler.start()
+        # Stream mode leaves this to the workers
+        try:
+            await recover_unfinished_messages()
+        except Exception as e:
+            print(f"Warning: Failed to recover unfinished messages: {e}")
+    if OTP_STORE == "sql":
+        await otp_retention_job.start()
+    if MESSAGE_ARCHIVE_ENABLED or MESSAGE_PARTITIONING:
+        await message_archive_job.start()
+    try:
+        yield
+    finally:
+        await message_archive_job.stop()
+        await otp_retention_job.stop()
+        await message_scheduler.stop()
+        # Flush buffered status updates before the process exits
+        await message_write_behind.stop()
+        await notification_hub.stop()
+        await gemini_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(router)
 app.include_router(user_router)
 app.include_router(chatroom_router)
 
+if profiler.QUERY_PROFILER_ENABLED:
+    profiler.instrument_engine(engine)
+    if async_engine is not None:
+        profiler.instrument_engine(async_engine.sync_engine)
+    app.add_middleware(profiler.QueryProfilerMiddleware)
+
+if METRICS_ENABLED:
+    instrument_engine(engine)
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine)
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route(METRICS_PATH, metrics_endpoint, methods=["GET"], include_in_schema=False)
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,30 +1,64 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from auth.identity import CurrentUser
+from auth.models import Users
 from auth.services import verify_token
+from auth.user_cache import cache_user, get_cached_user
+from database.db_connection import get_db
+from database.replicas import current_writer, replica_router
 
 security = HTTPBearer()
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_db)
+) -> CurrentUser:
     """
-    Dependency to get current authenticated user from JWT token
+    Dependency to get current authenticated user from JWT token.
+
+    The user id comes from the token's ``sub`` claim and the rest of the
+    identity from the user cache, so the database is only hit on a cache miss.
     """
     try:
-        payload = verify_token(credentials.credentials)
+        payload = await verify_token(credentials.credentials)
+        user_id = payload.get("sub")
         phone = payload.get("phone")
 
-        if phone is None:
+        if user_id is None or phone is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid authentication credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-
-        return {"phone": phone}
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=str(e),
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    user = await get_cached_user(int(user_id))
+    if user is None:
+        db_user = await db.get(Users, int(user_id))
+        if not db_user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        user = CurrentUser.from_model(db_user)
+        await cache_user(user)
+
+    # Writes made while serving this request count as the user's own for replica stickiness
+    current_writer.set(user.id)
+    return user
+
+
+async def get_read_db(current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Session for read-only endpoints: a read replica when configured, or the
+    primary while the user's own recent writes may not have replicated yet
+    """
+    db = await replica_router.new_session(current_user.id)
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -0,0 +1,258 @@
+import inspect
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from fastapi import Response
+from sqlalchemy import event
+
+# Metrics configuration
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+
+# Histogram upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+GEMINI_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+LabelValues = Tuple[str, ...]
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        registry.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    """
+    Monotonic counter per label set. Increments are plain dict updates without
+    a lock: the event loop is single threaded, and a rare lost increment from a
+    worker thread is an acceptable price for keeping the hot path this cheap.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for label_values, value in list(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    """
+    Pre-aggregated histogram: each observation bumps one bucket slot and the
+    running sum, and cumulative counts are only computed at scrape time
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self.values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        slots = self.values.get(label_values)
+        if slots is None:
+            slots = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        slots[bisect_left(self.buckets, value)] += 1
+        slots[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for label_values, slots in list(self.values.items()):
+            slots = list(slots)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), slots):
+                cumulative += count
+                bucket_labels = _format_labels(self.labels, label_values, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(slots[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """
+    Value read from a callback at scrape time, so the code that owns the state
+    does no extra work. The callback may be async and may return one value or
+    a mapping of label values to values.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Union[GaugeValue, Awaitable[GaugeValue]]],
+        labels: Sequence[str] = (),
+    ):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    async def collect(self) -> Dict[LabelValues, float]:
+        value = self.callback()
+        if inspect.isawaitable(value):
+            value = await value
+        if isinstance(value, dict):
+            return value
+        return {(): value}
+
+    async def render(self) -> List[str]:
+        try:
+            values = await self.collect()
+        except Exception as e:
+            print(f"Warning: Failed to collect metric {self.name}: {e}")
+            return []
+        lines = self.header()
+        for label_values, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class CallbackCounter(Gauge):
+    """Counter whose running total is kept by its owner and read at scrape time"""
+
+    type = "counter"
+
+
+registry: List[Metric] = []
+
+
+async def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in registry:
+        rendered = metric.render()
+        if inspect.isawaitable(rendered):
+            rendered = await rendered
+        lines.extend(rendered)
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint() -> Response:
+    return Response(content=await render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+http_requests = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route"), LATENCY_BUCKETS
+)
+http_request_db_queries = Histogram(
+    "http_request_db_queries", "Database queries issued per HTTP request", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+http_request_db_seconds = Histogram(
+    "http_request_db_seconds", "Database time spent per HTTP request", ("method", "route"), LATENCY_BUCKETS
+)
+db_query_seconds = Histogram("db_query_duration_seconds", "Database statement latency", (), QUERY_LATENCY_BUCKETS)
+
+# [queries, seconds] accumulated by the engine hooks for the current request
+_request_db: ContextVar[Optional[List[float]]] = ContextVar("request_db", default=None)
+
+
+class MetricsMiddleware:
+    """
+    Records latency and status per route template (``/chatroom/{chatroom_id}``,
+    never the raw path) plus the database work each request caused
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        db = [0, 0.0]
+        token = _request_db.set(db)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db.reset(token)
+            route = scope.get("route")
+            route = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            http_requests.inc(method, route, str(status_code))
+            http_request_seconds.observe(elapsed, method, route)
+            http_request_db_queries.observe(db[0], method, route)
+            http_request_db_seconds.observe(db[1], method, route)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+    db_query_seconds.observe(elapsed)
+    db = _request_db.get()
+    if db is not None:
+        db[0] += 1
+        db[1] += elapsed
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute
+    if context.connection is not None:
+        starts = context.connection.info.get("metrics_query_start")
+        if starts:
+            starts.pop()
+
+
+def instrument_engine(engine):
+    """Time every statement on a (sync) engine; pass ``async_engine.sync_engine`` for async engines"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
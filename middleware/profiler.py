@@ -0,0 +1,214 @@
+import cProfile
+import hashlib
+import hmac
+import os
+import random
+import re
+import tempfile
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+# Query profiler configuration. Installing the engine hooks is opt-in; once
+# installed, requests are profiled by sampling or on demand via a header.
+QUERY_PROFILER_ENABLED = os.getenv("QUERY_PROFILER_ENABLED", "false").lower() == "true"
+QUERY_PROFILER_SAMPLE_RATE = float(os.getenv("QUERY_PROFILER_SAMPLE_RATE", "0"))
+# Requests sending this header with QUERY_PROFILER_TOKEN as its value are always profiled
+QUERY_PROFILER_HEADER = os.getenv("QUERY_PROFILER_HEADER", "X-Profile-Queries").lower().encode()
+QUERY_PROFILER_TOKEN = os.getenv("QUERY_PROFILER_TOKEN", "")
+# Also run cProfile on profiled requests and dump the stats to QUERY_PROFILER_DUMP_DIR
+QUERY_PROFILER_CPU = os.getenv("QUERY_PROFILER_CPU", "false").lower() == "true"
+QUERY_PROFILER_DUMP_DIR = os.getenv("QUERY_PROFILER_DUMP_DIR", os.path.join(tempfile.gettempdir(), "profiles"))
+# Statements slower than this are logged for every request, profiled or not
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# The same statement shape this many times in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+_PLACEHOLDER = re.compile(r"\$\d+(?:::\w+)?|%\(\w+\)s|:\w+|\?")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Normalize a statement so executions that differ only in bound values or
+    IN-list length compare equal
+    """
+    shape = _PLACEHOLDER.sub("?", statement)
+    shape = _PLACEHOLDER_LIST.sub("(?, ...)", shape)
+    shape = _NUMBER.sub("N", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+def parameter_fingerprint(parameters) -> str:
+    """Short hash of the bound values, to tell repeated executions apart without logging the values"""
+    return hashlib.sha1(repr(parameters).encode()).hexdigest()[:12]
+
+
+class RequestProfile:
+    """Statements executed while serving one request"""
+
+    def __init__(self, method: str, route: str):
+        self.method = method
+        self.route = route
+        self.statements: List[Tuple[str, float]] = []
+        self.started = time.perf_counter()
+
+    @property
+    def query_time(self) -> float:
+        return sum(elapsed for _, elapsed in self.statements)
+
+    def by_shape(self) -> List[Tuple[str, int, float]]:
+        """(shape, executions, total seconds), most executed first"""
+        shapes: Dict[str, List[float]] = defaultdict(list)
+        for statement, elapsed in self.statements:
+            shapes[statement_shape(statement)].append(elapsed)
+        return sorted(
+            ((shape, len(times), sum(times)) for shape, times in shapes.items()), key=lambda item: (-item[1], -item[2])
+        )
+
+    def repeated(self) -> List[Tuple[str, int, float]]:
+        """Statement shapes executed often enough to suggest an N+1 pattern"""
+        return [item for item in self.by_shape() if item[1] >= N_PLUS_ONE_THRESHOLD]
+
+    def report(self, status: int) -> str:
+        total = time.perf_counter() - self.started
+        lines = [
+            f"Query profile {self.method} {self.route} -> {status}: {len(self.statements)} queries, "
+            f"{self.query_time * 1000:.1f} ms in the database, {total * 1000:.1f} ms total"
+        ]
+        for shape, count, elapsed in self.by_shape():
+            lines.append(f"  {count:>3}x {elapsed * 1000:8.2f} ms  {shape[:300]}")
+        for shape, count, _ in self.repeated():
+            lines.append(f"  Possible N+1: {count} executions of {shape[:300]}")
+        return "\n".join(lines)
+
+
+# Route of the request being served, for attributing slow queries
+_current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+_cpu_profiling = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["profiler_query_start"].pop()
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.statements.append((statement, elapsed))
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        print(
+            f"Slow query ({elapsed * 1000:.1f} ms, params {parameter_fingerprint(parameters)}"
+            f"{', executemany' if executemany else ''}) during {_current_route.get() or 'background work'}: "
+            f"{statement_shape(statement)[:1000]}"
+        )
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute
+    if context.connection is not None:
+        starts = context.connection.info.get("profiler_query_start")
+        if starts:
+            starts.pop()
+
+
+def instrument_engine(engine):
+    """Record statements on a (sync) engine; pass ``async_engine.sync_engine`` for async engines"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _requested(scope) -> bool:
+    if not QUERY_PROFILER_TOKEN:
+        return False
+    for name, value in scope["headers"]:
+        if name == QUERY_PROFILER_HEADER:
+            # Compared as bytes in constant time; header values need not be valid UTF-8
+            return hmac.compare_digest(value, QUERY_PROFILER_TOKEN.encode())
+    return False
+
+
+def _dump_path(method: str, route: str) -> str:
+    os.makedirs(QUERY_PROFILER_DUMP_DIR, exist_ok=True)
+    name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    return os.path.join(QUERY_PROFILER_DUMP_DIR, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{method}-{name}.prof")
+
+
+class QueryProfilerMiddleware:
+    """
+    Profiles sampled requests (QUERY_PROFILER_SAMPLE_RATE) and requests
+    carrying the profiler header: prints every statement shape with its count
+    and time, flags likely N+1 patterns, adds ``X-Query-Count`` and
+    ``X-Query-Time-Ms`` response headers and, with QUERY_PROFILER_CPU, dumps
+    cProfile stats. cProfile sees everything on the event loop thread, so
+    concurrent requests show up in the dump as well; only one request is
+    CPU-profiled at a time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _cpu_profiling
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route_token = _current_route.set(scope["path"])
+        if not (_requested(scope) or (QUERY_PROFILER_SAMPLE_RATE and random.random() < QUERY_PROFILER_SAMPLE_RATE)):
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _current_route.reset(route_token)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        profile_token = _current_profile.set(profile)
+        status_code = 500
+
+        async def send_with_headers(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-query-count", str(len(profile.statements)).encode()),
+                    (b"x-query-time-ms", f"{profile.query_time * 1000:.2f}".encode()),
+                ]
+            await send(message)
+
+        cpu_profiler = None
+        if QUERY_PROFILER_CPU and not _cpu_profiling:
+            _cpu_profiling = True
+            cpu_profiler = cProfile.Profile()
+            cpu_profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            if cpu_profiler is not None:
+                cpu_profiler.disable()
+                _cpu_profiling = False
+            _current_profile.reset(profile_token)
+            _current_route.reset(route_token)
+
+            # Report against the route template once routing has resolved it
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                profile.route = route
+            print(profile.report(status_code))
+            if cpu_profiler is not None:
+                path = _dump_path(profile.method, profile.route)
+                try:
+                    cpu_profiler.dump_stats(path)
+                    print(f"  CPU profile written to {path}")
+                except OSError as e:
+                    print(f"Warning: Failed to write CPU profile: {e}")
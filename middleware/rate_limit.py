@@ -0,0 +1,203 @@
+import math
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from auth.services import verify_token
+from database.cache import get_async_redis_client
+from middleware.metrics import CallbackCounter
+
+# Rate limiting configuration; limits are "<requests>/<seconds>", empty disables
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Allow requests when Redis cannot be reached instead of rejecting them
+RATE_LIMIT_FAIL_OPEN = os.getenv("RATE_LIMIT_FAIL_OPEN", "true").lower() == "true"
+RATE_LIMIT_GLOBAL = os.getenv("RATE_LIMIT_GLOBAL", "")
+RATE_LIMIT_MESSAGE = os.getenv("RATE_LIMIT_MESSAGE", "30/60")
+RATE_LIMIT_MESSAGE_ROUTE = os.getenv("RATE_LIMIT_MESSAGE_ROUTE", "")
+RATE_LIMIT_OTP = os.getenv("RATE_LIMIT_OTP", "5/60")
+# Reject new work while this many messages are waiting to be processed (0 disables)
+LOAD_SHED_BACKLOG = int(os.getenv("LOAD_SHED_BACKLOG", "900"))
+LOAD_SHED_RETRY_AFTER = int(os.getenv("LOAD_SHED_RETRY_AFTER", "5"))
+
+# Token buckets checked together: nothing is taken unless every bucket has
+# enough tokens, and the reply is 0 (allowed) or the milliseconds until it
+# would be. ARGV holds (tokens per millisecond, burst) for each key, then the
+# cost, which callers keep within every bucket's burst.
+_TOKEN_BUCKET = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local cost = tonumber(ARGV[2 * #KEYS + 1])
+local tokens = {}
+local wait = 0
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local available = tonumber(bucket[1]) or burst
+    local last = tonumber(bucket[2]) or now
+    available = math.min(burst, available + math.max(0, now - last) * rate)
+    tokens[i] = available
+    if available < cost then
+        wait = math.max(wait, math.ceil((cost - available) / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', KEYS[i], 'tokens', tokens[i] - cost, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(burst / rate) + 1000)
+end
+return 0
+"""
+
+_optional_security = HTTPBearer(auto_error=False)
+
+
+def parse_limit(spec: str) -> Optional[Tuple[float, int]]:
+    """Parse "<requests>/<seconds>" into (tokens per millisecond, burst)"""
+    if not spec:
+        return None
+    count, seconds = spec.split("/")
+    return int(count) / (float(seconds) * 1000), int(count)
+
+
+def get_cache_key_rate_limit(*parts) -> str:
+    """Generate key of a rate-limit bucket"""
+    return "rate_limit:" + ":".join(str(part) for part in parts)
+
+
+class RateLimitStats:
+    def __init__(self):
+        self.allowed = 0
+        self.limited = 0
+        self.shed = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        return {"allowed": self.allowed, "limited": self.limited, "shed": self.shed, "errors": self.errors}
+
+
+rate_limit_stats = RateLimitStats()
+
+CallbackCounter(
+    "rate_limit_decisions_total",
+    "Rate limited requests by decision",
+    lambda: {(decision,): count for decision, count in rate_limit_stats.as_dict().items()},
+    ("decision",),
+)
+_script = None
+
+
+async def _take(buckets: List[Tuple[str, Tuple[float, int]]], cost: int = 1) -> float:
+    """Take ``cost`` tokens from every bucket in a single Redis round trip; returns seconds to wait (0 if allowed)"""
+    global _script
+    if _script is None:
+        _script = get_async_redis_client().register_script(_TOKEN_BUCKET)
+    args = []
+    for _, (rate, burst) in buckets:
+        args += [rate, burst]
+    args.append(cost)
+    wait_ms = await _script(keys=[key for key, _ in buckets], args=args)
+    return int(wait_ms) / 1000
+
+
+class RateLimit:
+    """
+    FastAPI dependency enforcing token buckets per caller, per route and
+    globally, plus load shedding on processing backlog. Callers are keyed by
+    the user id in their bearer token, or by client address without one.
+
+    Usage: ``@router.post(..., dependencies=[Depends(RateLimit("message", per_caller="20/60"))])``
+
+    Endpoints doing the work of several requests call ``check`` themselves
+    with the number of items as the cost.
+    """
+
+    def __init__(
+        self,
+        route: str,
+        per_caller: str = "",
+        per_route: str = "",
+        global_limit: str = RATE_LIMIT_GLOBAL,
+        backlog: Optional[Callable[[], Awaitable[int]]] = None,
+        max_backlog: int = LOAD_SHED_BACKLOG,
+    ):
+        self.route = route
+        self.per_caller = parse_limit(per_caller)
+        self.per_route = parse_limit(per_route)
+        self.global_limit = parse_limit(global_limit)
+        self.backlog = backlog
+        self.max_backlog = max_backlog
+
+    @staticmethod
+    async def _caller(request: Request, credentials: Optional[HTTPAuthorizationCredentials]) -> str:
+        if credentials is not None:
+            try:
+                return f"user:{(await verify_token(credentials.credentials))['sub']}"
+            except (ValueError, KeyError):
+                # Rejected later by authentication; limit by address meanwhile
+                pass
+        return f"client:{request.client.host if request.client else 'unknown'}"
+
+    async def __call__(
+        self, request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(_optional_security)
+    ):
+        await self.check(await self._caller(request, credentials))
+
+    async def check(self, caller: str, cost: int = 1):
+        """Raise HTTPException unless ``caller`` may spend ``cost`` requests' worth of tokens"""
+        if not RATE_LIMIT_ENABLED:
+            return
+
+        if self.backlog is not None and self.max_backlog > 0 and await self.backlog() >= self.max_backlog:
+            rate_limit_stats.shed += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Server is busy, please retry later",
+                headers={"Retry-After": str(LOAD_SHED_RETRY_AFTER)},
+            )
+
+        buckets = []
+        if self.per_caller:
+            buckets.append((get_cache_key_rate_limit(self.route, caller), self.per_caller))
+        if self.per_route:
+            buckets.append((get_cache_key_rate_limit(self.route, "all"), self.per_route))
+        if self.global_limit:
+            buckets.append((get_cache_key_rate_limit("global"), self.global_limit))
+        if not buckets:
+            return
+
+        burst = min(limit[1] for _, limit in buckets)
+        if cost > burst:
+            # No amount of waiting lets this through
+            rate_limit_stats.limited += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Too many requests at once, the limit is {burst}",
+            )
+
+        try:
+            wait = await _take(buckets, cost)
+        except Exception:
+            rate_limit_stats.errors += 1
+            if RATE_LIMIT_FAIL_OPEN:
+                return
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Rate limiter is unavailable, please retry later",
+                headers={"Retry-After": str(LOAD_SHED_RETRY_AFTER)},
+            )
+
+        if wait > 0:
+            rate_limit_stats.limited += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+        rate_limit_stats.allowed += 1
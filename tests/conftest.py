@@ -0,0 +1,65 @@
+import os
+import tempfile
+
+import pytest
+
+# Modules read their configuration at import time
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-of-sufficient-length")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+
+@pytest.fixture(scope="session")
+def fake_redis_server():
+    # One server for the session: background threads (e.g. the cache
+    # invalidation listener) outlive a single test and keep their connection
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def fake_redis(fake_redis_server):
+    """Point the shared Redis clients at an empty in-memory server for the test"""
+    import fakeredis
+    from fakeredis import aioredis
+
+    from database import cache
+
+    server = fake_redis_server
+    server.connected = True
+    fakeredis.FakeRedis(server=server).flushall()
+    saved = dict(cache._clients)
+    cache._clients.update(
+        {
+            "text": fakeredis.FakeRedis(server=server, decode_responses=True),
+            "bytes": fakeredis.FakeRedis(server=server),
+            "async": aioredis.FakeRedis(server=server),
+        }
+    )
+    yield server
+    server.connected = True
+    cache._clients.clear()
+    cache._clients.update(saved)
+
+
+@pytest.fixture
+def api(fake_redis):
+    """The application, with its lifespan running, behind a test client"""
+    from fastapi.testclient import TestClient
+
+    import auth.models  # noqa: F401
+    import chatroom.models  # noqa: F401
+    import main
+    from database.db_connection import create_table
+
+    create_table()
+    with TestClient(main.app) as client:
+        yield client
+
+
+def login(client, phone: str) -> dict:
+    """Sign a user up if needed and return headers authenticating as them"""
+    client.post("/auth/signup", json={"phone": phone, "created_at": "2024-01-01T00:00:00", "is_active": True})
+    otp = client.post("/auth/send-otp", json={"phone": phone}).json()["otp"]
+    token = client.post("/auth/verify-otp", json={"phone": phone, "otp": otp}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,43 @@
+import asyncio
+
+from database import cache
+from conftest import login
+
+
+class LoopGuard:
+    """Sync Redis client that records calls made from a thread running an event loop"""
+
+    def __init__(self, client, blocked: list):
+        self._client = client
+        self._blocked = blocked
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                self._blocked.append(name)
+            except RuntimeError:
+                pass
+            return attr(*args, **kwargs)
+
+        return call
+
+
+def test_request_path_never_blocks_the_event_loop_on_redis(api):
+    headers = login(api, "async")
+    chatroom_id = api.post("/chatroom", headers=headers).json()["id"]
+
+    blocked = []
+    for kind in ("text", "bytes"):
+        cache._clients[kind] = LoopGuard(cache._clients[kind], blocked)
+
+    assert api.get("/user/me", headers=headers).status_code == 200
+    assert api.get("/chatroom", headers=headers).status_code == 200
+    assert api.get(f"/chatroom/{chatroom_id}", headers=headers).status_code == 200
+    assert api.post("/chatroom", headers=headers).status_code == 200
+    assert api.get(f"/chatroom/{chatroom_id}/messages", headers=headers).status_code == 200
+    assert blocked == []
@@ -0,0 +1,26 @@
+from conftest import login
+
+
+def test_batch_endpoints(api):
+    headers, other = login(api, "batch-1"), login(api, "batch-2")
+    foreign = api.post("/chatroom", headers=other).json()["id"]
+
+    response = api.post("/chatroom/batch", json={"count": 3}, headers=headers)
+    assert response.status_code == 200
+    ids = [chatroom["id"] for chatroom in response.json()["chatrooms"]]
+    assert len(set(ids)) == 3
+    assert api.get("/chatroom", headers=headers).json()["total_count"] == 3
+    assert api.post("/chatroom/batch", json={"count": 1000}, headers=headers).status_code == 400
+
+    messages = [
+        {"chatroom_id": ids[0], "content": "a"},
+        {"chatroom_id": foreign, "content": "b"},
+        {"chatroom_id": ids[1], "content": "c"},
+    ]
+    response = api.post("/chatroom/message/batch", json={"messages": messages}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["accepted"], body["failed"]) == (2, 1)
+    # Results line up with the request
+    assert [result["message"] and result["message"]["content"] for result in body["results"]] == ["a", None, "c"]
+    assert body["results"][1]["error"]
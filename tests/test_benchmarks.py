@@ -0,0 +1,49 @@
+import asyncio
+
+from aiohttp import web
+
+from benchmarks.gemini_stub import GeminiStub
+from benchmarks.report import Recorder, compare, percentile
+from chatroom.gemini import GeminiClient
+
+
+def test_percentiles_and_regressions():
+    assert percentile([5, 1, 4, 2, 3], 50) == 3
+    assert percentile([5, 1, 4, 2, 3], 99) == 5
+
+    recorder = Recorder()
+    for ms in range(1, 101):
+        recorder.record("op", ms / 1000, 200, True)
+    recorder.record("op", 0.5, 500, False)
+    summary = recorder.summary(duration=10)["op"]
+    assert (summary["count"], summary["p50_ms"], summary["statuses"]) == (101, 51.0, {"200": 100, "500": 1})
+
+    baseline = {"operations": {"op": summary}, "db_queries_per_request": 2.0}
+    assert compare({"operations": {"op": summary}, "db_queries_per_request": 2.0}, baseline, 0.2) == []
+    slower = {**summary, "p95_ms": summary["p95_ms"] * 2, "rps": summary["rps"] / 2}
+    regressions = compare({"operations": {"op": slower}, "db_queries_per_request": 3.0}, baseline, 0.2)
+    assert [regression.split(":")[0] for regression in regressions] == ["op p95_ms", "op rps", "db_queries_per_request"]
+
+
+def test_stub_answers_both_gemini_endpoints():
+    async def run():
+        runner = web.AppRunner(GeminiStub(latency=0.01, jitter=0, chunks=4).app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        base = f"http://127.0.0.1:{port}/v1beta/models/stub"
+        client = GeminiClient(
+            api_url=base + ":generateContent", stream_url=base + ":streamGenerateContent?alt=sse", api_key="k"
+        )
+        try:
+            answer = await client.generate("hello")
+            chunks = [chunk async for chunk in client.stream_generate("hello")]
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return answer, chunks
+
+    answer, chunks = asyncio.run(run())
+    assert answer.startswith("Stub answer to: hello")
+    assert len(chunks) == 4 and "".join(chunks) == answer
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from database import cache
+from database.local_cache import LocalCache
+
+
+@pytest.fixture
+def l1(monkeypatch):
+    local_cache = LocalCache(100, 30)
+    monkeypatch.setattr(cache, "local_cache", local_cache)
+    monkeypatch.setattr(cache._listener, "caches", [local_cache])
+    return local_cache
+
+
+def test_tag_invalidation_evicts_both_tiers(fake_redis, l1):
+    cache.CacheService.set("a", 1, tags=["t"])
+    cache.CacheService.set("b", 2, tags=["other"])
+    assert cache.CacheService.invalidate_tags("t")
+    assert cache.CacheService.get("a") is None
+    assert cache.CacheService.get("b") == 2
+
+    async def run():
+        await cache.AsyncCacheService.set("c", 3, tags=["t"])
+        assert await cache.AsyncCacheService.invalidate_tags("t")
+        assert await cache.AsyncCacheService.get("c") is None
+
+    asyncio.run(run())
+
+
+def test_failed_tag_invalidation_does_not_leave_l1_stale(fake_redis, l1):
+    cache.CacheService.set("a", 1, tags=["t"])
+    fake_redis.connected = False
+    assert not cache.CacheService.invalidate_tags("t")
+    assert cache.CacheService.get("a") is None
+
+    fake_redis.connected = True
+
+    async def run():
+        await cache.AsyncCacheService.set("c", 3, tags=["t"])
+        fake_redis.connected = False
+        assert not await cache.AsyncCacheService.invalidate_tags("t")
+        assert await cache.AsyncCacheService.get("c") is None
+
+    asyncio.run(run())
+
+
+def test_batch_operations_with_per_key_ttls_and_json_compatibility(fake_redis):
+    assert cache.CacheService.set_many({"a": {"n": 1}, "b": [1, 2]}, expire={"a": 100})
+    redis = cache.get_redis_bytes_client()
+    assert 95 <= redis.ttl("a") <= 100 and 295 <= redis.ttl("b") <= 300
+    # New values are msgpack; values written as JSON by older releases still read
+    assert redis.get("a").startswith(b"\xc1")
+    redis.set("old", b'{"n": 3}')
+    assert cache.CacheService.get_many(["a", "b", "old", "missing"]) == {"a": {"n": 1}, "b": [1, 2], "old": {"n": 3}}
+
+    async def run():
+        assert await cache.AsyncCacheService.get_many(["a", "old"]) == {"a": {"n": 1}, "old": {"n": 3}}
+        assert await cache.AsyncCacheService.delete_many(["a", "b"])
+        assert await cache.AsyncCacheService.get_many(["a", "b", "old"]) == {"old": {"n": 3}}
+
+    asyncio.run(run())
+
+
+def test_tags_and_pattern_invalidation(fake_redis):
+    cache.CacheService.set_many({"u1:a": 1, "u1:b": 2}, tags=[cache.tag_user(1)])
+    cache.CacheService.set("c1:a", 3, tags=[cache.tag_chatroom(1), cache.tag_user(1)])
+    cache.CacheService.set("u2:a", 4, tags=[cache.tag_user(2)])
+
+    assert cache.CacheService.invalidate_tags(cache.tag_user(1))
+    assert cache.CacheService.get_many(["u1:a", "u1:b", "c1:a", "u2:a"]) == {"u2:a": 4}
+    # The tag's own set goes too
+    assert not cache.get_redis_client().exists(cache.get_cache_key_tag(cache.tag_user(1)))
+
+    cache.CacheService.set_many({f"scan:{i}": i for i in range(7)})
+    assert cache.CacheService.invalidate_pattern("scan:*")
+    assert cache.CacheService.get_many([f"scan:{i}" for i in range(7)]) == {}
+    assert cache.CacheService.get("u2:a") == 4
@@ -0,0 +1,20 @@
+from database import cache
+from conftest import login
+
+
+def test_chatroom_list_is_served_from_cached_bytes_until_a_chatroom_is_created(api):
+    headers = login(api, "list")
+    api.post("/chatroom", headers=headers)
+    user_id = api.get("/user/me", headers=headers).json()["id"]
+    key = cache.get_cache_key_user_chatrooms(user_id)
+
+    first = api.get("/chatroom", headers=headers)
+    assert first.json()["total_count"] == 1
+    assert cache.get_redis_bytes_client().get(key) == first.content
+
+    # A hit is returned byte for byte, without rendering
+    cache.get_redis_bytes_client().set(key, b'{"chatrooms": [], "total_count": 42}')
+    assert api.get("/chatroom", headers=headers).json()["total_count"] == 42
+
+    api.post("/chatroom", headers=headers)
+    assert api.get("/chatroom", headers=headers).json()["total_count"] == 2
@@ -0,0 +1,97 @@
+import asyncio
+import re
+
+from sqlalchemy import insert, update
+
+from chatroom import context
+from chatroom.models import Chatroom, Message
+from database.db_connection import create_table, session_scope
+
+
+async def add_turns(chatroom_id: int, count: int):
+    async with session_scope() as db:
+        await db.execute(
+            insert(Message),
+            [
+                {"user_id": 1, "chatroom_id": chatroom_id, "content": "q", "response": "a", "status": "completed"}
+                for _ in range(count)
+            ],
+        )
+        await db.commit()
+
+
+def test_summary_is_folded_once_per_batch():
+    create_table()
+    batch = context.CONTEXT_SUMMARY_BATCH
+    calls = []
+
+    async def summarize(prompt: str) -> str:
+        calls.append(prompt)
+        return f"summary {len(calls)}"
+
+    async def run():
+        async with session_scope() as db:
+            chatroom = Chatroom(user_id=1)
+            db.add(chatroom)
+            await db.commit()
+            chatroom_id = chatroom.id
+
+        # One completed message at a time, each folding everything that slid out of the window
+        for _ in range(batch - 1):
+            await add_turns(chatroom_id, 1)
+            await context.fold_summary(chatroom_id, 10**9, summarize)
+        assert calls == []
+
+        await add_turns(chatroom_id, 1)
+        await context.fold_summary(chatroom_id, 10**9, summarize)
+        assert len(calls) == 1
+
+        await context.fold_summary(chatroom_id, 10**9, summarize)
+        assert len(calls) == 1
+
+        await add_turns(chatroom_id, 2 * batch)
+        for _ in range(3):
+            await context.fold_summary(chatroom_id, 10**9, summarize)
+        assert len(calls) == 3
+
+    asyncio.run(run())
+
+
+def test_no_turn_is_left_out_of_the_prompt(monkeypatch):
+    create_table()
+    monkeypatch.setattr(context, "CONTEXT_TOKEN_BUDGET", 100)
+
+    async def summarize(prompt: str) -> str:
+        return " ".join(re.findall(r"\bt\d+\b", prompt))
+
+    async def run():
+        async with session_scope() as db:
+            chatroom = Chatroom(user_id=1)
+            db.add(chatroom)
+            await db.commit()
+            chatroom_id = chatroom.id
+
+        for i in range(3 * context.CONTEXT_SUMMARY_BATCH + 5):
+            async with session_scope() as db:
+                message = Message(user_id=1, chatroom_id=chatroom_id, content=f"t{i} " + "x" * 36, status="pending")
+                db.add(message)
+                await db.commit()
+                message_id = message.id
+
+            contents, window_start_id = await context.build_contents(chatroom_id, message_id, message.content)
+            prompt = " ".join(part["text"] for turn in contents for part in turn["parts"])
+            assert set(re.findall(r"\bt\d+\b", prompt)) == {f"t{j}" for j in range(i + 1)}
+
+            async with session_scope() as db:
+                await db.execute(
+                    update(Message).where(Message.id == message_id).values(status="completed", response="a" * 40)
+                )
+                await db.commit()
+            await context.fold_summary(chatroom_id, window_start_id, summarize)
+
+        # Older turns did reach the prompt through the summary
+        async with session_scope() as db:
+            _, through_id = await context.load_summary(db, chatroom_id)
+        assert through_id > 0
+
+    asyncio.run(run())
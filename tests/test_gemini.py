@@ -0,0 +1,43 @@
+import asyncio
+import socket
+import threading
+
+from aiohttp import web
+
+from chatroom.gemini import GeminiClient
+
+
+def serve_stub() -> str:
+    """Answer generateContent from a thread with its own event loop; returns the URL"""
+
+    async def generate(request):
+        return web.json_response({"candidates": [{"content": {"parts": [{"text": "hi"}]}}]})
+
+    app = web.Application()
+    app.router.add_post("/generate", generate)
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    loop = asyncio.new_event_loop()
+
+    async def start():
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.SockSite(runner, sock).start()
+
+    loop.run_until_complete(start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{sock.getsockname()[1]}/generate"
+
+
+def test_client_can_be_used_from_successive_event_loops():
+    client = GeminiClient(api_url=serve_stub(), api_key="key")
+    # e.g. scripts or tests that call asyncio.run() more than once
+    assert asyncio.run(client.generate("one")) == "hi"
+
+    async def generate_and_close():
+        try:
+            return await client.generate("two")
+        finally:
+            await client.close()
+
+    assert asyncio.run(generate_and_close()) == "hi"
@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, update
+
+from chatroom import archive, services
+from chatroom.models import Chatroom, Message
+from database.db_connection import create_table, session_scope
+
+
+async def new_chatroom(messages: int, created_at: datetime) -> int:
+    async with session_scope() as db:
+        chatroom = Chatroom(user_id=1)
+        db.add(chatroom)
+        await db.flush()
+        await db.execute(
+            insert(Message),
+            [
+                {
+                    "user_id": 1,
+                    "chatroom_id": chatroom.id,
+                    "content": f"m{i}",
+                    "status": "completed",
+                    "created_at": created_at,
+                }
+                for i in range(messages)
+            ],
+        )
+        await db.commit()
+        return chatroom.id
+
+
+async def all_pages(chatroom_id: int, limit: int) -> list:
+    ids, before = [], None
+    while True:
+        async with session_scope() as db:
+            page, before = await services.get_chatroom_messages(db, Chatroom(id=chatroom_id), before, limit)
+        assert len(page) <= limit
+        ids += [message["id"] for message in page]
+        if before is None:
+            return ids
+
+
+async def message_ids(chatroom_id: int) -> list:
+    async with session_scope() as db:
+        query = select(Message.id).where(Message.chatroom_id == chatroom_id).order_by(Message.id.desc())
+        return list(await db.scalars(query))
+
+
+def test_pages_cover_every_message_once():
+    create_table()
+
+    async def run():
+        chatroom_id = await new_chatroom(11, datetime.now())
+        expected = await message_ids(chatroom_id)
+        assert await all_pages(chatroom_id, 4) == expected
+        assert await all_pages(chatroom_id, 11) == expected
+
+    asyncio.run(run())
+
+
+def test_pages_continue_into_the_archive(tmp_path, monkeypatch):
+    create_table()
+    monkeypatch.setattr(archive, "MESSAGE_ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(services, "MESSAGE_ARCHIVE_ENABLED", True)
+
+    async def run():
+        created_at = datetime.now() - timedelta(days=365)
+        # Leaves messages of other tests alone
+        cutoff = created_at + timedelta(days=1)
+        chatroom_id = await new_chatroom(13, created_at)
+        expected = await message_ids(chatroom_id)
+
+        # One message is still unfinished when the rest are archived in several segments,
+        # then finishes and lands in a later segment than newer messages
+        unfinished = expected[7]
+        async with session_scope() as db:
+            await db.execute(update(Message).where(Message.id == unfinished).values(status="processing"))
+            await db.commit()
+        assert await archive.archive_messages(cutoff, batch_size=5) == 12
+        assert await message_ids(chatroom_id) == [unfinished]
+        assert await all_pages(chatroom_id, 4) == expected
+
+        async with session_scope() as db:
+            await db.execute(update(Message).where(Message.id == unfinished).values(status="completed"))
+            await db.commit()
+        assert await archive.archive_messages(cutoff, batch_size=5) == 1
+        assert await message_ids(chatroom_id) == []
+        assert await all_pages(chatroom_id, 4) == expected
+        assert await all_pages(chatroom_id, 20) == expected
+
+        async with session_scope() as db:
+            assert (await archive.get_archived_message(db, chatroom_id, unfinished))["id"] == unfinished
+
+    asyncio.run(run())
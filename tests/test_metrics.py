@@ -0,0 +1,32 @@
+import re
+
+from conftest import login
+from middleware.metrics import Histogram, registry
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, "/a")
+    registry.remove(histogram)
+    lines = histogram.render()
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+
+
+def test_requests_are_recorded_by_route_template(api):
+    headers = login(api, "metrics")
+    chatroom_id = api.post("/chatroom", headers=headers).json()["id"]
+    api.get(f"/chatroom/{chatroom_id}", headers=headers)
+    api.get("/chatroom/999999", headers=headers)
+
+    body = api.get("/metrics").text
+    requests = dict(
+        re.findall(r'^(http_requests_total\{[^}]*route="/chatroom/\{chatroom_id\}"[^}]*\}) (\S+)$', body, re.M)
+    )
+    assert sum(float(value) for value in requests.values()) >= 2
+    # Concrete ids never become label values
+    assert f'/chatroom/{chatroom_id}"' not in body
+    assert "http_request_db_queries_bucket" in body and "message_backlog" in body
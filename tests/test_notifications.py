@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+import orjson
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from chatroom.notifications import MESSAGE_EVENTS_CHANNEL, notification_hub, publish_message_event
+from database import cache
+from conftest import login
+
+
+def subscribed() -> bool:
+    return cache.get_redis_client().pubsub_numsub(MESSAGE_EVENTS_CHANNEL)[0][1] > 0
+
+
+def test_message_events_reach_the_users_sockets(api):
+    headers = login(api, "ws-1")
+    user_id = api.get("/user/me", headers=headers).json()["id"]
+    token = headers["Authorization"].split()[1]
+
+    with pytest.raises(WebSocketDisconnect) as rejected:
+        with api.websocket_connect("/ws/messages?token=invalid") as websocket:
+            websocket.receive_text()
+    assert rejected.value.code == 1008
+
+    with api.websocket_connect(f"/ws/messages?token={token}") as websocket:
+        deadline = time.monotonic() + 5
+        while not (notification_hub.connection_count and subscribed()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Events for other users are not delivered to this socket
+        asyncio.run(publish_message_event(user_id + 1000, 1, 1, "completed", "not yours"))
+        asyncio.run(publish_message_event(user_id, 2, 3, "completed", "hi"))
+        event = orjson.loads(websocket.receive_text())
+        assert (event["user_id"], event["chatroom_id"], event["message_id"], event["status"]) == (
+            user_id,
+            2,
+            3,
+            "completed",
+        )
+    assert notification_hub.connection_count == 0
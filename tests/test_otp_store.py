@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from auth.models import OTP
+from auth.otp_store import RedisOTPStore, SQLOTPStore, purge_expired_otps
+from database.db_connection import create_table, session_scope
+
+
+async def verify_all(store, phone: str, otp: str, attempts: int) -> list:
+    async def verify():
+        async with session_scope() as db:
+            try:
+                await store.verify(db, phone, otp)
+                return True
+            except ValueError:
+                return False
+
+    return await asyncio.gather(*(verify() for _ in range(attempts)))
+
+
+@pytest.mark.parametrize("backend", ["redis", "sql"])
+def test_otp_is_consumed_once_and_only_when_it_matches(backend, fake_redis):
+    create_table()
+    store = RedisOTPStore() if backend == "redis" else SQLOTPStore()
+    phone = f"otp-{backend}"
+
+    async def run():
+        async with session_scope() as db:
+            await store.save(db, phone, "1234")
+            # A wrong guess does not burn the OTP
+            with pytest.raises(ValueError):
+                await store.verify(db, phone, "9999")
+        # Concurrent verifications of the same OTP succeed once
+        assert sorted(await verify_all(store, phone, "1234", 5)) == [False] * 4 + [True]
+
+    asyncio.run(run())
+
+
+def test_expired_otps_are_purged_in_batches():
+    create_table()
+
+    async def run():
+        long_ago = datetime.now() - timedelta(days=2)
+        async with session_scope() as db:
+            db.add_all(OTP(phone="purge", otp="1", created_at=long_ago, expired_at=long_ago) for _ in range(5))
+            await SQLOTPStore().save(db, "purge", "2")
+        assert await purge_expired_otps(batch_size=2, retention=3600) == 5
+        async with session_scope() as db:
+            assert await db.scalar(select(func.count()).select_from(OTP).where(OTP.phone == "purge")) == 1
+
+    asyncio.run(run())
@@ -0,0 +1,13 @@
+from middleware import profiler
+
+
+def test_profiling_token_is_compared_as_bytes(monkeypatch):
+    monkeypatch.setattr(profiler, "QUERY_PROFILER_TOKEN", "secret")
+
+    def scope(value: bytes) -> dict:
+        return {"headers": [(profiler.QUERY_PROFILER_HEADER, value)]}
+
+    assert profiler._requested(scope(b"secret"))
+    assert not profiler._requested(scope(b"secreT"))
+    assert not profiler._requested(scope(b"\xff\xfe"))
+    assert not profiler._requested({"headers": []})
@@ -0,0 +1,52 @@
+import asyncio
+
+
+from chatroom import prompt_cache as prompt_cache_module
+from chatroom.prompt_cache import PromptCache
+
+
+def test_identical_prompts_share_one_call(fake_redis):
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        cache = PromptCache()
+        results = await asyncio.gather(*(cache.get_or_generate("same  prompt", generate) for _ in range(5)))
+        assert results == ["answer"] * 5
+        # Whitespace differences hit the stored response
+        assert await cache.get_or_generate("same prompt", generate) == "answer"
+        assert len(calls) == 1
+        assert (cache.misses, cache.coalesced, cache.hits) == (1, 4, 1)
+
+        # Another process waits on the lease holder's result instead of calling Gemini itself
+        other = PromptCache()
+        first = asyncio.create_task(cache.get_or_generate("new prompt", generate))
+        await asyncio.sleep(0.01)
+        assert await other.get_or_generate("new prompt", generate) == "answer"
+        await first
+        assert len(calls) == 2 and other.coalesced == 1
+
+    asyncio.run(run())
+
+
+def test_failed_call_is_not_cached_and_releases_waiters(fake_redis, monkeypatch):
+    monkeypatch.setattr(prompt_cache_module, "PROMPT_CACHE_POLL_INTERVAL", 0.01)
+
+    async def fail():
+        await asyncio.sleep(0.02)
+        raise RuntimeError("gemini down")
+
+    async def ok():
+        return "recovered"
+
+    async def run():
+        cache = PromptCache()
+        results = await asyncio.gather(*(cache.get_or_generate("p", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert await cache.get_or_generate("p", ok) == "recovered"
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from middleware import rate_limit
+from middleware.rate_limit import RateLimit
+
+
+@pytest.fixture(autouse=True)
+def fresh_script(monkeypatch):
+    # The registered script is bound to the client that loaded it
+    monkeypatch.setattr(rate_limit, "_script", None)
+
+
+def status_of(check) -> int:
+    try:
+        asyncio.run(check)
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+def test_bucket_allows_burst_then_limits(fake_redis):
+    limit = RateLimit("test", per_caller="3/60")
+    assert [status_of(limit.check("a")) for _ in range(4)] == [200, 200, 200, 429]
+    # Other callers have their own bucket
+    assert status_of(limit.check("b")) == 200
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(limit.check("a"))
+    assert int(raised.value.headers["Retry-After"]) >= 1
+
+
+def test_buckets_are_taken_together_or_not_at_all(fake_redis):
+    limit = RateLimit("test", per_caller="3/60", per_route="4/60")
+    assert status_of(limit.check("a", cost=3)) == 200
+    # The route bucket has one token left: "b" is refused without spending its own
+    assert status_of(limit.check("b", cost=2)) == 429
+    assert status_of(limit.check("b")) == 200
+    assert status_of(limit.check("b")) == 429
+
+
+def test_redis_outage_fails_open_or_closed(fake_redis, monkeypatch):
+    limit = RateLimit("test", per_caller="1/60")
+    fake_redis.connected = False
+    errors = rate_limit.rate_limit_stats.errors
+    assert [status_of(limit.check("a")) for _ in range(3)] == [200, 200, 200]
+    assert rate_limit.rate_limit_stats.errors == errors + 3
+
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_FAIL_OPEN", False)
+    assert status_of(limit.check("a")) == 503
+
+
+def test_batch_larger_than_the_burst_is_rejected(fake_redis):
+    limit = RateLimit("test", per_caller="3/60")
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(limit.check("a", cost=4))
+    assert raised.value.status_code == 429 and "Retry-After" not in (raised.value.headers or {})
+    # Nothing was taken
+    assert status_of(limit.check("a", cost=3)) == 200
@@ -0,0 +1,52 @@
+import asyncio
+
+from database import replicas
+from database.replicas import ReplicaRouter
+
+
+def _target(router: ReplicaRouter, user_id=None) -> str:
+    async def open_session():
+        session = await router.new_session(user_id)
+        try:
+            bind = session.bind if hasattr(session, "bind") else session.sync_session.bind
+            return "replica" if bind in [engine for engine, _ in router.replicas] else "primary"
+        finally:
+            await session.close()
+
+    return asyncio.run(open_session())
+
+
+def test_recent_writer_reads_from_the_primary_on_every_pod(fake_redis, tmp_path, monkeypatch):
+    monkeypatch.setattr(replicas, "DB_REPLICA_STICKY_SECONDS", 30)
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    pod_a, pod_b = ReplicaRouter([url]), ReplicaRouter([url])
+
+    assert _target(pod_a, 7) == "replica"
+    assert _target(pod_a) == "replica"
+
+    # Marked outside the event loop (sync database mode), so the Redis marker is set before returning
+    pod_a.mark_write(7)
+    assert _target(pod_a, 7) == "primary"
+    # Another pod never saw the write, but finds the shared marker
+    assert _target(pod_b, 7) == "primary"
+    # Other users and anonymous reads keep using the replica
+    assert _target(pod_b, 8) == "replica"
+    assert _target(pod_b) == "replica"
+
+    assert pod_a.stats() == {"replicas": 1, "replica_reads": 2, "primary_reads": 1}
+    assert pod_b.stats() == {"replicas": 1, "replica_reads": 2, "primary_reads": 1}
+
+
+def test_reads_go_to_the_primary_when_redis_is_down(fake_redis, tmp_path):
+    router = ReplicaRouter([f"sqlite:///{tmp_path / 'replica.db'}"])
+    fake_redis.connected = False
+    # Stickiness is unknown, so the user's reads stay correct on the primary
+    assert _target(router, 7) == "primary"
+    assert _target(router) == "replica"
+
+
+def test_no_replicas_reads_from_the_primary(fake_redis):
+    router = ReplicaRouter([])
+    assert not router.enabled
+    assert _target(router, 7) == "primary"
+    assert router.stats() == {"replicas": 0, "replica_reads": 0, "primary_reads": 1}
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from chatroom.gemini import GeminiAPIError
+from chatroom.resilience import AdaptiveLimiter, CircuitBreaker, ResilientCaller
+
+
+def make_caller() -> ResilientCaller:
+    # Opens on the first failure and goes half-open right away
+    return ResilientCaller(
+        limiter=AdaptiveLimiter(initial=10), breaker=CircuitBreaker(failure_threshold=1, cooldown=0), max_retries=0
+    )
+
+
+def fail(status: int):
+    async def call():
+        raise GeminiAPIError(status)
+
+    return call
+
+
+async def ok():
+    return "ok"
+
+
+def test_probe_ending_in_client_error_closes_breaker():
+    async def run():
+        caller = make_caller()
+        with pytest.raises(GeminiAPIError):
+            await caller.call(fail(503))
+        assert caller.breaker.state == "open"
+
+        with pytest.raises(GeminiAPIError):
+            await caller.call(fail(400))
+        assert caller.breaker.state == "closed"
+        assert await caller.call(ok) == "ok"
+
+    asyncio.run(run())
+
+
+def test_cancelled_probe_releases_breaker():
+    async def run():
+        caller = make_caller()
+        with pytest.raises(GeminiAPIError):
+            await caller.call(fail(503))
+
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        probe = asyncio.create_task(caller.call(hang))
+        await started.wait()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert await caller.call(ok) == "ok"
+        assert caller.breaker.state == "closed"
+        assert caller.limiter.in_flight == 0
+
+    asyncio.run(run())
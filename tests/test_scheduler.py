@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from chatroom import services
+from chatroom.scheduler import MessageScheduler, SchedulerFullError, SchedulerNotRunningError
+from conftest import login
+
+
+def test_users_are_served_round_robin():
+    order = []
+
+    async def handle(message_id):
+        order.append(message_id)
+
+    async def run():
+        scheduler = MessageScheduler(handle, concurrency=1)
+        await scheduler.start()
+        # One user with a backlog, then two users with a message each
+        for message_id in (1, 2, 3, 4):
+            scheduler.submit(1, message_id)
+        scheduler.submit(2, 20)
+        scheduler.submit(3, 30)
+        await scheduler.stop()
+
+    asyncio.run(run())
+    assert order == [1, 20, 30, 2, 3, 4]
+
+
+def test_full_queue_refuses_work_and_stop_drains_it():
+    done = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def handle(message_id):
+            await gate.wait()
+            done.append(message_id)
+
+        scheduler = MessageScheduler(handle, concurrency=2, max_queue_depth=3)
+        await scheduler.start()
+        for message_id in (1, 2, 3):
+            scheduler.submit(message_id, message_id)
+        with pytest.raises(SchedulerFullError):
+            scheduler.submit(4, 4)
+
+        stopping = asyncio.create_task(scheduler.stop(timeout=5))
+        await asyncio.sleep(0.01)
+        with pytest.raises(SchedulerNotRunningError):
+            scheduler.submit(5, 5)
+        gate.set()
+        await stopping
+        assert scheduler.depth == 0
+
+    asyncio.run(run())
+    assert sorted(done) == [1, 2, 3]
+
+
+def test_send_message_returns_503_when_the_queue_is_full(api, monkeypatch):
+    headers = login(api, "503")
+    chatroom_id = api.post("/chatroom", headers=headers).json()["id"]
+    monkeypatch.setattr(services.message_scheduler, "max_queue_depth", 0)
+
+    response = api.post(f"/chatroom/{chatroom_id}/message", json={"content": "hi"}, headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
@@ -0,0 +1,62 @@
+import asyncio
+
+import orjson
+
+from chatroom import streaming
+from chatroom.models import Chatroom, Message
+from chatroom.streaming import ResponseStream, follow_response
+from database.db_connection import create_table, session_scope
+
+
+def parse(events: list) -> list:
+    parsed = []
+    for event in events:
+        fields = dict(line.split(": ", 1) for line in event.decode().strip().split("\n"))
+        parsed.append((fields.get("event"), int(fields["id"]), orjson.loads(fields["data"])))
+    return parsed
+
+
+def test_live_response_is_streamed_chunk_by_chunk():
+    async def run():
+        stream = streaming.live_streams[-1] = ResponseStream()
+        events = []
+
+        async def follow():
+            async for event in follow_response(-1):
+                events.append(event)
+
+        follower = asyncio.create_task(follow())
+        for chunk in ("Hel", "lo", " there"):
+            await asyncio.sleep(0.01)
+            stream.append(chunk)
+        stream.finish("completed")
+        await asyncio.wait_for(follower, timeout=1)
+        del streaming.live_streams[-1]
+        return parse(events)
+
+    events = asyncio.run(run())
+    assert "".join(data.get("text", "") for _, _, data in events) == "Hello there"
+    assert events[-1] == ("done", 11, {"status": "completed", "offset": 11})
+    # Event ids are offsets, so a reconnecting client resumes with Last-Event-ID
+    assert [event_id for _, event_id, _ in events[:-1]] == sorted({event_id for _, event_id, _ in events[:-1]})
+
+
+def test_follow_resumes_from_an_offset_of_a_stored_response():
+    create_table()
+
+    async def run():
+        async with session_scope() as db:
+            chatroom = Chatroom(user_id=1)
+            db.add(chatroom)
+            await db.flush()
+            message = Message(
+                user_id=1, chatroom_id=chatroom.id, content="q", response="Hello there", status="completed"
+            )
+            db.add(message)
+            await db.commit()
+        return parse([event async for event in follow_response(message.id, offset=5)])
+
+    assert asyncio.run(run()) == [
+        (None, 11, {"text": " there", "offset": 5}),
+        ("done", 11, {"status": "completed", "offset": 11}),
+    ]
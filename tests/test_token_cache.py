@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+import pytest
+
+from auth import services, token_cache
+from auth.token_cache import TokenCache
+
+
+def test_revoked_token_is_rejected_on_every_pod(fake_redis, monkeypatch):
+    pod_a, pod_b = TokenCache(), TokenCache(ttl=0.2)
+
+    def on(pod: TokenCache):
+        monkeypatch.setattr(services, "token_cache", pod)
+        monkeypatch.setattr(token_cache, "token_cache", pod)
+
+    token = services.create_access_token(data={"sub": "1", "phone": "1"})
+
+    on(pod_b)
+    payload = asyncio.run(services.verify_token(token))
+    assert payload["sub"] == "1"
+
+    on(pod_a)
+    asyncio.run(token_cache.revoke_token(token, payload))
+    with pytest.raises(ValueError):
+        asyncio.run(services.verify_token(token))
+
+    # The other pod trusts its cached verification for at most TOKEN_CACHE_TTL, then sees the revocation in Redis
+    on(pod_b)
+    time.sleep(0.25)
+    with pytest.raises(ValueError):
+        asyncio.run(services.verify_token(token))
+    # A pod that never saw the token rejects it straight away
+    on(TokenCache())
+    with pytest.raises(ValueError):
+        asyncio.run(services.verify_token(token))
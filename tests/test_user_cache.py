@@ -0,0 +1,45 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from auth import user_cache
+from auth.identity import CurrentUser
+from database import cache
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_invalidating_a_user_evicts_it_on_every_pod(fake_redis):
+    user = CurrentUser(id=7, phone="7", is_active=True, created_at=datetime(2024, 1, 1))
+    cache.start_invalidation_listener()
+    # The listener may be backing off after an earlier test disconnected Redis
+    wait_for(lambda: cache._listener.connected, timeout=35)
+    subscriber = cache.get_redis_client().pubsub(ignore_subscribe_messages=True)
+    subscriber.subscribe(cache.CACHE_INVALIDATION_CHANNEL)
+
+    async def run():
+        await user_cache.cache_user(user)
+        assert await user_cache.get_cached_user(7) == user
+        await user_cache.invalidate_user(7)
+
+    asyncio.run(run())
+
+    # Other pods are told to drop it
+    published = []
+    wait_for(lambda: published.extend(filter(None, [subscriber.get_message(timeout=0.1)])) or published)
+    assert any(user_cache.get_cache_key_user(7) in json.loads(message["data"])["keys"] for message in published)
+
+    # ... and this pod drops it when another pod invalidates it
+    asyncio.run(user_cache.cache_user(user))
+    cache.get_redis_client().delete(user_cache.get_cache_key_user(7))
+    cache.get_redis_client().publish(
+        cache.CACHE_INVALIDATION_CHANNEL,
+        json.dumps({"origin": "other-pod", "keys": [user_cache.get_cache_key_user(7)]}),
+    )
+    wait_for(lambda: asyncio.run(user_cache.get_cached_user(7)) is None)
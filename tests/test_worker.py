@@ -0,0 +1,99 @@
+import asyncio
+
+from fakeredis import aioredis
+
+from chatroom import message_queue, worker
+from chatroom.message_queue import MESSAGE_STREAM_GROUP, MESSAGE_STREAM_KEY
+from database.db_connection import create_table
+
+
+async def wait_until(condition, timeout: float = 10.0):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+def test_worker_recreates_a_lost_consumer_group(fake_redis, monkeypatch):
+    create_table()
+    processed = []
+
+    async def process(message_id):
+        processed.append(message_id)
+
+    monkeypatch.setattr(worker, "process_message_async", process)
+    monkeypatch.setattr(worker, "WORKER_BLOCK_MS", 20)
+
+    async def run():
+        client = aioredis.FakeRedis(server=fake_redis, decode_responses=True)
+        consumer = worker.MessageWorker(client, consumer="test", concurrency=2)
+        task = asyncio.create_task(consumer.run())
+        await client.xadd(MESSAGE_STREAM_KEY, {"message_id": 1, "user_id": 1})
+        await wait_until(lambda: processed == [1])
+
+        # e.g. the stream was deleted and a pod recreated it with XADD
+        await client.delete(MESSAGE_STREAM_KEY)
+        await client.xadd(MESSAGE_STREAM_KEY, {"message_id": 2, "user_id": 1})
+        await wait_until(lambda: processed == [1, 2] or task.done())
+        assert not task.done()
+        groups = await client.xinfo_groups(MESSAGE_STREAM_KEY)
+        assert [group["name"] for group in groups] == [MESSAGE_STREAM_GROUP]
+
+        consumer.stop()
+        await task
+
+    asyncio.run(run())
+
+
+def test_backlog_is_zero_without_a_redis_url(monkeypatch):
+    monkeypatch.setenv("REDIS_URL", "")
+    monkeypatch.setattr(message_queue, "_backlog_sample", {"value": 0, "at": 0.0})
+
+    from database import cache
+
+    monkeypatch.setattr(cache, "_clients", {})
+    assert asyncio.run(message_queue.stream_backlog()) == 0
+
+
+async def read_without_ack(client, consumer: str):
+    """Deliver the stream's new entries to ``consumer``, as a worker that then dies would"""
+    return await client.xreadgroup(MESSAGE_STREAM_GROUP, consumer, {MESSAGE_STREAM_KEY: ">"})
+
+
+def test_reclaim_takes_over_entries_of_dead_consumers(fake_redis, monkeypatch):
+    processed, failed = [], []
+
+    async def process(message_id):
+        processed.append(message_id)
+
+    async def mark_failed(message_id):
+        failed.append(message_id)
+
+    monkeypatch.setattr(worker, "process_message_async", process)
+    monkeypatch.setattr(worker, "mark_message_failed", mark_failed)
+    monkeypatch.setattr(worker, "MESSAGE_PROCESSING_TIMEOUT", 0)
+    monkeypatch.setattr(worker, "WORKER_MAX_DELIVERIES", 2)
+
+    async def last_pending(client):
+        pending = await client.xpending_range(MESSAGE_STREAM_KEY, MESSAGE_STREAM_GROUP, "-", "+", 10)
+        return pending[-1]["message_id"]
+
+    async def run():
+        client = aioredis.FakeRedis(server=fake_redis, decode_responses=True)
+        consumer = worker.MessageWorker(client, consumer="alive", concurrency=2)
+        await consumer.ensure_group()
+        await client.xadd(MESSAGE_STREAM_KEY, {"message_id": 1, "user_id": 1})
+        await read_without_ack(client, "dead")
+
+        await consumer.reclaim()
+        await wait_until(lambda: processed == [1] and not consumer._tasks)
+        assert (await client.xpending(MESSAGE_STREAM_KEY, MESSAGE_STREAM_GROUP))["pending"] == 0
+
+        # An entry that keeps getting abandoned is failed and dropped
+        await client.xadd(MESSAGE_STREAM_KEY, {"message_id": 2, "user_id": 1})
+        await read_without_ack(client, "dead")
+        await client.xclaim(MESSAGE_STREAM_KEY, MESSAGE_STREAM_GROUP, "dead", 0, [await last_pending(client)])
+        await consumer.reclaim()
+        assert failed == [2] and processed == [1]
+        assert (await client.xpending(MESSAGE_STREAM_KEY, MESSAGE_STREAM_GROUP))["pending"] == 0
+
+    asyncio.run(run())
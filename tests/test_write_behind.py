@@ -0,0 +1,120 @@
+import asyncio
+
+from sqlalchemy import select
+
+from chatroom.models import Chatroom, Message
+from chatroom.write_behind import MessageInsertBatcher, MessageWriteBehind
+from database.db_connection import create_table, session_scope
+
+
+async def status_of(message_id: int) -> str:
+    async with session_scope() as db:
+        return await db.scalar(select(Message.status).where(Message.id == message_id))
+
+
+def test_write_returns_after_commit_and_cancelled_inserts_are_not_lost():
+    create_table()
+
+    async def run():
+        async with session_scope() as db:
+            chatroom = Chatroom(user_id=1)
+            db.add(chatroom)
+            await db.commit()
+            chatroom_id = chatroom.id
+
+        orphans = []
+
+        async def orphaned(message):
+            orphans.append(message.id)
+
+        batcher = MessageInsertBatcher(window_ms=20)
+        row = {"user_id": 1, "chatroom_id": chatroom_id, "content": "q", "status": "pending"}
+
+        # Cancelled before the batch is sent: never inserted
+        early = asyncio.create_task(batcher.insert(orphaned=orphaned, **row))
+        await asyncio.sleep(0)
+        early.cancel()
+        kept = await batcher.insert(orphaned=orphaned, **row)
+        async with session_scope() as db:
+            assert (await db.scalars(select(Message.id).where(Message.chatroom_id == chatroom_id))).all() == [kept.id]
+
+        # Cancelled while the batch is being inserted: handed to ``orphaned``
+        late = asyncio.create_task(batcher.insert(orphaned=orphaned, **row))
+        await asyncio.sleep(0)
+        while batcher._pending:
+            await asyncio.sleep(0.001)
+        late.cancel()
+        await asyncio.sleep(0.1)
+        assert len(orphans) == 1 and orphans[0] != kept.id
+
+        write_behind = MessageWriteBehind(interval_ms=20)
+        await write_behind.write(kept.id, status="completed")
+        assert await status_of(kept.id) == "completed"
+        await write_behind.stop()
+
+    asyncio.run(run())
+
+
+def test_failing_row_is_dropped_without_holding_back_the_batch():
+    create_table()
+
+    async def run():
+        async with session_scope() as db:
+            chatroom = Chatroom(user_id=1)
+            db.add(chatroom)
+            await db.flush()
+            message = Message(user_id=1, chatroom_id=chatroom.id, content="q", status="pending")
+            db.add(message)
+            await db.commit()
+            message_id = message.id
+
+        write_behind = MessageWriteBehind(interval_ms=10, max_attempts=3)
+        good = asyncio.create_task(write_behind.write(message_id, status="completed"))
+        missing = asyncio.create_task(write_behind.write(999999, status="completed"))
+
+        await asyncio.wait_for(good, timeout=5)
+        assert await status_of(message_id) == "completed"
+        try:
+            await asyncio.wait_for(missing, timeout=5)
+        except asyncio.TimeoutError:
+            raise AssertionError("waiter for the missing message was never resolved")
+        except Exception:
+            pass
+        else:
+            raise AssertionError("write for a missing message succeeded")
+        assert not write_behind._pending and not write_behind._waiters
+        await write_behind.stop()
+
+    asyncio.run(run())
+
+
+def test_stop_does_not_lose_the_batch_being_flushed():
+    create_table()
+
+    async def run():
+        async with session_scope() as db:
+            chatroom = Chatroom(user_id=1)
+            db.add(chatroom)
+            await db.flush()
+            message = Message(user_id=1, chatroom_id=chatroom.id, content="q", status="pending")
+            db.add(message)
+            await db.commit()
+            message_id = message.id
+
+        write_behind = MessageWriteBehind(interval_ms=10)
+        started = asyncio.Event()
+        write = write_behind._write
+
+        async def slow_write(rows):
+            started.set()
+            await asyncio.sleep(0.05)
+            await write(rows)
+
+        write_behind._write = slow_write
+        waiter = asyncio.create_task(write_behind.write(message_id, status="completed"))
+        await started.wait()
+        await write_behind.stop()
+        await asyncio.wait_for(waiter, timeout=1)
+        assert await status_of(message_id) == "completed"
+
+    asyncio.run(run())